@@ -7,7 +7,7 @@ from localflavor.us.models import USStateField, USZipCodeField
 from phonenumber_field.modelfields import PhoneNumberField
 
 from packman.calendars.models import PackYear
-from packman.committees.models import Committee
+from packman.committees.models import Committee, CommitteeMember
 from packman.core.models import TimeStampedUUIDModel
 from packman.dens.models import Den
 from packman.membership.models import Adult, Family
@@ -215,21 +215,13 @@ class DistributionList(TimeStampedUUIDModel):
 
     def get_members(self):
         if self.is_all:
-            return Adult.objects.filter(family__in=Family.objects.active())
-        else:
-            return Adult.objects.filter(
-                Q(
-                    family__in=Family.objects.active().filter(
-                        children__den_memberships__den__in=self.dens.all(),
-                        children__den_memberships__year_assigned=PackYear.objects.current(),
-                    )
-                )
-                | Q(
-                    family__in=Family.objects.active(),
-                    committee_memberships__committee__in=self.committees.all(),
-                    committee_memberships__year_served=PackYear.objects.current(),
-                )
-            ).distinct()
+            return Adult.objects.active()
+        committee_members = CommitteeMember.objects.filter(
+            year=PackYear.objects.current(), committee__in=self.committees.all()
+        ).values("member")
+        return Adult.objects.active().filter(
+            Q(pk__in=committee_members) | Q(family__in=Family.objects.in_den(self.dens.all()))
+        )
 
     @cached_property
     def email_addresses(self):
@@ -6,9 +6,9 @@ class CommitteePermissionsBackend(ModelBackend):
     def _get_group_permissions(self, user_obj):
         """
         Return a set of permission strings for the user `user_obj` based
-        on the committees they belong to.
+        on the committees they belong to, as their membership status has them.
         """
-        recent_committees = user_obj.committee_set.recent()
-        if recent_committees.filter(are_superusers=True):
+        status = user_obj.membership_status
+        if status.superuser:
             return Permission.objects.all()
-        return Permission.objects.filter(committee__in=recent_committees)
+        return Permission.objects.filter(committee__in=status.committees)
@@ -5,3 +5,6 @@ from django.utils.translation import gettext_lazy as _
 class CoreConfig(AppConfig):
     name = "packman.core"
     verbose_name = _("Core")
+
+    def ready(self):
+        from . import checks  # noqa: F401
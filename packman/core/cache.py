@@ -0,0 +1,17 @@
+from django.core.cache import DEFAULT_CACHE_ALIAS, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+
+# Backends whose entries live in the process that cached them, out of reach of
+# invalidation from any other
+PROCESS_LOCAL_BACKENDS = (DummyCache, LocMemCache)
+
+
+def cache_is_shared(alias=DEFAULT_CACHE_ALIAS):
+    """
+    Whether the cache is shared between processes, so that a change made in
+    one, such as a web request, invalidates what another, such as the mail
+    worker, has cached. Whatever is cached until invalidated rather than
+    briefly must not be cached otherwise.
+    """
+    return not isinstance(caches[alias], PROCESS_LOCAL_BACKENDS)
@@ -0,0 +1,16 @@
+from django.core import checks
+
+from .cache import cache_is_shared
+
+
+@checks.register(checks.Tags.caches, deploy=True)
+def check_cache_is_shared(app_configs, **kwargs):
+    if cache_is_shared():
+        return []
+    return [
+        checks.Warning(
+            "The default cache is local to each process, so distribution list members aren't cached.",
+            hint="Set CACHE_URL to a cache shared by the web and mail worker processes, such as Redis or Memcached.",
+            id="core.W001",
+        )
+    ]
@@ -0,0 +1,12 @@
+from django.db.models import Lookup
+
+
+class Match(Lookup):
+    """A full-text MATCH against an FTS5 column."""
+
+    lookup_name = "match"
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f"{lhs} MATCH {rhs}", (*lhs_params, *rhs_params)
@@ -2,11 +2,17 @@ from urllib.parse import quote
 
 from django.contrib import admin, messages
 from django.contrib.auth import get_permission_codename
-from django.urls import reverse
-from django.utils.html import format_html
+from django.core.exceptions import PermissionDenied
+from django.http import HttpResponseRedirect, JsonResponse
+from django.shortcuts import get_object_or_404
+from django.template.defaultfilters import filesizeformat
+from django.template.response import TemplateResponse
+from django.urls import path, reverse
+from django.utils.html import format_html, format_html_join
 from django.utils.translation import gettext as _
+from django.utils.translation import ngettext
 
-from .forms import MessageDistributionForm, MessageForm, MessageRecipientForm
+from .forms import AttachmentAdminForm, MessageDistributionForm, MessageForm, MessageRecipientForm
 from .models import (
     Attachment,
     DistributionList,
@@ -15,12 +21,27 @@ from .models import (
     Message,
     MessageDistribution,
     MessageRecipient,
+    SuppressedAddress,
+    Thread,
 )
 
 
 class AttachmentInline(admin.TabularInline):
     model = Attachment
     extra = 0
+    form = AttachmentAdminForm
+    readonly_fields = ("get_size", "get_content_type")
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related("blob")
+
+    @admin.display(description=_("size"))
+    def get_size(self, obj):
+        return filesizeformat(obj.blob.size) if obj.blob_id else ""
+
+    @admin.display(description=_("content type"))
+    def get_content_type(self, obj):
+        return obj.blob.content_type if obj.blob_id else ""
 
 
 class EmailAddressInline(admin.TabularInline):
@@ -52,10 +73,25 @@ class DistributionListAdmin(admin.ModelAdmin):
     ]
     filter_horizontal = ("committees", "dens")
     inlines = [EmailAddressInline]
-    list_display = ("name", "get_email_addresses", "get_selections", "is_all")
+    list_display = ("name", "get_email_addresses", "get_selections", "get_member_count", "is_all")
     list_filter = ("is_all", "dens", "committees")
     search_fields = ("name", "addresses__address", "committees__name", "dens__number")
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related("addresses", "dens", "committees")
+
+    def get_changelist_instance(self, request):
+        changelist = super().get_changelist_instance(request)
+        # Resolve the members of every list on the page at once, mostly from the cache.
+        members = changelist.result_list.resolve_members()
+        for distribution_list in changelist.result_list:
+            distribution_list.member_ids = members[distribution_list.pk]
+        return changelist
+
+    @admin.display(description=_("members"))
+    def get_member_count(self, obj):
+        return len(obj.member_ids)
+
     @admin.display(description=_("selections"))
     def get_selections(self, obj):
         den_list = ", ".join(str(d) for d in obj.dens.all())
@@ -74,11 +110,13 @@ class DistributionListAdmin(admin.ModelAdmin):
 
 @admin.register(Message)
 class MessageAdmin(admin.ModelAdmin):
+    actions = ["refresh_thread_summaries"]
     change_form_template = "admin/message_change_form.html"
     date_hierarchy = "last_updated"
     fieldsets = [
         (None, {"fields": ("author", "subject", "body")}),
         (_("Metadata"), {"fields": (("last_updated", "date_sent"), ("thread", "parent")), "classes": ("collapse",)}),
+        (_("Delivery"), {"fields": ("get_delivery_metrics",), "classes": ("collapse",)}),
     ]
     form = MessageForm
     list_display = ("author", "subject", "last_updated", "sent")
@@ -86,12 +124,75 @@ class MessageAdmin(admin.ModelAdmin):
     list_filter = ("distribution_lists",)
     inlines = (MessageDistributionInline, MessageRecipientInline, AttachmentInline)
     search_fields = ("subject", "body")
-    readonly_fields = ("author", "thread", "date_sent", "last_updated", "parent")
+    readonly_fields = ("author", "thread", "date_sent", "last_updated", "parent", "get_delivery_metrics")
+    metric_labels = {
+        "expanded": _("Members reached through lists"),
+        "expand_time": _("Expanding lists (s)"),
+        "attachment_time": _("Reading attachments (s)"),
+        "copies": _("Copies rendered"),
+        "render_time": _("Rendering (s)"),
+        "render_time_per_copy": _("Rendering per copy (s)"),
+        "bytes": _("Bytes generated"),
+        "connections": _("SMTP connections"),
+        "connect_time": _("Connecting (s)"),
+        "connection_failures": _("Failed connections"),
+        "chunks": _("Chunks"),
+        "chunk_time_mean": _("Chunk latency, mean (s)"),
+        "chunk_time_p95": _("Chunk latency, 95th percentile (s)"),
+        "chunk_time_max": _("Chunk latency, max (s)"),
+        "chunk_failures": _("Failed deliveries"),
+        "sent": _("Sent"),
+        "deferred": _("Deferred"),
+        "failed": _("Failed"),
+        "throttled": _("Throttled (s)"),
+        "elapsed": _("Delivery (s)"),
+        "throughput": _("Emails per second"),
+    }
 
     def save_model(self, request, obj, form, change):
         obj.author = request.user
         super().save_model(request, obj, form, change)
 
+    @admin.display(description=_("metrics of the last send"))
+    def get_delivery_metrics(self, obj):
+        if not obj.delivery_metrics:
+            return "-"
+        return format_html(
+            "<table>{}</table>",
+            format_html_join(
+                "",
+                "<tr><th>{}</th><td>{}</td></tr>",
+                ((self.metric_labels.get(key, key), value) for key, value in obj.delivery_metrics.items()),
+            ),
+        )
+
+    @admin.action(
+        description=_("Recount the threads of selected messages"),
+        permissions=("change",),
+    )
+    def refresh_thread_summaries(self, request, queryset):
+        # Sending keeps thread summaries current as it goes; this rebuilds
+        # them from scratch should they ever drift.
+        threads = Thread.objects.filter(pk__in=queryset.values("thread"))
+        count = threads.count()
+        threads.refresh_summaries()
+        self.message_user(
+            request,
+            ngettext(
+                "%d thread was successfully recounted.",
+                "%d threads were successfully recounted.",
+                count,
+            )
+            % count,
+            messages.SUCCESS,
+        )
+
+    def get_search_results(self, request, queryset, search_term):
+        # Use the full-text index rather than scanning every subject and body
+        if not search_term:
+            return queryset, False
+        return queryset.search(search_term), False
+
     def response_add(self, request, obj, post_url_continue=None):
         # Add a "Send" button to the message add page
         opts = obj._meta
@@ -111,10 +212,7 @@ class MessageAdmin(admin.ModelAdmin):
         }
 
         if "_send" in request.POST:
-            obj.send()
-            msg = format_html(_("The {name} “{obj}” was sent successfully."), **msg_dict)
-            self.message_user(request, msg, messages.SUCCESS)
-            return self.response_post_save_add(request, obj)
+            return self.response_send(request, obj, msg_dict)
 
         return super().response_add(request, obj, post_url_continue)
 
@@ -126,23 +224,78 @@ class MessageAdmin(admin.ModelAdmin):
             "obj": format_html('<a href="{}">{}</a>', quote(request.path), obj),
         }
         if "_send" in request.POST:
-            obj.send()
-            msg = format_html(_("The {name} “{obj}” was sent successfully."), **msg_dict)
-            self.message_user(request, msg, messages.SUCCESS)
-            return self.response_post_save_change(request, obj)
+            return self.response_send(request, obj, msg_dict)
 
         return super().response_change(request, obj)
 
+    def response_send(self, request, obj, msg_dict):
+        # Sending to a large list takes far longer than a request should, so
+        # leave it to the mail worker and follow along on the progress page.
+        obj.queue()
+        msg = format_html(_("The {name} “{obj}” was queued for sending."), **msg_dict)
+        self.message_user(request, msg, messages.SUCCESS)
+        opts = self.opts
+        return HttpResponseRedirect(
+            reverse(
+                f"admin:{opts.app_label}_{opts.model_name}_progress",
+                args=(obj.pk,),
+                current_app=self.admin_site.name,
+            )
+        )
+
+    def get_urls(self):
+        opts = self.opts
+        urls = [
+            path(
+                "<path:object_id>/progress/",
+                self.admin_site.admin_view(self.progress_view),
+                name=f"{opts.app_label}_{opts.model_name}_progress",
+            ),
+            path(
+                "<path:object_id>/progress/status/",
+                self.admin_site.admin_view(self.progress_status_view),
+                name=f"{opts.app_label}_{opts.model_name}_progress_status",
+            ),
+        ]
+        return urls + super().get_urls()
+
+    def get_progress_object(self, request, object_id):
+        obj = get_object_or_404(self.model, pk=object_id)
+        if not self.has_view_permission(request, obj):
+            raise PermissionDenied
+        return obj
+
+    def progress_view(self, request, object_id):
+        obj = self.get_progress_object(request, object_id)
+        opts = self.opts
+        context = {
+            **self.admin_site.each_context(request),
+            "title": _("Sending “%s”") % obj,
+            "opts": opts,
+            "original": obj,
+            "progress": obj.get_delivery_progress(),
+            "status_url": reverse(
+                f"admin:{opts.app_label}_{opts.model_name}_progress_status",
+                args=(obj.pk,),
+                current_app=self.admin_site.name,
+            ),
+        }
+        return TemplateResponse(request, "admin/mail/message/progress.html", context)
+
+    def progress_status_view(self, request, object_id):
+        obj = self.get_progress_object(request, object_id)
+        return JsonResponse(obj.get_delivery_progress())
+
     def has_change_permission(self, request, obj=None):
         #  Start with Django's default has_change_permission() method.
         opts = self.opts
         codename = get_permission_codename("change", opts)
 
         # Pause to determine whether the user is either the author or if
-        # the Message has been sent.
+        # the Message has been sent or is on its way.
         if obj and obj.author != request.user:
             return False
-        if obj and obj.date_sent:
+        if obj and (obj.date_sent or obj.status in (Message.Status.QUEUED, Message.Status.SENDING)):
             return False
 
         # Do the thing that Django does after checking our special case.
@@ -180,6 +333,14 @@ class MessageAdmin(admin.ModelAdmin):
         return request.user.has_perm(f"{opts.app_label}.{codename}")
 
 
+@admin.register(SuppressedAddress)
+class SuppressedAddressAdmin(admin.ModelAdmin):
+    list_display = ("address", "reason", "bounces", "last_updated")
+    list_filter = ("reason",)
+    readonly_fields = ("bounces", "date_added", "last_updated")
+    search_fields = ("address",)
+
+
 @admin.register(ListSettings)
 class ListSettingsAdmin(admin.ModelAdmin):
     list_display = ("list_id", "name", "subject_prefix", "from_name", "from_email")
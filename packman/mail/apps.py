@@ -6,3 +6,6 @@ class MailConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "packman.mail"
     verbose_name = _("Mail")
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,186 @@
+import socketserver
+import threading
+import time
+import tracemalloc
+
+from django.contrib.auth import get_user_model
+from django.utils.translation import gettext as _
+
+import factory
+
+from packman.calendars.models import PackYear
+from packman.dens.factories import DenFactory, MembershipFactory
+from packman.membership.factories import AdultFactory, FamilyFactory, ScoutFactory
+
+from .delivery import DeliveryPipeline, RateLimiter
+from .models import DistributionList, Message, MessageDistribution, MessageRecipient
+
+User = get_user_model()
+
+
+class SMTPSinkHandler(socketserver.StreamRequestHandler):
+    """Speak just enough SMTP to accept every message, then count and discard it."""
+
+    def reply(self, line):
+        self.wfile.write(line.encode() + b"\r\n")
+
+    def handle(self):
+        self.reply("220 localhost ESMTP sink")
+        for line in self.rfile:
+            command = line[:4].upper()
+            if command == b"EHLO":
+                self.reply("250-localhost")
+                self.reply("250 8BITMIME")
+            elif command == b"DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                size = 0
+                for data in self.rfile:
+                    if data == b".\r\n":
+                        break
+                    size += len(data)
+                self.server.receive(size)
+                self.reply("250 2.0.0 Ok: queued")
+            elif command == b"QUIT":
+                self.reply("221 2.0.0 Bye")
+                break
+            else:
+                # HELO, MAIL, RCPT, RSET and NOOP are all accepted as they are
+                self.reply("250 2.0.0 Ok")
+
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    """
+    An in-process SMTP server that accepts and discards every message, so
+    delivery can be measured without a real mail server. Serves from a
+    background thread while used as a context manager.
+    """
+
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, host="127.0.0.1", port=0):
+        super().__init__((host, port), SMTPSinkHandler)
+        self.messages = 0
+        self.bytes = 0
+        self.lock = threading.Lock()
+
+    def __enter__(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
+        super().__exit__(*args)
+
+    def receive(self, size):
+        with self.lock:
+            self.messages += 1
+            self.bytes += size
+
+    def get_email_settings(self):
+        """Settings that point Django's SMTP backend at the sink."""
+        host, port = self.server_address[:2]
+        return {
+            "EMAIL_BACKEND": "django.core.mail.backends.smtp.EmailBackend",
+            "EMAIL_HOST": host,
+            "EMAIL_PORT": port,
+            "EMAIL_HOST_USER": "",
+            "EMAIL_HOST_PASSWORD": "",
+            "EMAIL_USE_TLS": False,
+            "EMAIL_USE_SSL": False,
+        }
+
+
+def build_pack(adults, dens=10):
+    """
+    Add active families to the pack until it has `adults` active adults: two
+    parents to a family, each family with a scout in one of the first `dens`
+    dens this year. Returns an all-members distribution list.
+    """
+    year = PackYear.objects.current()
+    dens = [DenFactory(number=number) for number in range(1, dens + 1)]
+    missing = adults - User.objects.active().count()
+    for i in range(0, missing, 2):
+        family = FamilyFactory()
+        MembershipFactory(scout=ScoutFactory(family=family), den=dens[i // 2 % len(dens)], year_assigned=year)
+        # no password, hashing one is far slower than anything being measured
+        AdultFactory.create_batch(
+            min(2, missing - i),
+            family=family,
+            password=None,
+            email=factory.Sequence(lambda n: f"member{n}@benchmark.example.com"),
+        )
+    distribution_list, created = DistributionList.objects.get_or_create(name=_("Benchmark"), defaults={"is_all": True})
+    return distribution_list
+
+
+class PhaseResult:
+    def __init__(self, phase, messages, elapsed, peak_memory):
+        self.phase = phase
+        self.messages = messages
+        self.elapsed = elapsed
+        self.peak_memory = peak_memory
+
+    @property
+    def rate(self):
+        """Messages per second."""
+        return self.messages / self.elapsed if self.elapsed else 0
+
+
+class Benchmark:
+    """
+    Time expanding, personalizing and delivering a message to every member of
+    a distribution list. Tracing allocations slows everything down, so each
+    phase is run once against the clock and again under tracemalloc for its
+    peak memory.
+
+    Delivery is unthrottled; point the SMTP backend at an SMTPSink to measure
+    packman.mail rather than a mail server.
+    """
+
+    phases = ("expansion", "personalization", "delivery")
+
+    def __init__(self, distribution_list, author, concurrency=None, chunk_size=None):
+        self.message = Message.objects.create(author=author, subject="Benchmark", body="<p>Benchmark</p>")
+        MessageDistribution.objects.create(message=self.message, distribution_list=distribution_list)
+        self.concurrency = concurrency
+        self.chunk_size = chunk_size
+
+    def run(self):
+        results = []
+        for phase in self.phases:
+            start = time.perf_counter()
+            getattr(self, phase)()
+            elapsed = time.perf_counter() - start
+
+            getattr(self, f"reset_{phase}")()
+            tracemalloc.start()
+            try:
+                getattr(self, phase)()
+                peak_memory = tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+
+            results.append(PhaseResult(phase, self.message.message_recipients.count(), elapsed, peak_memory))
+        return results
+
+    def expansion(self):
+        self.message.expand_distribution_lists()
+
+    def reset_expansion(self):
+        self.message.message_recipients.all().delete()
+
+    def personalization(self):
+        receipts = self.message.message_recipients.select_related("recipient").iterator()
+        for recipient_pk, email in self.message._personalize_messages(receipts):
+            pass
+
+    def reset_personalization(self):
+        pass
+
+    def delivery(self):
+        limiter = RateLimiter(rate=0, domain_rates={})
+        DeliveryPipeline(self.message, self.chunk_size, self.concurrency, retry_delay=0, limiter=limiter).run()
+
+    def reset_delivery(self):
+        self.message.message_recipients.update(status=MessageRecipient.Status.PENDING, attempts=0)
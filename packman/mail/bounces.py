@@ -0,0 +1,114 @@
+import logging
+import re
+from email.parser import HeaderParser
+from email.utils import getaddresses
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.utils.translation import gettext as _
+
+from .inbound import LineReader, MessageParser, RejectedMessage
+from .models import SuppressedAddress
+from .utils import parse_return_path
+
+logger = logging.getLogger(__name__)
+
+User = get_user_model()
+
+STATUS_CODE = re.compile(r"\b([245]\.\d{1,3}\.\d{1,3})\b")
+
+
+def parse_delivery_status(report):
+    """
+    Return an (address, status, diagnostic) triple for each recipient that
+    failed or was delayed in a message/delivery-status report (RFC 3464).
+    """
+    # per-message fields come first, then a block of fields per recipient
+    for block in re.split(r"\r?\n[ \t]*\r?\n", report.strip())[1:]:
+        fields = HeaderParser().parsestr(block)
+        action = str(fields.get("action", "")).strip().lower()
+        if action not in ("failed", "delayed"):
+            continue
+        address = str(fields.get("final-recipient") or fields.get("original-recipient") or "").partition(";")[2]
+        status = STATUS_CODE.search(str(fields.get("status", "")))
+        yield (
+            address.strip(),
+            status[1] if status else ("5.0.0" if action == "failed" else "4.0.0"),
+            " ".join(str(fields.get("diagnostic-code", "")).split()),
+        )
+
+
+class Bounce:
+    """
+    A bounce reported for one of our messages: the recipient's address, the
+    enhanced status code, and the mail server's explanation.
+    """
+
+    def __init__(self, address, status, diagnostic=""):
+        self.address = address
+        self.status = status
+        self.diagnostic = diagnostic
+
+    @property
+    def is_permanent(self):
+        return self.status.startswith("5")
+
+
+def parse_bounce(fp, recipients=None):
+    """
+    Read a bounce from the binary file `fp`, streaming past anything that is
+    not a delivery report. The recipient is found from the VERP return path
+    the bounce was sent to, in `recipients` or the message's headers, or else
+    from the report as long as it names a member's address.
+
+    Raises RejectedMessage if the message is not a bounce for a member.
+    """
+    reports = []
+
+    def store(file):
+        if file.content_type == "message/delivery-status":
+            reports.append(file.read().decode("utf-8", "replace"))
+
+    parser = MessageParser(LineReader(fp, settings.MAIL_INBOUND_MAX_SIZE), store)
+    headers = parser.read_headers()
+    parser.parse(headers)
+
+    failures = [failure for report in reports for failure in parse_delivery_status(report)]
+    if not failures:
+        # no report, so fall back to the first status code given in the text
+        status = STATUS_CODE.search(parser.text.get("text/plain", ""))
+        if not status or status[1].startswith("2"):
+            raise RejectedMessage(_("Not a bounce"))
+        failures = [("", status[1], "")]
+    address, status, diagnostic = failures[0]
+
+    if recipients is None:
+        fields = [
+            str(value) for name in ("delivered-to", "x-original-to", "to") for value in headers.get_all(name, [])
+        ]
+        recipients = [address for name, address in getaddresses(fields)]
+    pks = [pk for pk in map(parse_return_path, recipients) if pk]
+    if pks:
+        member = User.objects.filter(pk=pks[0]).first()
+    else:
+        member = User.objects.filter(email__iexact=address).first() if address else None
+    if not member:
+        raise RejectedMessage(_("Not a bounce for a member"))
+    return Bounce(member.email, status, diagnostic)
+
+
+def process_bounce(fp, recipients=None):
+    """
+    Read a bounce from the binary file `fp` and suppress the address if it
+    bounced permanently. Temporary failures are only logged; the mail server
+    retries those itself.
+    """
+    bounce = parse_bounce(fp, recipients)
+    if bounce.is_permanent:
+        logger.info(_("Suppressing %(address)s: %(status)s") % {"address": bounce.address, "status": bounce.status})
+        SuppressedAddress.objects.record_bounce(bounce.address, bounce.diagnostic)
+    else:
+        logger.info(
+            _("Temporary failure for %(address)s: %(status)s") % {"address": bounce.address, "status": bounce.status}
+        )
+    return bounce
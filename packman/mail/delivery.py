@@ -0,0 +1,388 @@
+import logging
+import smtplib
+import statistics
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from itertools import islice
+
+from django.conf import settings
+from django.core import mail
+from django.db.models import F
+from django.dispatch import Signal
+from django.utils import timezone
+from django.utils.translation import gettext as _
+
+logger = logging.getLogger(__name__)
+
+# Sent once a Message has been through the delivery pipeline, with the run's
+# metrics (see DeliveryMetrics) as `metrics`. Connect a receiver to feed them to
+# a monitoring system and graph delivery over time.
+message_delivered = Signal()
+
+
+def chunked(iterable, size):
+    """Yield successive lists of up to `size` items from `iterable`."""
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def is_transient(error):
+    """
+    Decide whether a delivery error is worth retrying. Temporary (4xx) SMTP
+    replies and network trouble are transient; anything else, including
+    permanent (5xx) rejections, is not.
+    """
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(400 <= code < 500 for code, response in error.recipients.values())
+    if isinstance(error, smtplib.SMTPResponseException):
+        return 400 <= error.smtp_code < 500
+    return isinstance(error, (smtplib.SMTPServerDisconnected, OSError))
+
+
+class TokenBucket:
+    """
+    Allow an average of `rate` operations per second with bursts of up to
+    `capacity`. Safe to share between threads; callers block in acquire()
+    until a token is available.
+    """
+
+    def __init__(self, rate, capacity=1, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.capacity = max(capacity, 1)
+        self.tokens = self.capacity
+        self.clock = clock
+        self.sleep = sleep
+        self.updated = clock()
+        self.lock = threading.Lock()
+
+    def reserve(self):
+        """Take a token, returning how many seconds to wait before using it."""
+        with self.lock:
+            now = self.clock()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            # A negative balance is the backlog of callers already waiting.
+            return -self.tokens / self.rate if self.tokens < 0 else 0
+
+    def acquire(self):
+        delay = self.reserve()
+        if delay:
+            self.sleep(delay)
+        return delay
+
+
+class RateLimiter:
+    """
+    Pace deliveries through a global token bucket and, for domains with a rate
+    of their own, a bucket per recipient domain. A rate of 0 is unlimited.
+    """
+
+    def __init__(self, rate=None, burst=None, domain_rates=None, **kwargs):
+        rate = settings.MAIL_DELIVERY_RATE if rate is None else rate
+        burst = burst or settings.MAIL_DELIVERY_BURST
+        domain_rates = settings.MAIL_DELIVERY_DOMAIN_RATES if domain_rates is None else domain_rates
+        self.bucket = TokenBucket(rate, burst, **kwargs) if rate else None
+        self.domain_buckets = {
+            domain.lower(): TokenBucket(domain_rate, burst, **kwargs)
+            for domain, domain_rate in domain_rates.items()
+            if domain_rate
+        }
+        self.waited = 0
+        self.lock = threading.Lock()
+
+    def __bool__(self):
+        return bool(self.bucket or self.domain_buckets)
+
+    def wait(self, address):
+        """Block until an email to `address` may be sent, returning how long that took."""
+        domain = address.rpartition("@")[2].rstrip(">").lower()
+        waited = 0
+        for bucket in (self.domain_buckets.get(domain), self.bucket):
+            if bucket:
+                waited += bucket.acquire()
+        if waited:
+            with self.lock:
+                self.waited += waited
+        return waited
+
+
+class DeliveryMetrics:
+    """
+    Counts and timings for one run of a message through delivery, collected
+    from each phase: expanding the lists, reading attachments, rendering each
+    copy, and the SMTP connections and chunks. Safe to share between the
+    pipeline's workers.
+    """
+
+    def __init__(self):
+        self.expanded = 0
+        self.expand_time = 0
+        self.attachment_time = 0
+        self.copies = 0
+        self.render_time = 0
+        self.bytes = 0
+        self.connections = 0
+        self.connect_time = 0
+        self.connection_failures = 0
+        self.chunk_times = []
+        self.chunk_failures = 0
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def timer(self, name):
+        """Add the time spent in the block to the named timing."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def add(self, name, value):
+        with self.lock:
+            setattr(self, name, getattr(self, name) + value)
+
+    def record_copy(self, seconds, size):
+        with self.lock:
+            self.copies += 1
+            self.render_time += seconds
+            self.bytes += size
+
+    def record_connection(self, seconds):
+        with self.lock:
+            self.connections += 1
+            self.connect_time += seconds
+
+    def record_chunk(self, seconds, failures):
+        with self.lock:
+            self.chunk_times.append(seconds)
+            self.chunk_failures += failures
+
+    def as_dict(self):
+        """A JSON serializable summary, in seconds and bytes."""
+        chunk_times = sorted(self.chunk_times)
+        return {
+            "expanded": self.expanded,
+            "expand_time": round(self.expand_time, 4),
+            "attachment_time": round(self.attachment_time, 4),
+            "copies": self.copies,
+            "render_time": round(self.render_time, 4),
+            "render_time_per_copy": round(self.render_time / self.copies, 6) if self.copies else 0,
+            "bytes": self.bytes,
+            "connections": self.connections,
+            "connect_time": round(self.connect_time, 4),
+            "connection_failures": self.connection_failures,
+            "chunks": len(chunk_times),
+            "chunk_time_mean": round(statistics.fmean(chunk_times), 4) if chunk_times else 0,
+            "chunk_time_p95": round(chunk_times[int(0.95 * (len(chunk_times) - 1))], 4) if chunk_times else 0,
+            "chunk_time_max": round(chunk_times[-1], 4) if chunk_times else 0,
+            "chunk_failures": self.chunk_failures,
+        }
+
+
+def deliver_chunk(chunk, limiter=None, metrics=None):
+    """
+    Send a chunk of (recipient pk, email) pairs over a single connection to the
+    mail server, returning a list of (recipient pk, error) outcomes where error
+    is None for a successful delivery. A RateLimiter, when given, paces each
+    email, and DeliveryMetrics, when given, records the connection and chunk
+    timings.
+    """
+    outcomes = []
+    start = time.perf_counter()
+    waited = 0
+    try:
+        with mail.get_connection() as connection:
+            if metrics:
+                metrics.record_connection(time.perf_counter() - start)
+            start = time.perf_counter()
+            for recipient_pk, email in chunk:
+                if limiter:
+                    waited += limiter.wait(email.to[0])
+                try:
+                    connection.send_messages([email])
+                except Exception as e:
+                    logger.warning(
+                        _("Unable to deliver to %(recipient)s: %(error)s") % {"recipient": email.to, "error": e}
+                    )
+                    outcomes.append((recipient_pk, e))
+                else:
+                    outcomes.append((recipient_pk, None))
+    except Exception as e:
+        # The connection itself failed, taking any unattempted deliveries with it.
+        logger.warning(_("Unable to connect to the mail server: %s") % e)
+        attempted = {recipient_pk for recipient_pk, error in outcomes}
+        outcomes.extend((recipient_pk, e) for recipient_pk, email in chunk if recipient_pk not in attempted)
+        if metrics:
+            metrics.add("connection_failures", 1)
+    if metrics:
+        # time spent held back by the rate limiter isn't the mail server's
+        failures = sum(error is not None for recipient_pk, error in outcomes)
+        metrics.record_chunk(time.perf_counter() - start - waited, failures)
+    return outcomes
+
+
+class DeliveryPipeline:
+    """
+    Stream personalized copies of a message to the mail server.
+
+    Copies are generated lazily and grouped into chunks, each chunk being
+    delivered over its own connection by a bounded pool of workers. At most
+    `concurrency` chunks are in flight at any time, so memory use stays flat
+    regardless of the number of recipients. Delivery outcomes are recorded
+    against each MessageRecipient as chunks complete.
+
+    Only recipients who are still pending or deferred are picked up, so an
+    interrupted send can simply be run again. Transient failures defer the
+    recipient and are retried with exponential back-off until they succeed or
+    run out of attempts.
+
+    Sending is paced by a RateLimiter shared by all of the pipeline's workers, so a large send
+    goes out as fast as the mail server allows without being throttled. Each phase is timed in
+    the pipeline's DeliveryMetrics.
+    """
+
+    def __init__(
+        self,
+        message,
+        chunk_size=None,
+        concurrency=None,
+        max_attempts=None,
+        retry_delay=None,
+        limiter=None,
+        metrics=None,
+    ):
+        self.message = message
+        self.chunk_size = chunk_size or settings.MAIL_DELIVERY_CHUNK_SIZE
+        self.concurrency = concurrency or settings.MAIL_DELIVERY_CONCURRENCY
+        self.max_attempts = max_attempts or settings.MAIL_DELIVERY_MAX_ATTEMPTS
+        self.retry_delay = settings.MAIL_DELIVERY_RETRY_DELAY if retry_delay is None else retry_delay
+        self.limiter = RateLimiter() if limiter is None else limiter
+        self.metrics = DeliveryMetrics() if metrics is None else metrics
+        self.sent = 0
+        self.deferred = 0
+        self.failed = 0
+        self.elapsed = 0
+
+    def get_recipients(self):
+        MessageRecipient = self.message.message_recipients.model
+        return (
+            self.message.message_recipients.filter(
+                status__in=(MessageRecipient.Status.PENDING, MessageRecipient.Status.DEFERRED),
+                attempts__lt=self.max_attempts,
+            )
+            .select_related("recipient")
+            .order_by("pk")
+            .iterator(chunk_size=self.chunk_size)
+        )
+
+    def run(self):
+        start = time.perf_counter()
+        for attempt in range(self.max_attempts):
+            if attempt:
+                delay = self.retry_delay * 2 ** (attempt - 1)
+                logger.info(
+                    _("Retrying %(deferred)d deferred emails in %(delay)ds")
+                    % {"deferred": self.deferred, "delay": delay}
+                )
+                self.wait(delay)
+
+            self.deferred = 0
+            self.deliver(self.get_recipients())
+            if not self.deferred:
+                break
+
+        # Recipients who have used up their attempts will not be retried again,
+        # so they are counted as failed rather than deferred.
+        MessageRecipient = self.message.message_recipients.model
+        exhausted = self.message.message_recipients.filter(
+            status=MessageRecipient.Status.DEFERRED, attempts__gte=self.max_attempts
+        ).update(status=MessageRecipient.Status.FAILED)
+        self.failed += exhausted
+        self.deferred = max(self.deferred - exhausted, 0)
+
+        self.elapsed = time.perf_counter() - start
+        return self
+
+    def wait(self, delay):
+        """
+        Sleep for `delay` seconds before a retry, sending heartbeats often
+        enough that no other worker takes the message for abandoned.
+        """
+        interval = max(settings.MAIL_WORKER_CLAIM_TIMEOUT / 3, 1)
+        deadline = time.monotonic() + delay
+        while (remaining := deadline - time.monotonic()) > 0:
+            self.message.heartbeat()
+            time.sleep(min(interval, remaining))
+
+    def deliver(self, recipients):
+        emails = self.message._personalize_messages(recipients, self.metrics)
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            in_flight = set()
+            for chunk in chunked(emails, self.chunk_size):
+                if len(in_flight) >= self.concurrency:
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    self.record(done)
+                in_flight.add(executor.submit(deliver_chunk, chunk, self.limiter, self.metrics))
+            self.record(wait(in_flight).done)
+
+    def record(self, futures):
+        MessageRecipient = self.message.message_recipients.model
+        self.message.heartbeat()
+        for future in futures:
+            delivered = []
+            errors = defaultdict(list)
+            for recipient_pk, error in future.result():
+                if error is None:
+                    delivered.append(recipient_pk)
+                else:
+                    status = (
+                        MessageRecipient.Status.DEFERRED if is_transient(error) else MessageRecipient.Status.FAILED
+                    )
+                    errors[status, str(error)].append(recipient_pk)
+
+            if delivered:
+                MessageRecipient.objects.filter(pk__in=delivered).update(
+                    status=MessageRecipient.Status.SENT,
+                    date_delivered=timezone.now(),
+                    attempts=F("attempts") + 1,
+                    last_error="",
+                )
+                self.sent += len(delivered)
+
+            # Group failures sharing the same outcome to keep the number of updates small.
+            for (status, error), recipient_pks in errors.items():
+                MessageRecipient.objects.filter(pk__in=recipient_pks).update(
+                    status=status, attempts=F("attempts") + 1, last_error=error
+                )
+                if status == MessageRecipient.Status.DEFERRED:
+                    self.deferred += len(recipient_pks)
+                else:
+                    self.failed += len(recipient_pks)
+
+    @property
+    def throughput(self):
+        """Emails delivered per second."""
+        return self.sent / self.elapsed if self.elapsed else 0
+
+    @property
+    def throttled(self):
+        """Seconds spent waiting on the rate limiter, summed across workers."""
+        return self.limiter.waited if self.limiter else 0
+
+    def get_metrics(self):
+        """The run's metrics, with its totals, ready to be stored as JSON."""
+        return {
+            **self.metrics.as_dict(),
+            "sent": self.sent,
+            "deferred": self.deferred,
+            "failed": self.failed,
+            "throttled": round(self.throttled, 4),
+            "elapsed": round(self.elapsed, 4),
+            "throughput": round(self.throughput, 1),
+        }
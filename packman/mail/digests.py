@@ -0,0 +1,130 @@
+import time
+from collections import defaultdict
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import timedelta
+from itertools import groupby
+
+from django.conf import settings
+from django.contrib.sites.models import Site
+from django.db.models import F
+from django.utils import timezone
+from django.utils.translation import ngettext
+
+from .delivery import RateLimiter, chunked, deliver_chunk, is_transient
+from .models import ListSettings, MessageRecipient
+from .utils import ListEmailMessage, PersonalizedTemplate, make_return_path
+
+
+class DigestPipeline:
+    """
+    Deliver the list messages waiting for each digest subscriber as a single
+    combined email.
+
+    Subscribers waiting on the same messages share one rendering of the
+    digest, personalized per copy like any other message, and every digest
+    costs a single SMTP transaction however many messages it holds. Digests
+    are delivered in chunks by a bounded pool of workers, paced by the same
+    RateLimiter as regular sends.
+
+    The receipts waiting are claimed before anything is composed, so runs
+    that overlap never send a subscriber the same messages twice. A digest
+    that is temporarily rejected stays waiting for the next run; one that is
+    refused outright fails all of its messages.
+    """
+
+    def __init__(self, chunk_size=None, concurrency=None, limiter=None):
+        self.chunk_size = chunk_size or settings.MAIL_DELIVERY_CHUNK_SIZE
+        self.concurrency = concurrency or settings.MAIL_DELIVERY_CONCURRENCY
+        self.limiter = RateLimiter() if limiter is None else limiter
+        self.receipts = {}
+        self.sent = 0
+        self.deferred = 0
+        self.failed = 0
+        self.elapsed = 0
+
+    def get_receipts(self, claimed):
+        return (
+            MessageRecipient.objects.claimed_for_digest(claimed)
+            .select_related("recipient", "message__author")
+            .prefetch_related("message__distribution_lists")
+            .order_by("recipient_id", "message__date_sent", "message")
+        )
+
+    def run(self):
+        start = time.perf_counter()
+        stale_after = timedelta(seconds=settings.MAIL_DIGEST_CLAIM_TIMEOUT)
+        MessageRecipient.objects.claimable_for_digest(stale_after).suppress()
+        claimed = MessageRecipient.objects.claim_for_digest(stale_after)
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            in_flight = set()
+            for chunk in chunked(self.compose(self.get_receipts(claimed)), self.chunk_size):
+                if len(in_flight) >= self.concurrency:
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    self.record(done)
+                in_flight.add(executor.submit(deliver_chunk, chunk, self.limiter))
+            self.record(wait(in_flight).done)
+        self.elapsed = time.perf_counter() - start
+        return self
+
+    def compose(self, receipts):
+        """Generate a (recipient pk, email) pair for each subscriber with messages waiting."""
+        protocol = "https" if settings.CSRF_COOKIE_SECURE else "http"
+        site = Site.objects.get_current()
+        list_settings = ListSettings.current()
+        templates = {}
+
+        for recipient, group in groupby(receipts, key=lambda receipt: receipt.recipient):
+            group = list(group)
+            self.receipts[recipient.pk] = [receipt.pk for receipt in group]
+            messages = [receipt.message for receipt in group]
+
+            key = tuple(message.pk for message in messages)
+            if key not in templates:
+                context = {"site": site, "messages": messages, "protocol": protocol}
+                templates[key] = (
+                    PersonalizedTemplate("mail/digest_body.txt", context),
+                    PersonalizedTemplate("mail/digest_body.html", context, autoescape=True),
+                )
+            plaintext, richtext = templates[key]
+
+            subject = ngettext(
+                "Daily digest: %(count)d message", "Daily digest: %(count)d messages", len(messages)
+            ) % {"count": len(messages)}
+            yield recipient.pk, ListEmailMessage(
+                subject,
+                plaintext.render(recipient),
+                to=[f"{recipient.__str__()} <{recipient.email}>"],
+                alternatives=[(richtext.render(recipient), "text/html")],
+                settings=list_settings,
+                site=site,
+                return_path=make_return_path(recipient),
+            )
+
+    def record(self, futures):
+        delivered = []
+        errors = defaultdict(list)
+        for future in futures:
+            for recipient_pk, error in future.result():
+                receipts = self.receipts.pop(recipient_pk)
+                if error is None:
+                    delivered.extend(receipts)
+                    self.sent += 1
+                elif is_transient(error):
+                    # leave the receipts waiting for the next digest
+                    errors[MessageRecipient.Status.DIGEST, str(error)].extend(receipts)
+                    self.deferred += 1
+                else:
+                    errors[MessageRecipient.Status.FAILED, str(error)].extend(receipts)
+                    self.failed += 1
+
+        if delivered:
+            MessageRecipient.objects.filter(pk__in=delivered).update(
+                status=MessageRecipient.Status.SENT,
+                date_delivered=timezone.now(),
+                attempts=F("attempts") + 1,
+                last_error="",
+            )
+        for (status, error), receipts in errors.items():
+            MessageRecipient.objects.filter(pk__in=receipts).update(
+                status=status, attempts=F("attempts") + 1, last_error=error
+            )
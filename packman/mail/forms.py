@@ -1,13 +1,44 @@
 from django import forms
 from django.forms import inlineformset_factory
+from django.utils.translation import gettext_lazy as _
 
-from .models import Message, MessageDistribution, MessageRecipient
+from .models import Attachment, AttachmentBlob, Message, MessageDistribution, MessageRecipient
 
 
 class AttachmentForm(forms.Form):
     attachments = forms.FileField(required=False, widget=forms.ClearableFileInput())
 
 
+class AttachmentAdminForm(forms.ModelForm):
+    file = forms.FileField(label=_("file"), required=False)
+
+    class Meta:
+        model = Attachment
+        fields = ("name", "file")
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields["name"].required = False
+        # The contents of an existing attachment are fixed, only its name may change.
+        if self.instance.pk:
+            self.fields["file"].disabled = True
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if not self.instance.pk:
+            file = cleaned_data.get("file")
+            if not file:
+                self.add_error("file", _("Choose a file to attach."))
+            elif not cleaned_data.get("name"):
+                cleaned_data["name"] = self.instance.name = file.name
+        return cleaned_data
+
+    def save(self, commit=True):
+        if not self.instance.pk:
+            self.instance.blob = AttachmentBlob.objects.store(self.cleaned_data["file"])
+        return super().save(commit)
+
+
 class MessageForm(forms.ModelForm):
     class Meta:
         model = Message
@@ -0,0 +1,501 @@
+import binascii
+import html
+import logging
+import mimetypes
+import os
+import re
+import socketserver
+import tempfile
+from email import policy
+from email.parser import BytesHeaderParser
+from email.utils import getaddresses, parseaddr
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.sites.models import Site
+from django.core.files import File
+from django.db import close_old_connections, connections, transaction
+from django.db.models import Q
+from django.utils.html import linebreaks, strip_tags
+from django.utils.translation import gettext as _
+
+from .models import Attachment, DistributionList, EmailAddress, ListSettings, Message, MessageDistribution
+from .utils import parse_message_id
+
+logger = logging.getLogger(__name__)
+
+User = get_user_model()
+
+
+class RejectedMessage(Exception):
+    """
+    An inbound message that will not be accepted, with the SMTP reply code
+    and enhanced status code (RFC 3463) to give for it. Most are refused by
+    policy, as mail from someone not allowed to post.
+    """
+
+    def __init__(self, reason, code=550, status="5.7.1"):
+        super().__init__(reason)
+        self.code = code
+        self.status = status
+
+
+class LineReader:
+    """
+    Iterate over the lines of a binary file, refusing to read more than
+    `max_size` bytes in all.
+    """
+
+    def __init__(self, fp, max_size):
+        self.fp = fp
+        self.remaining = max_size
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        line = self.fp.readline(self.remaining + 1)
+        if not line:
+            raise StopIteration
+        self.remaining -= len(line)
+        if self.remaining < 0:
+            raise RejectedMessage(_("Message exceeds the maximum size"), code=552, status="5.3.4")
+        return line
+
+
+def split_line_ending(line):
+    content = line.rstrip(b"\r\n")
+    return content, line[len(content) :]
+
+
+class PartDecoder:
+    """
+    Undo a part's Content-Transfer-Encoding a line at a time. The line ending
+    before a MIME boundary belongs to the boundary, so each line ending is
+    held back until the next line shows it is part of the content.
+    """
+
+    def __init__(self, encoding):
+        self.encoding = encoding
+        self.pending = b""
+
+    def decode(self, line):
+        content, ending = split_line_ending(line)
+        if self.encoding == "base64":
+            # Line endings carry no meaning, but a line may not hold whole quanta.
+            self.pending += b"".join(content.split())
+            usable = len(self.pending) // 4 * 4
+            data, self.pending = self.pending[:usable], self.pending[usable:]
+            return binascii.a2b_base64(data) if data else b""
+
+        data, self.pending = self.pending, ending
+        if self.encoding == "quoted-printable":
+            if content.endswith(b"="):
+                # a soft line break joins this line to the next
+                content, self.pending = content[:-1], b""
+            return data + binascii.a2b_qp(content)
+        return data + content
+
+    def flush(self):
+        if self.encoding == "base64" and self.pending:
+            try:
+                return binascii.a2b_base64(self.pending + b"=" * (-len(self.pending) % 4))
+            except binascii.Error:
+                return b""
+        return b""
+
+
+class MessageParser:
+    """
+    Read the body of an RFC 5322 message part by part without holding it in
+    memory. Text parts are kept for the message body; every other part is
+    decoded straight to a temporary file and handed to `store` as it ends.
+    """
+
+    text_types = ("text/plain", "text/html")
+
+    def __init__(self, lines, store):
+        self.lines = lines
+        self.store = store
+        self.text = {}
+
+    def read_headers(self):
+        data = bytearray()
+        for line in self.lines:
+            if not line.strip(b"\r\n"):
+                break
+            data += line
+        return BytesHeaderParser(policy=policy.default).parsebytes(bytes(data))
+
+    def parse(self, headers):
+        self.read_part(headers, boundaries=())
+
+    def match_boundary(self, line, boundaries):
+        """Return (boundary, closing) if `line` delimits one of the enclosing multiparts."""
+        if not line.startswith(b"--"):
+            return None
+        line = line.rstrip()
+        for boundary in reversed(boundaries):
+            if line == b"--" + boundary:
+                return boundary, False
+            if line == b"--" + boundary + b"--":
+                return boundary, True
+        return None
+
+    def skip_to_boundary(self, boundaries):
+        for line in self.lines:
+            if delimiter := self.match_boundary(line, boundaries):
+                return delimiter
+        return None
+
+    def read_part(self, headers, boundaries):
+        """Read a part up to the delimiter that ends it, and return that delimiter."""
+        boundary = headers.get_param("boundary") if headers.get_content_maintype() == "multipart" else None
+        if not boundary:
+            return self.read_leaf(headers, boundaries)
+
+        boundaries = (*boundaries, str(boundary).encode())
+        delimiter = self.skip_to_boundary(boundaries)
+        while delimiter == (boundaries[-1], False):
+            delimiter = self.read_part(self.read_headers(), boundaries)
+        if delimiter == (boundaries[-1], True):
+            # skip the epilogue
+            return self.skip_to_boundary(boundaries[:-1])
+        return delimiter
+
+    def read_leaf(self, headers, boundaries):
+        content_type = headers.get_content_type()
+        filename = headers.get_filename()
+        is_text = (
+            content_type in self.text_types
+            and not filename
+            and headers.get_content_disposition() != "attachment"
+            and content_type not in self.text
+        )
+        decoder = PartDecoder(headers.get("content-transfer-encoding", "7bit").strip().lower())
+        delimiter = None
+
+        with tempfile.SpooledTemporaryFile(max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE) as out:
+            for line in self.lines:
+                if delimiter := self.match_boundary(line, boundaries):
+                    break
+                out.write(decoder.decode(line))
+            out.write(decoder.flush())
+
+            if is_text:
+                out.seek(0)
+                data = out.read()
+                try:
+                    self.text[content_type] = data.decode(headers.get_content_charset() or "us-ascii", "replace")
+                except LookupError:
+                    # an unknown charset
+                    self.text[content_type] = data.decode("utf-8", "replace")
+            elif out.tell():
+                if not filename:
+                    extension = mimetypes.guess_extension(content_type) or ".bin"
+                    filename = f"attachment{extension}"
+                out.seek(0)
+                file = File(out, name=Path(filename).name)
+                file.content_type = content_type
+                self.store(file)
+        return delimiter
+
+    def get_body(self):
+        """
+        The message body as HTML. Mail from outside is not trusted, so the
+        plain text part is preferred and any HTML is reduced to its text.
+        """
+        if "text/plain" in self.text:
+            text = self.text["text/plain"]
+        else:
+            text = html.unescape(strip_tags(self.text.get("text/html", "")))
+        return linebreaks(text.strip(), autoescape=True)
+
+
+def clean_subject(subject):
+    """Strip the list prefix and list tags a reply carries over from the message it answers."""
+    list_settings = ListSettings.current()
+    if list_settings and list_settings.subject_prefix:
+        subject = subject.replace(list_settings.subject_prefix, "")
+
+    names = set(DistributionList.objects.values_list("name", flat=True))
+
+    def strip_tag(match):
+        return "" if {name.strip() for name in match[1].split(",")} <= names else match[0]
+
+    subject = re.sub(r"\[([^\]]*)\]\s*", strip_tag, subject)
+    return " ".join(subject.split())[: Message._meta.get_field("subject").max_length] or _("(no subject)")
+
+
+def is_authenticated(headers, authserv_id):
+    """
+    Whether the Authentication-Results header added by the mail server
+    named `authserv_id` says the message passed DMARC, so that its From:
+    address is one its domain vouches for.
+    """
+    for value in headers.get_all("authentication-results", []):
+        server, *results = str(value).split(";")
+        if server.split()[:1] == [authserv_id] and any(
+            result.strip().lower().startswith("dmarc=pass") for result in results
+        ):
+            return True
+    return False
+
+
+def get_author(headers, sender=None):
+    """
+    The member who wrote the message, found by its From: address.
+
+    Headers say whatever the sender chose to write, so the From: address is
+    only trusted when it is also the envelope sender the mail server took
+    the message from: `sender` when handed over through LMTP, or the
+    Return-Path the server records when delivering to the maildir. Envelope
+    senders can be forged too, so where the mail server checks DMARC and
+    MAIL_INBOUND_AUTHSERV_ID names it, the message must also have passed.
+    """
+    address = parseaddr(str(headers.get("from", "")))[1]
+    if sender is None:
+        sender = parseaddr(str(headers.get("return-path", "")))[1]
+    if not address or address.lower() != sender.lower():
+        raise RejectedMessage(_("%s is not the envelope sender") % (address or _("Unknown sender")))
+    if settings.MAIL_INBOUND_AUTHSERV_ID and not is_authenticated(headers, settings.MAIL_INBOUND_AUTHSERV_ID):
+        raise RejectedMessage(_("%s could not be authenticated") % address)
+
+    author = User.objects.filter(email__iexact=address, is_active=True).first()
+    if not author:
+        raise RejectedMessage(_("%s is not allowed to post to this list") % address)
+    return author
+
+
+def get_distribution_lists(headers, recipients=None):
+    """The lists the message was addressed to, from the envelope if known or else its headers."""
+    if recipients is None:
+        fields = [str(value) for name in ("to", "cc", "delivered-to") for value in headers.get_all(name, [])]
+        recipients = [address for name, address in getaddresses(fields)]
+    query = Q()
+    for address in recipients:
+        query |= Q(addresses__address__iexact=address)
+    distribution_lists = list(DistributionList.objects.filter(query).distinct()) if recipients else []
+    if not distribution_lists:
+        raise RejectedMessage(_("No such list"), status="5.1.1")
+    return distribution_lists
+
+
+def get_parent(headers, author):
+    """The message being replied to, as long as the author was party to it."""
+    domain = Site.objects.get_current().domain
+    references = [str(headers.get("in-reply-to", ""))] + str(headers.get("references", "")).split()[::-1]
+    pks = [pk for pk in (parse_message_id(reference, domain) for reference in references) if pk]
+    if not pks:
+        return None
+    candidates = {
+        message.pk: message
+        for message in Message.objects.filter(Q(author=author) | Q(recipients=author), pk__in=pks)
+        .exclude(status=Message.Status.DRAFT)
+        .distinct()
+    }
+    return next((candidates[pk] for pk in pks if pk in candidates), None)
+
+
+def receive_message(fp, recipients=None, sender=None):
+    """
+    Read an RFC 5322 message from the binary file `fp` and queue it for
+    delivery to the distribution lists it was addressed to, threaded under
+    the message it replies to. `recipients` and `sender` are the envelope
+    recipients and sender, where known; otherwise the lists are found from
+    the message's headers and the sender from its Return-Path.
+
+    Raises RejectedMessage if the message cannot be accepted.
+    """
+    lines = LineReader(fp, settings.MAIL_INBOUND_MAX_SIZE)
+    parser = MessageParser(lines, store=lambda file: Attachment.objects.attach(message, file))
+    headers = parser.read_headers()
+
+    if parse_message_id(str(headers.get("message-id", "")), Site.objects.get_current().domain):
+        # one of our own messages came back, don't deliver it again
+        raise RejectedMessage(_("Mail loop detected"), code=554, status="5.4.6")
+    author = get_author(headers, sender)
+    distribution_lists = get_distribution_lists(headers, recipients)
+    parent = get_parent(headers, author)
+
+    with transaction.atomic():
+        message = Message.objects.create(
+            author=author,
+            subject=clean_subject(str(headers.get("subject", ""))),
+            body="",
+            parent=parent,
+        )
+        MessageDistribution.objects.bulk_create(
+            MessageDistribution(message=message, distribution_list=distribution_list)
+            for distribution_list in distribution_lists
+        )
+        parser.parse(headers)
+        message.body = parser.get_body()
+        # hand the message to the mail workers like any other
+        message.status = Message.Status.QUEUED
+        message.save()
+
+    logger.info(
+        _("Received %(message)s (%(pk)s) from %(author)s") % {"message": message, "pk": message.pk, "author": author}
+    )
+    return message
+
+
+def receive_maildir(path, receive=receive_message):
+    """
+    Hand every message waiting in the maildir at `path` to `receive`.
+    Accepted messages are moved to cur/ marked seen, rejected ones marked
+    trashed; messages that fail unexpectedly are left in new/ for the next
+    run.
+
+    Returns the number of messages received and rejected.
+    """
+    path = Path(path)
+    received = rejected = 0
+    for entry in sorted(os.scandir(path / "new"), key=lambda entry: entry.name):
+        if not entry.is_file() or entry.name.startswith("."):
+            continue
+        try:
+            with open(entry.path, "rb") as fp:
+                receive(fp)
+        except RejectedMessage as e:
+            logger.warning(_("Rejected %(name)s: %(reason)s") % {"name": entry.name, "reason": e})
+            flag = "T"
+            rejected += 1
+        except Exception:
+            logger.exception(_("Unable to receive %s") % entry.name)
+            continue
+        else:
+            flag = "S"
+            received += 1
+        os.replace(entry.path, path / "cur" / f"{entry.name.split(':')[0]}:2,{flag}")
+    return received, rejected
+
+
+class LMTPSession:
+    """
+    A single LMTP (RFC 2033) conversation with a mail server handing over
+    mail for the distribution lists. Message data is spooled to disk as it
+    arrives, and each recipient gets a reply once the message is received.
+    """
+
+    # Longer lines are read in pieces, so no line can take more memory.
+    max_line_length = 64 * 1024
+
+    def __init__(self, rfile, wfile, hostname=None):
+        self.rfile = rfile
+        self.wfile = wfile
+        self.hostname = hostname or Site.objects.get_current().domain
+        self.reset()
+
+    def reset(self):
+        self.sender = None
+        self.recipients = []
+
+    def reply(self, code, text):
+        self.wfile.write(f"{code} {text}\r\n".encode())
+        self.wfile.flush()
+
+    def run(self):
+        self.reply(220, f"{self.hostname} LMTP ready")
+        for line in self.rfile:
+            command, _sep, argument = line.decode("utf-8", errors="replace").strip().partition(" ")
+            handler = getattr(self, f"lmtp_{command.upper()}", None)
+            if handler is None:
+                self.reply(500, "5.5.1 Unrecognized command")
+            elif handler(argument.strip()) is False:
+                break
+
+    def lmtp_LHLO(self, argument):
+        self.wfile.write(f"250-{self.hostname}\r\n250-8BITMIME\r\n250-ENHANCEDSTATUSCODES\r\n".encode())
+        self.reply(250, f"SIZE {settings.MAIL_INBOUND_MAX_SIZE}")
+
+    def lmtp_MAIL(self, argument):
+        self.reset()
+        self.sender = parseaddr(argument.partition(":")[2])[1]
+        self.reply(250, "2.1.0 Ok")
+
+    def lmtp_RCPT(self, argument):
+        if self.sender is None:
+            return self.reply(503, "5.5.1 Need MAIL command")
+        address = parseaddr(argument.partition(":")[2])[1]
+        if EmailAddress.objects.filter(address__iexact=address).exists():
+            self.recipients.append(address)
+            self.reply(250, "2.1.5 Ok")
+        else:
+            self.reply(550, "5.1.1 No such list")
+
+    def lmtp_DATA(self, argument):
+        if not self.recipients:
+            return self.reply(503, "5.5.1 Need RCPT command")
+        self.reply(354, "End data with <CR><LF>.<CR><LF>")
+
+        with tempfile.SpooledTemporaryFile(max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE) as spool:
+            try:
+                if not self.spool_data(spool, settings.MAIL_INBOUND_MAX_SIZE):
+                    raise RejectedMessage(_("Message exceeds the maximum size"), code=552, status="5.3.4")
+                spool.seek(0)
+                receive_message(spool, self.recipients, self.sender)
+            except RejectedMessage as e:
+                code, text = e.code, f"{e.status} {e}"
+            except Exception:
+                logger.exception(_("Unable to receive a message from %s") % self.sender)
+                code, text = 451, "4.3.0 Temporary failure, try again later"
+            else:
+                code, text = 250, "2.0.0 Ok"
+            finally:
+                close_old_connections()
+
+        # LMTP replies for each recipient in turn
+        for _recipient in self.recipients:
+            self.reply(code, text)
+        self.reset()
+
+    def spool_data(self, spool, max_size):
+        """
+        Write the message data up to the terminating "." line to `spool`,
+        returning False if it held more than `max_size` bytes. The rest of an
+        oversized message is read, a line at a time, but not kept, so the
+        conversation can carry on.
+        """
+        size = 0
+        line_start = True
+        while line := self.rfile.readline(self.max_line_length):
+            if line_start:
+                if line.rstrip(b"\r\n") == b".":
+                    break
+                if line.startswith(b"."):
+                    line = line[1:]
+            line_start = line.endswith(b"\n")
+            size += len(line)
+            if size <= max_size:
+                spool.write(line)
+        return size <= max_size
+
+    def lmtp_RSET(self, argument):
+        self.reset()
+        self.reply(250, "2.0.0 Ok")
+
+    def lmtp_NOOP(self, argument):
+        self.reply(250, "2.0.0 Ok")
+
+    def lmtp_QUIT(self, argument):
+        self.reply(221, "2.0.0 Bye")
+        return False
+
+
+class LMTPHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        try:
+            LMTPSession(self.rfile, self.wfile).run()
+        finally:
+            connections.close_all()
+
+
+class LMTPServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, address):
+        super().__init__(address, LMTPHandler)
@@ -0,0 +1,64 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import override_settings
+from django.utils.translation import gettext as _
+
+from packman.mail.benchmarks import Benchmark, SMTPSink, build_pack
+from packman.membership.models import Adult
+
+
+class Command(BaseCommand):
+    help = _(
+        "Times expanding, personalizing and delivering a message to a synthetic pack of each size, "
+        "against a local SMTP sink and in a throwaway test database"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--recipients",
+            type=int,
+            nargs="+",
+            default=[100, 1000, 10000],
+            help=_("Pack sizes to benchmark (default: 100 1000 10000)"),
+        )
+        parser.add_argument("--concurrency", type=int, help=_("Delivery workers (default: MAIL_DELIVERY_CONCURRENCY)"))
+        parser.add_argument("--chunk-size", type=int, help=_("Emails per chunk (default: MAIL_DELIVERY_CHUNK_SIZE)"))
+        parser.add_argument(
+            "--noinput", "--no-input", action="store_false", dest="interactive", help=_("Do not prompt the user.")
+        )
+
+    def handle(self, *args, **options):
+        # Nothing here should touch real members, real mail or the shared cache.
+        old_name = connection.settings_dict["NAME"]
+        connection.creation.create_test_db(
+            verbosity=options["verbosity"], autoclobber=not options["interactive"], serialize=False
+        )
+        try:
+            with (
+                SMTPSink() as sink,
+                override_settings(
+                    CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+                    **sink.get_email_settings(),
+                ),
+            ):
+                author = Adult.objects.create_user(email="benchmark@example.com")
+                self.stdout.write(
+                    f"{_('Recipients'):>10}  {_('Phase'):<16}{_('Seconds'):>9}{_('Messages/s'):>12}{_('Peak MB'):>9}"
+                )
+                for recipients in sorted(options["recipients"]):
+                    benchmark = Benchmark(
+                        build_pack(recipients), author, options["concurrency"], options["chunk_size"]
+                    )
+                    for result in benchmark.run():
+                        self.stdout.write(
+                            f"{recipients:>10}  {result.phase:<16}{result.elapsed:>9.2f}{result.rate:>12.0f}"
+                            f"{result.peak_memory / 2**20:>9.1f}"
+                        )
+                self.stdout.write(
+                    self.style.SUCCESS(
+                        _("The sink accepted %(messages)d emails, %(bytes)d bytes")
+                        % {"messages": sink.messages, "bytes": sink.bytes}
+                    )
+                )
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=options["verbosity"])
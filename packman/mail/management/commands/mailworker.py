@@ -0,0 +1,110 @@
+import logging
+import os
+import signal
+import socket
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from django.utils.translation import gettext as _
+
+from packman.mail.models import Message
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = _(
+        "Runs a long-lived worker that sends Messages as soon as they are queued. "
+        "Any number of workers may run side by side; each message is claimed by exactly one of them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=settings.MAIL_WORKER_POLL_INTERVAL,
+            help=_("Seconds to wait before checking an empty queue again."),
+        )
+        parser.add_argument(
+            "--max-poll-interval",
+            type=float,
+            default=settings.MAIL_WORKER_MAX_POLL_INTERVAL,
+            help=_("Upper bound for the poll interval as it backs off while the queue stays empty."),
+        )
+        parser.add_argument(
+            "--claim-timeout",
+            type=int,
+            default=settings.MAIL_WORKER_CLAIM_TIMEOUT,
+            help=_("Seconds without progress after which another worker's claim is considered abandoned."),
+        )
+        parser.add_argument(
+            "--burst",
+            action="store_true",
+            help=_("Exit once the queue is empty instead of waiting for more messages."),
+        )
+
+    def handle(self, *args, **options):
+        self.worker = f"{socket.gethostname()}:{os.getpid()}"
+        self.stopping = threading.Event()
+        self.messages = self.failures = self.emails = 0
+        self.started = time.perf_counter()
+
+        handlers = {signum: signal.signal(signum, self.stop) for signum in (signal.SIGINT, signal.SIGTERM)}
+        try:
+            self.run(**options)
+        finally:
+            for signum, handler in handlers.items():
+                signal.signal(signum, handler)
+        self.report()
+
+    def run(self, **options):
+        stale_after = timedelta(seconds=options["claim_timeout"])
+        interval = options["poll_interval"]
+        self.stdout.write(_("Mail worker %s waiting for messages") % self.worker)
+
+        while not self.stopping.is_set():
+            close_old_connections()
+            message = Message.objects.claim(self.worker, stale_after)
+            if message:
+                self.process(message)
+                interval = options["poll_interval"]
+                continue
+
+            if options["burst"]:
+                break
+            # Back off while idle so a quiet queue costs next to nothing to watch.
+            self.stopping.wait(interval)
+            interval = min(interval * 2, options["max_poll_interval"])
+
+    def stop(self, signum, frame):
+        # Let the message in hand finish; a second signal falls back to the default behavior.
+        self.stdout.write(_("Received %s, stopping after the current message") % signal.Signals(signum).name)
+        signal.signal(signum, signal.SIG_DFL)
+        self.stopping.set()
+
+    def process(self, message):
+        logger.info(_("Sending %(message)s (%(pk)s)") % {"message": message, "pk": message.pk})
+        try:
+            delivery = message.send_claimed()
+        except Exception as e:
+            logger.exception(_("Unable to send %s") % message.pk)
+            self.stderr.write(self.style.ERROR(_("An unexpected error occurred: %s") % e))
+            self.failures += 1
+        else:
+            self.emails += delivery.sent
+        self.messages += 1
+
+    def report(self):
+        elapsed = time.perf_counter() - self.started
+        self.stdout.write(
+            self.style.SUCCESS(
+                _("Processed %(messages)d messages (%(failures)d failed), %(emails)d emails in %(elapsed).1fs")
+                % {"messages": self.messages, "failures": self.failures, "emails": self.emails, "elapsed": elapsed}
+            )
+        )
+        if self.emails:
+            self.stdout.write(_("%.1f emails per second") % (self.emails / elapsed))
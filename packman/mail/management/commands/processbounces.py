@@ -0,0 +1,27 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.translation import gettext as _
+
+from packman.mail.bounces import process_bounce
+from packman.mail.inbound import receive_maildir
+
+
+class Command(BaseCommand):
+    help = _("Reads bounced list mail from a maildir and stops mailing addresses that bounce permanently")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--maildir",
+            default=settings.MAIL_BOUNCE_MAILDIR,
+            help=_("The maildir bounces are delivered to."),
+        )
+
+    def handle(self, *args, **options):
+        if not options["maildir"]:
+            raise CommandError(_("Give the maildir bounces are delivered to."))
+
+        processed, ignored = receive_maildir(options["maildir"], receive=process_bounce)
+        if ignored:
+            self.stderr.write(self.style.WARNING(_("Ignored %d messages that were not bounces") % ignored))
+        if processed:
+            self.stdout.write(self.style.SUCCESS(_("Processed %d bounces") % processed))
@@ -0,0 +1,51 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.translation import gettext as _
+
+from packman.mail.inbound import LMTPServer, receive_maildir
+
+
+class Command(BaseCommand):
+    help = _(
+        "Receives mail sent to the distribution lists, from a maildir or over LMTP, "
+        "and queues it for delivery to the lists' members."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--maildir",
+            default=settings.MAIL_INBOUND_MAILDIR,
+            help=_("Receive the messages waiting in this maildir, then exit."),
+        )
+        parser.add_argument(
+            "--lmtp",
+            nargs="?",
+            const=settings.MAIL_INBOUND_LMTP_ADDRESS,
+            metavar="HOST:PORT",
+            help=_("Listen for mail handed over by the mail server over LMTP."),
+        )
+
+    def handle(self, *args, **options):
+        if options["lmtp"]:
+            return self.serve(options["lmtp"])
+        if not options["maildir"]:
+            raise CommandError(_("Give a maildir to read from, or --lmtp to listen for mail."))
+
+        received, rejected = receive_maildir(options["maildir"])
+        if rejected:
+            self.stderr.write(self.style.WARNING(_("Rejected %d messages") % rejected))
+        if received:
+            self.stdout.write(self.style.SUCCESS(_("Received %d messages") % received))
+
+    def serve(self, address):
+        host, _sep, port = address.rpartition(":")
+        try:
+            server = LMTPServer((host or "127.0.0.1", int(port)))
+        except ValueError:
+            raise CommandError(_("Invalid LMTP address %s, expected HOST:PORT") % address)
+        with server:
+            self.stdout.write(_("Listening for LMTP on %s:%d") % server.server_address[:2])
+            try:
+                server.serve_forever()
+            except KeyboardInterrupt:
+                pass
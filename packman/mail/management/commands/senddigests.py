@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from django.utils.translation import gettext as _
+
+from packman.mail.digests import DigestPipeline
+
+
+class Command(BaseCommand):
+    help = _("Sends each digest subscriber a single email collecting the list messages waiting for them")
+
+    def handle(self, *args, **options):
+        digests = DigestPipeline().run()
+        if digests.deferred or digests.failed:
+            self.stderr.write(
+                self.style.WARNING(
+                    _("%(deferred)d digests deferred until the next run, %(failed)d failed")
+                    % {"deferred": digests.deferred, "failed": digests.failed}
+                )
+            )
+        if digests.sent:
+            self.stdout.write(
+                self.style.SUCCESS(
+                    _("Successfully sent %(sent)d digests in %(elapsed).1fs")
+                    % {"sent": digests.sent, "elapsed": digests.elapsed}
+                )
+            )
@@ -1,3 +1,8 @@
+import os
+import socket
+from datetime import timedelta
+
+from django.conf import settings
 from django.core.management.base import BaseCommand
 from django.utils.translation import gettext as _
 
@@ -5,17 +10,24 @@ from packman.mail.models import Message
 
 
 class Command(BaseCommand):
-    help = _("Sends all Messages with a status of 'QUEUED'")
+    help = _("Sends all Messages with a status of 'QUEUED' and resumes any left 'SENDING'")
 
     def handle(self, *args, **options):
-        messages = Message.objects.filter(status=Message.Status.QUEUED)
+        # Claim messages one at a time so overlapping runs, or a running
+        # mailworker, never send the same message twice.
+        worker = f"sendemails@{socket.gethostname()}:{os.getpid()}"
+        stale_after = timedelta(seconds=settings.MAIL_WORKER_CLAIM_TIMEOUT)
         success_count = 0
-        for message in messages:
-            message.status = Message.Status.SENDING
-            message.save(update_fields=("status",))
+        attempted = set()
+        while message := Message.objects.claim(worker, stale_after):
+            if message.pk in attempted:
+                # Still outstanding from earlier in this run, leave it for the next one.
+                break
+            attempted.add(message.pk)
             try:
-                message.send()
-                success_count += 1
+                message.send_claimed()
+                if message.status == Message.Status.SENT:
+                    success_count += 1
             except Exception as e:
                 self.stderr.write(self.style.ERROR(_("An unexpected error occurred: %s") % e))
 
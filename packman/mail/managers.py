@@ -1,5 +1,89 @@
-from django.db import models
-from django.db.models import Prefetch, Q
+import hashlib
+import mimetypes
+from pathlib import Path
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, connections, models, transaction
+from django.db.models import Count, F, FilteredRelation, OuterRef, Prefetch, Q, Subquery, Value
+from django.db.models.functions import Coalesce, Lower
+from django.utils import timezone
+
+from packman.core.cache import cache_is_shared
+
+# The text search configuration used for full-text search on Postgres, which
+# must match the one used by the search index created in migrations.
+SEARCH_CONFIG = "english"
+
+
+# Resolved distribution list members are cached per list and pack year under
+# a shared version number, bumped whenever anything that decides membership
+# changes so that every cached list goes stale at once.
+MEMBERS_CACHE_VERSION_KEY = "mail:distribution_list_members_version"
+
+
+def get_members_cache_key(distribution_list_pk, year):
+    return f"mail:distribution_list_members:{distribution_list_pk}:{year.pk if year else None}"
+
+
+def invalidate_distribution_list_members():
+    try:
+        cache.incr(MEMBERS_CACHE_VERSION_KEY)
+    except ValueError:
+        cache.set(MEMBERS_CACHE_VERSION_KEY, 1, timeout=None)
+
+
+def resolve_members(distribution_lists):
+    """
+    Return a mapping of distribution list pk to the set of member pks for
+    each of `distribution_lists` in the current pack year. Lists already
+    resolved are read from the cache; the rest are resolved together with a
+    single UNION query and cached for next time. Without a cache shared
+    between processes, every list is resolved every time.
+    """
+    from packman.calendars.models import PackYear
+
+    year = PackYear.objects.current()
+    keys = {
+        distribution_list.pk: get_members_cache_key(distribution_list.pk, year)
+        for distribution_list in distribution_lists
+    }
+    members = {}
+    shared = cache_is_shared()
+    if shared:
+        version = cache.get_or_set(MEMBERS_CACHE_VERSION_KEY, 1, timeout=None)
+        cached = cache.get_many(keys.values(), version=version)
+        members = {pk: set(cached[key]) for pk, key in keys.items() if key in cached}
+
+    missing = [distribution_list for distribution_list in distribution_lists if distribution_list.pk not in members]
+    member_querysets = [
+        distribution_list.get_members()
+        .order_by()
+        .annotate(distribution_list_id=Value(distribution_list.pk))
+        .values_list("pk", "distribution_list_id")
+        for distribution_list in missing
+    ]
+    if member_querysets:
+        members.update((distribution_list.pk, set()) for distribution_list in missing)
+        first, *others = member_querysets
+        for member_pk, distribution_list_pk in first.union(*others):
+            members[distribution_list_pk].add(member_pk)
+        if shared:
+            cache.set_many(
+                {keys[distribution_list.pk]: members[distribution_list.pk] for distribution_list in missing},
+                timeout=settings.MAIL_MEMBERS_CACHE_TIMEOUT,
+                version=version,
+            )
+    return members
+
+
+class DistributionListQuerySet(models.QuerySet):
+    def resolve_members(self):
+        """
+        Return a mapping of distribution list pk to the set of member pks for
+        every list in the queryset.
+        """
+        return resolve_members(list(self))
 
 
 class MessageQuerySet(models.QuerySet):
@@ -45,6 +129,106 @@ class MessageQuerySet(models.QuerySet):
     def sent(self, author):
         return self.filter(author=author, date_sent__isnull=False)
 
+    def mailbox_counts(self, user):
+        """
+        Count the messages in every standard folder for `user`, along with the
+        unread messages in each folder they receive into, using a single query.
+        """
+        Status = self.model.Status
+        authored = Q(author=user)
+        received = Q(user_receipt__isnull=False)
+        unread = Q(user_receipt__date_read__isnull=True)
+        inbox = received & Q(user_receipt__date_archived__isnull=True, user_receipt__date_deleted__isnull=True)
+        archives = received & Q(user_receipt__date_archived__isnull=False)
+        trash = received & Q(user_receipt__date_deleted__isnull=False)
+
+        return (
+            self.alias(
+                user_receipt=FilteredRelation("message_recipient", condition=Q(message_recipient__recipient=user))
+            )
+            .filter(authored | received)
+            .aggregate(
+                inbox=Count("pk", filter=inbox),
+                inbox_unread=Count("pk", filter=inbox & unread),
+                drafts=Count("pk", filter=authored & Q(status=Status.DRAFT)),
+                sent=Count("pk", filter=authored & Q(date_sent__isnull=False)),
+                outbox=Count("pk", filter=authored & Q(status__in=(Status.QUEUED, Status.SENDING))),
+                archives=Count("pk", filter=archives),
+                archives_unread=Count("pk", filter=archives & unread),
+                trash=Count("pk", filter=trash),
+                trash_unread=Count("pk", filter=trash & unread),
+            )
+        )
+
+    def search(self, query):
+        """
+        Filter to messages whose subject or body match the words in `query`,
+        best matches first. Uses the full-text index on Postgres (tsvector)
+        or SQLite (FTS5), and falls back to a substring match elsewhere.
+        """
+        vendor = connections[self.db].vendor
+        if vendor == "postgresql":
+            from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+
+            search_query = SearchQuery(query, config=SEARCH_CONFIG, search_type="websearch")
+            return (
+                self.annotate(search=SearchVector("search_document", config=SEARCH_CONFIG))
+                .filter(search=search_query)
+                .annotate(rank=SearchRank(F("search"), search_query))
+                .order_by("-rank", "-last_updated")
+            )
+        elif vendor == "sqlite":
+            # Quote each word so FTS5 treats punctuation in the query literally.
+            terms = " ".join('"{}"'.format(term.replace('"', '""')) for term in query.split())
+            return (
+                self.filter(search_index__document__match=terms)
+                # FTS5 ranks better matches with more negative scores
+                .annotate(rank=-F("search_index__rank")).order_by("-rank", "-last_updated")
+            )
+        return self.filter(search_document__icontains=query).annotate(rank=Value(0.0)).order_by("-last_updated")
+
+    def claimable(self, stale_after):
+        """
+        Messages waiting to be sent, including those a worker claimed but
+        stopped reporting progress on for longer than `stale_after`.
+        """
+        return self.filter(
+            Q(status=self.model.Status.QUEUED)
+            | Q(status=self.model.Status.SENDING, date_claimed__isnull=True)
+            | Q(status=self.model.Status.SENDING, date_claimed__lt=timezone.now() - stale_after)
+        )
+
+    def claim(self, worker, stale_after):
+        """
+        Claim the oldest claimable message for `worker`, marking it as sending.
+        Returns None when there is nothing to send.
+
+        Databases supporting SELECT ... FOR UPDATE SKIP LOCKED let concurrent
+        workers pass over rows already being claimed. Elsewhere, a claim only
+        succeeds if a conditional UPDATE finds the row still claimable, so two
+        workers can never both win the same message.
+        """
+        claimable = self.claimable(stale_after).order_by("date_added")
+
+        if connections[self.db].features.has_select_for_update_skip_locked:
+            with transaction.atomic(using=self.db):
+                message = claimable.select_for_update(skip_locked=True).first()
+                if message:
+                    message.status = self.model.Status.SENDING
+                    message.claimed_by = worker
+                    message.date_claimed = timezone.now()
+                    message.save(update_fields=("status", "claimed_by", "date_claimed"))
+                return message
+
+        for pk in claimable.values_list("pk", flat=True)[:10]:
+            if (
+                self.claimable(stale_after)
+                .filter(pk=pk)
+                .update(status=self.model.Status.SENDING, claimed_by=worker, date_claimed=timezone.now())
+            ):
+                return self.get(pk=pk)
+        return None
+
 
 class MessageManager(models.Manager):
     def get_queryset(self):
@@ -71,6 +255,15 @@ class MessageManager(models.Manager):
     def sent(self, author):
         return self.get_queryset().sent(author)
 
+    def mailbox_counts(self, user):
+        return self.get_queryset().mailbox_counts(user)
+
+    def search(self, query):
+        return self.get_queryset().search(query)
+
+    def claim(self, worker, stale_after):
+        return self.get_queryset().claim(worker, stale_after)
+
     def for_recipient(self, recipient):
         return self.get_queryset().with_receipts(recipient)
 
@@ -89,6 +282,279 @@ class MessageManager(models.Manager):
             return self.get_queryset().deleted(recipient)
 
 
+class ThreadQuerySet(models.QuerySet):
+    def for_user(self, user):
+        """
+        The conversations the user takes part in, most recently active first,
+        annotated with the number of messages in each the user has not read.
+        """
+        return (
+            self.alias(
+                participant=FilteredRelation("thread_participants", condition=Q(thread_participants__user=user))
+            )
+            .filter(participant__isnull=False)
+            .annotate(unread_count=F("participant__unread_count"))
+            .select_related("last_message__author")
+            .order_by("-last_updated")
+        )
+
+    def refresh_summaries(self):
+        """
+        Recount the summary of every thread in the queryset: its last message,
+        the number of messages and participants, and how many messages each
+        participant has not read. Drafts are left out. Costs the same handful
+        of queries however many threads there are.
+        """
+        Message = self.model.messages.field.model
+        MessageRecipient = Message.message_recipients.field.model
+        ThreadParticipant = self.model.participants.through
+        thread_ids = list(self.values_list("pk", flat=True))
+        if not thread_ids:
+            return
+
+        messages = Message.objects.filter(thread__in=thread_ids).exclude(status=Message.Status.DRAFT)
+        unread = {
+            (thread, user): count
+            for thread, user, count in MessageRecipient.objects.filter(message__in=messages)
+            .values_list("message__thread", "recipient")
+            .annotate(count=Count("pk", filter=Q(date_read__isnull=True)))
+            .order_by()
+        }
+        for thread, author in messages.values_list("thread", "author").distinct().order_by():
+            unread.setdefault((thread, author), 0)
+
+        with transaction.atomic():
+            ThreadParticipant.objects.filter(thread__in=thread_ids).delete()
+            ThreadParticipant.objects.bulk_create(
+                ThreadParticipant(thread_id=thread, user_id=user, unread_count=count)
+                for (thread, user), count in unread.items()
+            )
+            self.model.objects.filter(pk__in=thread_ids)._update_totals()
+
+    def add_message(self, message):
+        """
+        Count a message that has just been sent in its thread's summary,
+        touching only the participant rows of its author and recipients
+        rather than recounting the whole thread. Sending the message again,
+        as resuming deferred deliveries does, leaves the summary as it is.
+        """
+        ThreadParticipant = self.model.participants.through
+        receipts = message.message_recipients.all()
+        users = {message.author_id, *receipts.values_list("recipient", flat=True)}
+
+        with transaction.atomic():
+            ThreadParticipant.objects.bulk_create(
+                (ThreadParticipant(thread_id=message.thread_id, user_id=user) for user in users),
+                ignore_conflicts=True,
+            )
+            receipts.refresh_unread_counts()
+            self.model.objects.filter(pk=message.thread_id)._update_totals()
+
+    def _update_totals(self):
+        """Recount the last message and the number of messages and participants of each thread."""
+        Message = self.model.messages.field.model
+        ThreadParticipant = self.model.participants.through
+        thread_messages = Message.objects.filter(thread=OuterRef("pk")).exclude(status=Message.Status.DRAFT).order_by()
+        return self.update(
+            last_message=Subquery(thread_messages.order_by("-date_sent", "-date_added").values("pk")[:1]),
+            message_count=Coalesce(
+                Subquery(thread_messages.values("thread").annotate(count=Count("pk")).values("count")), 0
+            ),
+            participant_count=Coalesce(
+                Subquery(
+                    ThreadParticipant.objects.filter(thread=OuterRef("pk"))
+                    .order_by()
+                    .values("thread")
+                    .annotate(count=Count("pk"))
+                    .values("count")
+                ),
+                0,
+            ),
+            last_updated=timezone.now(),
+        )
+
+
 class MessageRecipientQuerySet(models.QuerySet):
     def unread(self):
         return self.filter(date_read__isnull=True, date_archived__isnull=True, date_deleted__isnull=True)
+
+    def in_inbox(self):
+        return self.filter(date_archived__isnull=True, date_deleted__isnull=True)
+
+    def archived(self):
+        return self.filter(date_archived__isnull=False)
+
+    def deleted(self):
+        return self.filter(date_deleted__isnull=False)
+
+    def awaiting_digest(self):
+        return self.filter(status=self.model.Status.DIGEST)
+
+    def claimable_for_digest(self, stale_after):
+        """
+        Receipts awaiting a digest, including those a digest run claimed but
+        didn't finish with within `stale_after`.
+        """
+        return self.filter(
+            Q(status=self.model.Status.DIGEST)
+            | Q(status=self.model.Status.DIGESTING, date_claimed__lt=timezone.now() - stale_after)
+        )
+
+    def claim_for_digest(self, stale_after):
+        """
+        Claim every receipt awaiting a digest for a single digest run, marking
+        them as being sent. Returns the time of the claim, which the claimed
+        receipts are stamped with.
+
+        Databases supporting SELECT ... FOR UPDATE SKIP LOCKED let concurrent
+        runs pass over receipts already being claimed. Elsewhere, each
+        receipt is claimed with a conditional UPDATE that only succeeds if it
+        is still claimable, so two runs can never both digest the same one.
+        """
+        claimable = self.claimable_for_digest(stale_after)
+        claimed = timezone.now()
+        claim = {"status": self.model.Status.DIGESTING, "date_claimed": claimed}
+
+        if connections[self.db].features.has_select_for_update_skip_locked:
+            with transaction.atomic(using=self.db):
+                pks = list(claimable.select_for_update(skip_locked=True).values_list("pk", flat=True))
+                self.filter(pk__in=pks).update(**claim)
+            return claimed
+
+        for pk in claimable.values_list("pk", flat=True):
+            self.claimable_for_digest(stale_after).filter(pk=pk).update(**claim)
+        return claimed
+
+    def claimed_for_digest(self, claimed):
+        """The receipts claimed for the digest run that claimed them at `claimed`."""
+        return self.filter(status=self.model.Status.DIGESTING, date_claimed=claimed)
+
+    def suppress(self):
+        """
+        Mark the receipts whose recipient's address is suppressed, so nothing
+        is rendered or sent for them, and return how many there were.
+        """
+        SuppressedAddress = self.model._meta.apps.get_model("mail", "SuppressedAddress")
+        return (
+            self.alias(email=Lower("recipient__email"))
+            .filter(email__in=SuppressedAddress.objects.values("address"))
+            .update(status=self.model.Status.SUPPRESSED)
+        )
+
+    def refresh_unread_counts(self):
+        """
+        Recount the unread messages in the thread summaries of the recipients
+        of these receipts, in a single UPDATE.
+        """
+        Message = self.model.message.field.related_model
+        ThreadParticipant = Message.thread.field.related_model.participants.through
+        unread = (
+            self.model.objects.filter(
+                message__thread=OuterRef("thread"), recipient=OuterRef("user"), date_read__isnull=True
+            )
+            .exclude(message__status=Message.Status.DRAFT)
+            .order_by()
+            .values("recipient")
+            .annotate(count=Count("pk"))
+            .values("count")
+        )
+        return ThreadParticipant.objects.filter(
+            thread__in=self.values("message__thread"), user__in=self.values("recipient")
+        ).update(unread_count=Coalesce(Subquery(unread), 0))
+
+    # The mark_* methods below apply to every receipt in the queryset with a
+    # single UPDATE, returning the number of receipts that changed.
+
+    def mark_read(self):
+        updated = self.filter(date_read__isnull=True).update(date_read=timezone.now())
+        if updated:
+            self.refresh_unread_counts()
+        return updated
+
+    def mark_unread(self):
+        updated = self.filter(date_read__isnull=False).update(date_read=None)
+        if updated:
+            self.refresh_unread_counts()
+        return updated
+
+    def mark_archived(self):
+        return self.filter(date_archived__isnull=True).update(date_archived=timezone.now(), date_deleted=None)
+
+    def mark_unarchived(self):
+        return self.filter(Q(date_archived__isnull=False) | Q(date_deleted__isnull=False)).update(
+            date_archived=None, date_deleted=None
+        )
+
+    def mark_deleted(self):
+        return self.filter(date_deleted__isnull=True).update(date_deleted=timezone.now(), date_archived=None)
+
+    def mark_undeleted(self):
+        return self.filter(Q(date_archived__isnull=False) | Q(date_deleted__isnull=False)).update(
+            date_archived=None, date_deleted=None
+        )
+
+
+class AttachmentBlobManager(models.Manager):
+    def store(self, file):
+        """
+        Return the blob holding the contents of `file`, only storing them if
+        no blob with the same contents exists yet.
+        """
+        digest = hashlib.sha256()
+        size = 0
+        for chunk in file.chunks():
+            digest.update(chunk)
+            size += len(chunk)
+        sha256 = digest.hexdigest()
+
+        try:
+            return self.get(pk=sha256)
+        except self.model.DoesNotExist:
+            pass
+
+        name = Path(file.name).name
+        content_type = (
+            getattr(file, "content_type", None) or mimetypes.guess_type(name)[0] or "application/octet-stream"
+        )
+        blob = self.model(sha256=sha256, size=size, content_type=content_type)
+        path = blob.file.field.generate_filename(blob, name)
+        written = not blob.file.storage.exists(path)
+        if written:
+            blob.file.save(name, file, save=False)
+        else:
+            # Left behind by a blob that was never saved; the contents are the same.
+            blob.file.name = path
+        try:
+            with transaction.atomic():
+                blob.save(force_insert=True)
+        except IntegrityError:
+            # Stored by someone else in the meantime
+            if written:
+                blob.file.delete(save=False)
+            return self.get(pk=sha256)
+        return blob
+
+    def release(self, pk):
+        """Drop a reference to the blob, deleting it once nothing refers to it."""
+        self.filter(pk=pk, references__gt=0).update(references=F("references") - 1)
+        for blob in self.filter(pk=pk, references=0):
+            blob.delete()
+
+
+class SuppressedAddressManager(models.Manager):
+    def record_bounce(self, address, diagnostic=""):
+        """Suppress an address that bounced permanently, counting each bounce."""
+        suppressed, created = self.get_or_create(
+            address=address.lower(), defaults={"reason": self.model.Reason.BOUNCE}
+        )
+        self.filter(pk=suppressed.pk).update(
+            bounces=F("bounces") + 1, diagnostic=diagnostic, last_updated=timezone.now()
+        )
+        return suppressed
+
+
+class AttachmentManager(models.Manager):
+    def attach(self, message, file):
+        """Attach an uploaded file to the message, reusing any identical file already stored."""
+        blob = self.model.blob.field.related_model.objects.store(file)
+        return self.create(message=message, blob=blob, name=Path(file.name).name)
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:52
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def update_status_for_previously_sent_messages(apps, schema_editor):
+    Message = apps.get_model("mail", "Message")
+    MessageRecipient = apps.get_model("mail", "MessageRecipient")
+    MessageRecipient.objects.filter(message__status="SENT").update(
+        status="SENT",
+        date_delivered=Subquery(Message.objects.filter(pk=OuterRef("message")).values("date_sent")[:1]),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mail", "0011_alter_message_status"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="messagerecipient",
+            name="date_delivered",
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name="delivered"),
+        ),
+        migrations.AddField(
+            model_name="messagerecipient",
+            name="status",
+            field=models.CharField(
+                choices=[("PENDING", "Pending"), ("SENT", "Sent"), ("FAILED", "Failed")],
+                default="PENDING",
+                editable=False,
+                max_length=8,
+                verbose_name="delivery status",
+            ),
+        ),
+        migrations.RunPython(update_status_for_previously_sent_messages, reverse_code=migrations.RunPython.noop),
+    ]
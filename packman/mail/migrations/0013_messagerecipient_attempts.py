@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mail", "0012_messagerecipient_status"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="messagerecipient",
+            name="attempts",
+            field=models.PositiveSmallIntegerField(default=0, editable=False, verbose_name="delivery attempts"),
+        ),
+        migrations.AddField(
+            model_name="messagerecipient",
+            name="last_error",
+            field=models.TextField(blank=True, editable=False, verbose_name="last delivery error"),
+        ),
+        migrations.AlterField(
+            model_name="messagerecipient",
+            name="status",
+            field=models.CharField(
+                choices=[("PENDING", "Pending"), ("SENT", "Sent"), ("DEFERRED", "Deferred"), ("FAILED", "Failed")],
+                default="PENDING",
+                editable=False,
+                max_length=8,
+                verbose_name="delivery status",
+            ),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:56
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mail", "0013_messagerecipient_attempts"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="message",
+            name="claimed_by",
+            field=models.CharField(blank=True, editable=False, max_length=150, verbose_name="claimed by"),
+        ),
+        migrations.AddField(
+            model_name="message",
+            name="date_claimed",
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name="claimed"),
+        ),
+        migrations.AddIndex(
+            model_name="message",
+            index=models.Index(fields=["status", "date_claimed"], name="mail_messag_status_e6b5c8_idx"),
+        ),
+    ]
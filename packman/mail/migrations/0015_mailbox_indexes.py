@@ -0,0 +1,57 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:03
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mail", "0014_message_claim"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="message",
+            index=models.Index(fields=["-last_updated", "-uuid"], name="mail_message_keyset_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="message",
+            index=models.Index(fields=["author", "-last_updated", "-uuid"], name="mail_message_author_keyset_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="messagerecipient",
+            index=models.Index(
+                condition=models.Q(("date_archived__isnull", True), ("date_deleted__isnull", True)),
+                fields=["recipient", "message"],
+                name="mail_inbox_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="messagerecipient",
+            index=models.Index(
+                condition=models.Q(
+                    ("date_archived__isnull", True), ("date_deleted__isnull", True), ("date_read__isnull", True)
+                ),
+                fields=["recipient", "message"],
+                name="mail_inbox_unread_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="messagerecipient",
+            index=models.Index(
+                condition=models.Q(("date_archived__isnull", False)),
+                fields=["recipient", "message"],
+                name="mail_archives_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="messagerecipient",
+            index=models.Index(
+                condition=models.Q(("date_deleted__isnull", False)),
+                fields=["recipient", "message"],
+                name="mail_trash_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,82 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:08
+
+import html
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.utils.html import strip_tags
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        from django.contrib.postgres.indexes import GinIndex
+        from django.contrib.postgres.search import SearchVector
+
+        Message = apps.get_model("mail", "Message")
+        schema_editor.add_index(
+            Message, GinIndex(SearchVector("search_document", config="english"), name="mail_message_search_idx")
+        )
+    elif schema_editor.connection.vendor == "sqlite":
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE mail_message_fts USING fts5(message_id UNINDEXED, document, tokenize='porter unicode61')"
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute("DROP INDEX IF EXISTS mail_message_search_idx")
+    elif schema_editor.connection.vendor == "sqlite":
+        schema_editor.execute("DROP TABLE IF EXISTS mail_message_fts")
+
+
+def populate_search_documents(apps, schema_editor):
+    Message = apps.get_model("mail", "Message")
+    messages = []
+    for message in Message.objects.only("subject", "body").iterator(chunk_size=500):
+        message.search_document = f"{message.subject}\n{html.unescape(strip_tags(message.body))}"
+        messages.append(message)
+    Message.objects.bulk_update(messages, ["search_document"], batch_size=500)
+
+    if schema_editor.connection.vendor == "sqlite":
+        schema_editor.execute(
+            "INSERT INTO mail_message_fts (message_id, document) SELECT uuid, search_document FROM mail_message"
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mail", "0015_mailbox_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="MessageSearchIndex",
+            fields=[
+                (
+                    "message",
+                    models.OneToOneField(
+                        db_constraint=False,
+                        on_delete=django.db.models.deletion.DO_NOTHING,
+                        primary_key=True,
+                        related_name="search_index",
+                        serialize=False,
+                        to="mail.message",
+                    ),
+                ),
+                ("document", models.TextField()),
+                ("rank", models.FloatField()),
+            ],
+            options={
+                "db_table": "mail_message_fts",
+                "managed": False,
+            },
+        ),
+        migrations.AddField(
+            model_name="message",
+            name="search_document",
+            field=models.TextField(blank=True, editable=False, verbose_name="search document"),
+        ),
+        migrations.RunPython(create_search_index, reverse_code=drop_search_index),
+        migrations.RunPython(populate_search_documents, reverse_code=migrations.RunPython.noop),
+    ]
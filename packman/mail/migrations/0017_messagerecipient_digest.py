@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mail", "0016_message_search"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="messagerecipient",
+            name="status",
+            field=models.CharField(
+                choices=[
+                    ("PENDING", "Pending"),
+                    ("DIGEST", "Awaiting digest"),
+                    ("SENT", "Sent"),
+                    ("DEFERRED", "Deferred"),
+                    ("FAILED", "Failed"),
+                ],
+                default="PENDING",
+                editable=False,
+                max_length=8,
+                verbose_name="delivery status",
+            ),
+        ),
+    ]
@@ -0,0 +1,123 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:22
+
+import hashlib
+import logging
+import mimetypes
+from pathlib import Path
+
+import django.db.models.deletion
+from django.core.files.base import ContentFile
+from django.db import migrations, models
+
+import packman.mail.models
+
+logger = logging.getLogger(__name__)
+
+
+def store_blobs(apps, schema_editor):
+    """
+    Move the contents of every existing attachment into a blob, sharing one
+    blob between identical files. The original files are left in place;
+    attachments whose files have gone missing are dropped, as there is nothing
+    left to store for them.
+    """
+    Attachment = apps.get_model("mail", "Attachment")
+    AttachmentBlob = apps.get_model("mail", "AttachmentBlob")
+
+    blobs = {}
+    for attachment in Attachment.objects.iterator(chunk_size=500):
+        name = Path(attachment.filename.name).name
+        try:
+            with attachment.filename.open("rb") as f:
+                content = f.read()
+        except OSError as e:
+            logger.warning("Dropping attachment %s, its file could not be read: %s", attachment.pk, e)
+            attachment.delete()
+            continue
+        sha256 = hashlib.sha256(content).hexdigest()
+
+        if sha256 not in blobs:
+            blob, created = AttachmentBlob.objects.get_or_create(
+                sha256=sha256,
+                defaults={
+                    "size": len(content),
+                    "content_type": mimetypes.guess_type(name)[0] or "application/octet-stream",
+                },
+            )
+            if created:
+                blob.file.save(name, ContentFile(content), save=True)
+            blobs[sha256] = blob
+
+        attachment.blob = blobs[sha256]
+        attachment.name = name
+        attachment.save(update_fields=("blob", "name"))
+        AttachmentBlob.objects.filter(pk=sha256).update(references=models.F("references") + 1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mail", "0017_messagerecipient_digest"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="AttachmentBlob",
+            fields=[
+                (
+                    "sha256",
+                    models.CharField(
+                        editable=False, max_length=64, primary_key=True, serialize=False, verbose_name="SHA-256"
+                    ),
+                ),
+                (
+                    "file",
+                    models.FileField(
+                        editable=False, upload_to=packman.mail.models.get_blob_upload_to, verbose_name="file"
+                    ),
+                ),
+                ("size", models.PositiveBigIntegerField(editable=False, verbose_name="size")),
+                ("content_type", models.CharField(editable=False, max_length=255, verbose_name="content type")),
+                ("references", models.PositiveIntegerField(default=0, editable=False, verbose_name="references")),
+                ("date_added", models.DateTimeField(auto_now_add=True, verbose_name="added")),
+            ],
+            options={
+                "verbose_name": "Attachment blob",
+                "verbose_name_plural": "Attachment blobs",
+            },
+        ),
+        migrations.AddField(
+            model_name="attachment",
+            name="name",
+            field=models.CharField(
+                default="", help_text="attachments should be under 5mb.", max_length=255, verbose_name="name"
+            ),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name="attachment",
+            name="blob",
+            field=models.ForeignKey(
+                editable=False,
+                null=True,
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="attachments",
+                to="mail.attachmentblob",
+            ),
+        ),
+        migrations.RunPython(store_blobs, reverse_code=migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name="attachment",
+            name="filename",
+        ),
+        migrations.AlterField(
+            model_name="attachment",
+            name="blob",
+            field=models.ForeignKey(
+                editable=False,
+                on_delete=django.db.models.deletion.PROTECT,
+                related_name="attachments",
+                to="mail.attachmentblob",
+            ),
+        ),
+    ]
@@ -0,0 +1,120 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:26
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+
+def summarize_threads(apps, schema_editor):
+    Message = apps.get_model("mail", "Message")
+    MessageRecipient = apps.get_model("mail", "MessageRecipient")
+    Thread = apps.get_model("mail", "Thread")
+    ThreadParticipant = apps.get_model("mail", "ThreadParticipant")
+
+    messages = Message.objects.exclude(status="DRAFT").filter(thread__isnull=False)
+    unread = {
+        (thread, user): count
+        for thread, user, count in MessageRecipient.objects.filter(message__in=messages)
+        .values_list("message__thread", "recipient")
+        .annotate(count=Count("pk", filter=Q(date_read__isnull=True)))
+        .order_by()
+    }
+    for thread, author in messages.values_list("thread", "author").distinct().order_by():
+        unread.setdefault((thread, author), 0)
+    ThreadParticipant.objects.bulk_create(
+        (
+            ThreadParticipant(thread_id=thread, user_id=user, unread_count=count)
+            for (thread, user), count in unread.items()
+        ),
+        batch_size=500,
+    )
+
+    thread_messages = messages.filter(thread=OuterRef("pk")).order_by()
+    Thread.objects.update(
+        last_message=Subquery(thread_messages.order_by("-date_sent", "-date_added").values("pk")[:1]),
+        message_count=Coalesce(Subquery(thread_messages.values("thread").annotate(count=Count("pk")).values("count")), 0),
+        participant_count=Coalesce(
+            Subquery(
+                ThreadParticipant.objects.filter(thread=OuterRef("pk"))
+                .order_by()
+                .values("thread")
+                .annotate(count=Count("pk"))
+                .values("count")
+            ),
+            0,
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mail", "0018_attachment_blobs"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="thread",
+            name="last_message",
+            field=models.ForeignKey(
+                blank=True,
+                editable=False,
+                null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name="+",
+                to="mail.message",
+            ),
+        ),
+        migrations.AddField(
+            model_name="thread",
+            name="message_count",
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name="messages"),
+        ),
+        migrations.AddField(
+            model_name="thread",
+            name="participant_count",
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name="participants"),
+        ),
+        migrations.CreateModel(
+            name="ThreadParticipant",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("unread_count", models.PositiveIntegerField(default=0, verbose_name="unread")),
+                (
+                    "thread",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="thread_participants",
+                        to="mail.thread",
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="thread_participants",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Thread participant",
+                "verbose_name_plural": "Thread participants",
+            },
+        ),
+        migrations.AddField(
+            model_name="thread",
+            name="participants",
+            field=models.ManyToManyField(
+                blank=True, related_name="threads", through="mail.ThreadParticipant", to=settings.AUTH_USER_MODEL
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="threadparticipant",
+            constraint=models.UniqueConstraint(fields=("thread", "user"), name="unique_participant_per_thread"),
+        ),
+        migrations.RunPython(summarize_threads, reverse_code=migrations.RunPython.noop),
+    ]
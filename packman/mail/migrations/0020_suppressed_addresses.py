@@ -0,0 +1,75 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mail", "0019_thread_summary"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SuppressedAddress",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                (
+                    "date_added",
+                    models.DateTimeField(
+                        auto_now_add=True,
+                        help_text="Date and time this entry was first added to the database.",
+                        verbose_name="created",
+                    ),
+                ),
+                (
+                    "last_updated",
+                    models.DateTimeField(
+                        auto_now=True,
+                        help_text="Date and time this entry was last changed in the database.",
+                        verbose_name="modified",
+                    ),
+                ),
+                ("address", models.EmailField(max_length=254, unique=True, verbose_name="email address")),
+                (
+                    "reason",
+                    models.CharField(
+                        choices=[("BOUNCE", "Bounced"), ("MANUAL", "Added by hand")],
+                        default="MANUAL",
+                        max_length=6,
+                        verbose_name="reason",
+                    ),
+                ),
+                ("bounces", models.PositiveIntegerField(default=0, editable=False, verbose_name="bounces")),
+                (
+                    "diagnostic",
+                    models.TextField(
+                        blank=True, help_text="The last bounce's explanation.", verbose_name="diagnostic"
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Suppressed Address",
+                "verbose_name_plural": "Suppressed Addresses",
+                "ordering": ["address"],
+            },
+        ),
+        migrations.AlterField(
+            model_name="messagerecipient",
+            name="status",
+            field=models.CharField(
+                choices=[
+                    ("PENDING", "Pending"),
+                    ("DIGEST", "Awaiting digest"),
+                    ("SUPPRESSED", "Suppressed"),
+                    ("SENT", "Sent"),
+                    ("DEFERRED", "Deferred"),
+                    ("FAILED", "Failed"),
+                ],
+                default="PENDING",
+                editable=False,
+                max_length=10,
+                verbose_name="delivery status",
+            ),
+        ),
+    ]
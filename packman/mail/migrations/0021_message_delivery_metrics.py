@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mail", "0020_suppressed_addresses"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="message",
+            name="delivery_metrics",
+            field=models.JSONField(blank=True, default=dict, editable=False, verbose_name="delivery metrics"),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("mail", "0021_message_delivery_metrics"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="messagerecipient",
+            name="date_claimed",
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name="claimed for digest"),
+        ),
+        migrations.AlterField(
+            model_name="messagerecipient",
+            name="status",
+            field=models.CharField(
+                choices=[
+                    ("PENDING", "Pending"),
+                    ("DIGEST", "Awaiting digest"),
+                    ("DIGESTING", "Sending digest"),
+                    ("SUPPRESSED", "Suppressed"),
+                    ("SENT", "Sent"),
+                    ("DEFERRED", "Deferred"),
+                    ("FAILED", "Failed"),
+                ],
+                default="PENDING",
+                editable=False,
+                max_length=10,
+                verbose_name="delivery status",
+            ),
+        ),
+    ]
@@ -1,17 +1,17 @@
 import html
 import logging
+import time
+from datetime import timedelta
 from pathlib import Path
 
 from django.conf import settings
 from django.contrib import admin
 from django.contrib.auth import get_user_model
 from django.contrib.sites.models import Site
-from django.core import mail
 from django.core.cache import cache
 from django.core.validators import URLValidator
-from django.db import IntegrityError, models, transaction
-from django.db.models import Q
-from django.template.loader import render_to_string
+from django.db import connections, models, transaction
+from django.db.models import F, Q
 from django.urls import reverse
 from django.utils import timezone
 from django.utils.html import strip_tags
@@ -20,13 +20,30 @@ from django.utils.translation import gettext as _
 from tinymce.models import HTMLField
 
 from packman.calendars.models import PackYear
-from packman.committees.models import Committee
+from packman.committees.models import Committee, CommitteeMember
+from packman.core.lookups import Match
 from packman.core.models import TimeStampedModel, TimeStampedUUIDModel
 from packman.dens.models import Den
 from packman.membership.models import Family
 
-from .managers import MessageManager, MessageRecipientQuerySet
-from .utils import ListEmailMessage
+from .delivery import DeliveryMetrics, DeliveryPipeline, message_delivered
+from .managers import (
+    AttachmentBlobManager,
+    AttachmentManager,
+    DistributionListQuerySet,
+    MessageManager,
+    MessageRecipientQuerySet,
+    SuppressedAddressManager,
+    ThreadQuerySet,
+    resolve_members,
+)
+from .utils import (
+    ListEmailMessage,
+    PersonalizedTemplate,
+    create_mime_attachment,
+    make_message_id,
+    make_return_path,
+)
 
 logger = logging.getLogger(__name__)
 User = get_user_model()
@@ -36,6 +53,11 @@ def get_upload_to(instance, filename):
     return _("mail/%(uuid)s/%(file)s") % {"uuid": instance.message.uuid, "file": filename}
 
 
+def get_blob_upload_to(instance, filename):
+    # Keep the extension so the file is served with a sensible content type.
+    return f"mail/blobs/{instance.sha256[:2]}/{instance.sha256}{Path(filename).suffix.lower()}"
+
+
 class Mailbox(models.TextChoices):
     INBOX = "inbox", _("Inbox")
     DRAFTS = "drafts", _("Drafts")
@@ -70,6 +92,8 @@ class DistributionList(TimeStampedModel):
         Committee, related_name="distribution_list", related_query_name="distribution_list", blank=True
     )
 
+    objects = DistributionListQuerySet.as_manager()
+
     class Meta:
         ordering = ["name"]
         verbose_name = _("Distribution List")
@@ -81,17 +105,19 @@ class DistributionList(TimeStampedModel):
     def get_default_email(self):
         return self.addresses.get(is_default=True)
 
+    def get_member_ids(self):
+        """The pks of the list's members, cached until membership changes."""
+        return resolve_members([self])[self.pk]
+
     def get_members(self):
         if self.is_all:
             return User.objects.active()
 
-        return (
-            User.objects.active()
-            .filter(
-                Q(committee_membership__year=PackYear.objects.current(), committee__in=self.committees.all())
-                | Q(family__in=Family.objects.in_den(self.dens.all()))
-            )
-            .distinct()
+        committee_members = CommitteeMember.objects.filter(
+            year=PackYear.objects.current(), committee__in=self.committees.all()
+        ).values("member")
+        return User.objects.active().filter(
+            Q(pk__in=committee_members) | Q(family__in=Family.objects.in_den(self.dens.all()))
         )
 
 
@@ -133,9 +159,22 @@ class EmailAddress(TimeStampedModel):
 
 class Thread(TimeStampedUUIDModel):
     """
-    A simple model to track a thread of messages.
+    A thread of messages: a message and all the replies to it.
+
+    A summary of the thread's messages is kept on the thread, and on each
+    participant for what they have not read, so conversations can be listed
+    without visiting their messages.
     """
 
+    last_message = models.ForeignKey(
+        "Message", on_delete=models.SET_NULL, related_name="+", blank=True, null=True, editable=False
+    )
+    message_count = models.PositiveIntegerField(_("messages"), default=0, editable=False)
+    participant_count = models.PositiveIntegerField(_("participants"), default=0, editable=False)
+    participants = models.ManyToManyField(User, related_name="threads", through="ThreadParticipant", blank=True)
+
+    objects = ThreadQuerySet.as_manager()
+
     class Meta:
         verbose_name = _("Thread")
         verbose_name_plural = _("Threads")
@@ -143,6 +182,28 @@ class Thread(TimeStampedUUIDModel):
     def __str__(self):
         return str(self.pk)
 
+    def get_absolute_url(self):
+        return reverse("mail:thread", kwargs={"pk": self.pk})
+
+
+class ThreadParticipant(models.Model):
+    """
+    An author or recipient of a message in a thread, and how many of the
+    thread's messages they have yet to read.
+    """
+
+    thread = models.ForeignKey(Thread, on_delete=models.CASCADE, related_name="thread_participants")
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="thread_participants")
+    unread_count = models.PositiveIntegerField(_("unread"), default=0)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=("thread", "user"), name="unique_participant_per_thread")]
+        verbose_name = _("Thread participant")
+        verbose_name_plural = _("Thread participants")
+
+    def __str__(self):
+        return str(self.user)
+
 
 class Message(TimeStampedUUIDModel):
     """
@@ -176,10 +237,20 @@ class Message(TimeStampedUUIDModel):
     )
     date_sent = models.DateTimeField(_("sent"), blank=True, null=True)
     status = models.CharField(_("status"), max_length=8, choices=Status.choices, default=Status.DRAFT, editable=False)
+    claimed_by = models.CharField(_("claimed by"), max_length=150, blank=True, editable=False)
+    date_claimed = models.DateTimeField(_("claimed"), blank=True, null=True, editable=False)
+    search_document = models.TextField(_("search document"), blank=True, editable=False)
+    delivery_metrics = models.JSONField(_("delivery metrics"), default=dict, blank=True, editable=False)
 
     objects = MessageManager()
 
     class Meta:
+        indexes = [
+            models.Index(fields=["status", "date_claimed"]),
+            # keyset pagination of mailboxes, newest first
+            models.Index(fields=["-last_updated", "-uuid"], name="mail_message_keyset_idx"),
+            models.Index(fields=["author", "-last_updated", "-uuid"], name="mail_message_author_keyset_idx"),
+        ]
         get_latest_by = "last_updated"
         ordering = ["-last_updated"]
         verbose_name = _("Message")
@@ -191,7 +262,36 @@ class Message(TimeStampedUUIDModel):
     def save(self, **kwargs):
         if not self.thread:
             self.thread = self.parent.thread if self.parent else Thread.objects.create()
+        self.search_document = f"{self.subject}\n{self.get_plaintext_body()}"
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and {"subject", "body"} & set(update_fields):
+            kwargs["update_fields"] = {*update_fields, "search_document"}
         super().save(**kwargs)
+        if update_fields is None or "search_document" in kwargs["update_fields"]:
+            self.update_search_index()
+
+    def update_search_index(self):
+        """
+        Copy the search document into the SQLite full-text index. Postgres
+        indexes the search_document column itself, so needs nothing more.
+        """
+        connection = connections[self._state.db]
+        if connection.vendor == "sqlite":
+            message_id = self._meta.pk.get_db_prep_value(self.pk, connection)
+            with connection.cursor() as cursor:
+                cursor.execute("DELETE FROM mail_message_fts WHERE message_id = %s", [message_id])
+                cursor.execute(
+                    "INSERT INTO mail_message_fts (message_id, document) VALUES (%s, %s)",
+                    [message_id, self.search_document],
+                )
+
+    def delete_search_index(self):
+        """Remove the message from the SQLite full-text index once it is deleted."""
+        connection = connections[self._state.db]
+        if connection.vendor == "sqlite":
+            message_id = self._meta.pk.get_db_prep_value(self.pk, connection)
+            with connection.cursor() as cursor:
+                cursor.execute("DELETE FROM mail_message_fts WHERE message_id = %s", [message_id])
 
     def get_absolute_url(self):
         return reverse("mail:detail", kwargs={"pk": self.pk})
@@ -204,58 +304,180 @@ class Message(TimeStampedUUIDModel):
         elif self.status == Message.Status.SENDING:
             return Mailbox.OUTBOX
 
+    def queue(self):
+        """Hand the message over to the mail worker to be sent in the background."""
+        self.status = Message.Status.QUEUED
+        self.save(update_fields=("status",))
+
+    def get_delivery_progress(self):
+        """
+        Summarize how far along sending the message is, counting its
+        recipients by delivery status in a single query. The queue depth is
+        the number of deliveries still outstanding, and the rate is emails
+        delivered per second over the last minute.
+        """
+        Status = MessageRecipient.Status
+        progress = self.message_recipients.aggregate(
+            recipients=models.Count("pk"),
+            delivered=models.Count("pk", filter=Q(status=Status.SENT)),
+            failed=models.Count("pk", filter=Q(status=Status.FAILED)),
+            deferred=models.Count("pk", filter=Q(status=Status.DEFERRED)),
+            digest=models.Count("pk", filter=Q(status__in=(Status.DIGEST, Status.DIGESTING))),
+            suppressed=models.Count("pk", filter=Q(status=Status.SUPPRESSED)),
+            queued=models.Count("pk", filter=Q(status__in=(Status.PENDING, Status.DEFERRED))),
+            recent=models.Count("pk", filter=Q(date_delivered__gte=timezone.now() - timedelta(minutes=1))),
+        )
+        progress["rate"] = round(progress.pop("recent") / 60, 1)
+        progress["status"] = self.status
+        progress["status_display"] = self.get_status_display()
+        progress["done"] = self.status in (Message.Status.SENT, Message.Status.FAILED)
+        return progress
+
     def send(self):
+        metrics = DeliveryMetrics()
         # ensure all mailboxes are expanded
-        self.expand_distribution_lists()
+        with metrics.timer("expand_time"):
+            metrics.expanded = self.expand_distribution_lists()
         if not self.recipients.exists():
             raise AttributeError(_("Cannot send an Email with no recipients."))
 
-        # open a connection to the mail server
-        with mail.get_connection() as connection:
-            messages = self._personalize_messages()
-            succeeded = connection.send_messages(messages)
-            logger.info(_("Sent %d emails") % succeeded)
-
-        # Mark the message as sent
-        self.date_sent = timezone.now()
-        self.status = Message.Status.SENT
-        self.save()
+        # addresses known to be dead are skipped before any work is done for them
+        self.message_recipients.filter(status=MessageRecipient.Status.PENDING).suppress()
+
+        # digest subscribers get their list mail in tomorrow's digest instead
+        self.message_recipients.filter(
+            status=MessageRecipient.Status.PENDING, from_distro=True, recipient__mail_digest=True
+        ).update(status=MessageRecipient.Status.DIGEST)
+
+        # stream personalized copies to the mail server
+        delivery = DeliveryPipeline(self, metrics=metrics).run()
+        self.delivery_metrics = delivery.get_metrics()
+        logger.info(
+            _(
+                "Sent %(sent)d emails in %(elapsed).2fs (%(throughput).1f/s, %(throttled).1fs throttled), "
+                "%(deferred)d deferred, %(failed)d failed"
+            )
+            % {
+                "sent": delivery.sent,
+                "elapsed": delivery.elapsed,
+                "throughput": delivery.throughput,
+                "throttled": delivery.throttled,
+                "deferred": delivery.deferred,
+                "failed": delivery.failed,
+            }
+        )
 
-    def _personalize_messages(self):
-        messages = []
+        if self.message_recipients.filter(
+            status__in=(MessageRecipient.Status.PENDING, MessageRecipient.Status.DEFERRED)
+        ).exists():
+            # Some deliveries are still outstanding, leave the message to be resumed later.
+            self.status = Message.Status.SENDING
+            self.save(update_fields=("status", "delivery_metrics"))
+        else:
+            # Mark the message as sent, unless not a single copy could be delivered
+            self.date_sent = timezone.now()
+            if self.message_recipients.filter(
+                status__in=(
+                    MessageRecipient.Status.SENT,
+                    MessageRecipient.Status.DIGEST,
+                    MessageRecipient.Status.DIGESTING,
+                )
+            ).exists():
+                self.status = Message.Status.SENT
+            else:
+                self.status = Message.Status.FAILED
+            self.save()
 
+        # the message is no longer a draft, so it now counts towards its thread
+        Thread.objects.add_message(self)
+        message_delivered.send(sender=Message, message=self, metrics=self.delivery_metrics)
+        return delivery
+
+    def send_claimed(self):
+        """
+        Send a message claimed from the queue. Delivery problems are recorded
+        per recipient, so anything raised here would only happen again: the
+        message is marked failed instead of being left to be claimed over and
+        over, and the error re-raised for the caller to report.
+        """
+        try:
+            return self.send()
+        except Exception:
+            self.status = Message.Status.FAILED
+            self.save(update_fields=("status",))
+            raise
+
+    def heartbeat(self):
+        """Let other workers know the claim on this message is still live."""
+        if self.claimed_by:
+            self.date_claimed = timezone.now()
+            Message.objects.filter(pk=self.pk, claimed_by=self.claimed_by).update(date_claimed=self.date_claimed)
+
+    def _personalize_messages(self, message_recipients, metrics=None):
+        """
+        Generate a (MessageRecipient pk, email) pair for each of the given
+        message recipients.
+
+        The body, list settings and attachments are prepared once and shared
+        by every copy; only the recipient's name and address are filled in
+        per copy. DeliveryMetrics, when given, records the time spent reading
+        attachments and rendering each copy, and the size of the copies.
+        """
+        metrics = metrics or DeliveryMetrics()
         protocol = "https" if settings.CSRF_COOKIE_SECURE else "http"
         site = Site.objects.get_current()
-        author_name = self.author.__str__()
-        author_email = self.author.email
+        list_settings = ListSettings.current()
+        reply_to = [f"{self.author.__str__()} <{self.author.email}>"]
         distros_string = ", ".join(self.distribution_lists.values_list("name", flat=True))
         subject = f"[{distros_string}] {self.subject}"
-
-        for recipient in self.recipients.all():
-            logger.info(_("Generating an email copy for %s") % recipient)
-
-            # Personalize the email for each recipient.
-            context = {"site": site, "message": self, "recipient": recipient, "protocol": protocol}
-
-            plaintext = render_to_string("mail/message_body.txt", context)
-            richtext = render_to_string("mail/message_body.html", context)
+        # let replies find their way back into the thread
+        headers = {"Message-ID": make_message_id(self.pk, site.domain)}
+        if self.parent_id:
+            headers["In-Reply-To"] = headers["References"] = make_message_id(self.parent_id, site.domain)
+        list_addresses = EmailAddress.objects.filter(
+            distribution_list__message_distribution_list__message=self, is_default=True
+        ).values_list("address", flat=True)
+        if list_addresses:
+            headers["List-Post"] = ", ".join(f"<mailto:{address}>" for address in list_addresses)
+
+        context = {"site": site, "message": self, "protocol": protocol}
+        plaintext = PersonalizedTemplate("mail/message_body.txt", context)
+        richtext = PersonalizedTemplate("mail/message_body.html", context, autoescape=True)
+        # read each distinct file once, however many times it is attached
+        contents = {}
+        attachments = []
+        with metrics.timer("attachment_time"):
+            for attachment in self.attachments.select_related("blob"):
+                if attachment.blob_id not in contents:
+                    contents[attachment.blob_id] = attachment.blob.read()
+                attachments.append(attachment.get_mime_attachment(contents[attachment.blob_id]))
+        attachments_size = sum(len(attachment.get_payload()) for attachment in attachments)
+
+        for message_recipient in message_recipients:
+            start = time.perf_counter()
+            recipient = message_recipient.recipient
+            logger.debug(_("Generating an email copy for %s") % recipient)
 
             # compose the email
+            body = plaintext.render(recipient)
+            html_body = richtext.render(recipient)
             msg = ListEmailMessage(
                 subject,
-                plaintext,
+                body,
                 to=[f"{recipient.__str__()} <{recipient.email}>"],
-                reply_to=[f"{author_name} <{author_email}>"],
-                alternatives=[(richtext, "text/html")],
-                settings=ListSettings.current(),
+                reply_to=reply_to,
+                headers=headers.copy(),
+                alternatives=[(html_body, "text/html")],
+                attachments=attachments,
+                settings=list_settings,
+                site=site,
+                return_path=make_return_path(recipient),
+            )
+            metrics.record_copy(
+                time.perf_counter() - start, len(body.encode()) + len(html_body.encode()) + attachments_size
             )
 
-            # add any attachments
-            for attachment in self.attachments.all():
-                msg.attach_file(attachment.filename.path)
-
-            messages.append(msg)
-        return messages
+            yield message_recipient.pk, msg
 
     @admin.display(boolean=True, description=_("sent"))
     def sent(self):
@@ -277,58 +499,182 @@ class Message(TimeStampedUUIDModel):
         )
         return recipients.union(distros)
 
-    def expand_distribution_lists(self):
-        # Create unique MessageRecipient instances for each DistributionList in the message.
-        for delivery, label in Message.Delivery.choices:
-            for distribution_list in self.distribution_lists.filter(message_distribution_list__delivery=delivery):
-                for member in distribution_list.get_members():
-                    try:
-                        with transaction.atomic():
-                            MessageRecipient.objects.create(
-                                message=self, recipient=member, delivery=delivery, from_distro=True
-                            ).distros.add(distribution_list)
-                    except IntegrityError:
-                        # The member is already a recipient of the message,
-                        # check that we have the delivery level correct.
-                        recipient = MessageRecipient.objects.get(message=self, recipient=member)
-                        recipient.distros.add(distribution_list)
-                        if recipient.delivery < delivery:
-                            recipient.delivery = delivery
-                            recipient.save()
+    def expand_distribution_lists(self, batch_size=None):
+        """
+        Create unique MessageRecipient instances for each member of the
+        message's distribution lists.
+
+        Members of every list are resolved at once and delivery levels are
+        settled in memory, so the number of queries stays fixed no matter how
+        many members the lists contain. Returns the number of members reached
+        through the lists.
+        """
+        distribution_lists = DistributionList.objects.filter(message_distribution_list__message=self).annotate(
+            delivery=F("message_distribution_list__delivery")
+        )
+        members = distribution_lists.resolve_members()
+
+        # Work out the highest delivery level and every list for each member.
+        expanded = {}
+        for distribution_list in distribution_lists:
+            for member_pk in members[distribution_list.pk]:
+                delivery, distros = expanded.setdefault(member_pk, [distribution_list.delivery, set()])
+                if delivery < distribution_list.delivery:
+                    expanded[member_pk][0] = distribution_list.delivery
+                distros.add(distribution_list.pk)
+
+        with transaction.atomic():
+            existing = {
+                recipient.recipient_id: recipient
+                for recipient in MessageRecipient.objects.filter(message=self).only("pk", "recipient", "delivery")
+            }
+
+            # Members who are already recipients may need their delivery level upgraded.
+            upgraded = []
+            for member_pk, recipient in existing.items():
+                if member_pk in expanded and recipient.delivery < expanded[member_pk][0]:
+                    recipient.delivery = expanded[member_pk][0]
+                    upgraded.append(recipient)
+            if upgraded:
+                MessageRecipient.objects.bulk_update(upgraded, ["delivery"], batch_size=batch_size)
+
+            MessageRecipient.objects.bulk_create(
+                [
+                    MessageRecipient(message=self, recipient_id=member_pk, delivery=delivery, from_distro=True)
+                    for member_pk, (delivery, distros) in expanded.items()
+                    if member_pk not in existing
+                ],
+                batch_size=batch_size,
+                ignore_conflicts=True,
+            )
+
+            # Link each recipient to the distribution list(s) they were reached through.
+            recipient_pks = dict(
+                MessageRecipient.objects.filter(message=self, recipient__in=expanded.keys()).values_list(
+                    "recipient", "pk"
+                )
+            )
+            MessageRecipientDistribution = MessageRecipient.distros.through
+            MessageRecipientDistribution.objects.bulk_create(
+                [
+                    MessageRecipientDistribution(
+                        messagerecipient_id=recipient_pks[member_pk], distributionlist_id=distribution_list_pk
+                    )
+                    for member_pk, (delivery, distros) in expanded.items()
+                    for distribution_list_pk in distros
+                ],
+                batch_size=batch_size,
+                ignore_conflicts=True,
+            )
+        return len(expanded)
 
     def mark_read(self, recipient):
-        MessageRecipient.objects.get(message=self, recipient=recipient).mark_read()
+        MessageRecipient.objects.filter(message=self, recipient=recipient).mark_read()
 
     def mark_unread(self, recipient):
-        MessageRecipient.objects.get(message=self, recipient=recipient).mark_unread()
+        MessageRecipient.objects.filter(message=self, recipient=recipient).mark_unread()
 
     def mark_archived(self, recipient):
-        MessageRecipient.objects.get(message=self, recipient=recipient).mark_archived()
+        MessageRecipient.objects.filter(message=self, recipient=recipient).mark_archived()
 
     def mark_unarchived(self, recipient):
-        MessageRecipient.objects.get(message=self, recipient=recipient).mark_unarchived()
+        MessageRecipient.objects.filter(message=self, recipient=recipient).mark_unarchived()
 
     def mark_deleted(self, recipient):
-        MessageRecipient.objects.get(message=self, recipient=recipient).mark_deleted()
+        MessageRecipient.objects.filter(message=self, recipient=recipient).mark_deleted()
 
     def mark_undeleted(self, recipient):
-        MessageRecipient.objects.get(message=self, recipient=recipient).mark_undeleted()
+        MessageRecipient.objects.filter(message=self, recipient=recipient).mark_undeleted()
+
+
+class MessageSearchIndex(models.Model):
+    """
+    The FTS5 virtual table indexing each message's search document when
+    running on SQLite. It is created by migration and written to only by
+    Message.update_search_index() and delete_search_index(), but can be
+    joined to for searching.
+    """
+
+    message = models.OneToOneField(
+        Message,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        primary_key=True,
+        related_name="search_index",
+    )
+    document = models.TextField()
+    rank = models.FloatField()
+
+    class Meta:
+        managed = False
+        db_table = "mail_message_fts"
+
+
+MessageSearchIndex._meta.get_field("document").register_lookup(Match)
+
+
+class AttachmentBlob(models.Model):
+    """
+    The contents of an attached file, stored once however many messages it is
+    attached to and addressed by the SHA-256 hash of those contents. Blobs
+    count the attachments referring to them, and are deleted along with their
+    file when the last of those goes.
+    """
+
+    sha256 = models.CharField(_("SHA-256"), max_length=64, primary_key=True, editable=False)
+    file = models.FileField(_("file"), upload_to=get_blob_upload_to, editable=False)
+    size = models.PositiveBigIntegerField(_("size"), editable=False)
+    content_type = models.CharField(_("content type"), max_length=255, editable=False)
+    references = models.PositiveIntegerField(_("references"), default=0, editable=False)
+    date_added = models.DateTimeField(_("added"), auto_now_add=True)
+
+    objects = AttachmentBlobManager()
+
+    class Meta:
+        verbose_name = _("Attachment blob")
+        verbose_name_plural = _("Attachment blobs")
+
+    def __str__(self):
+        return self.sha256
+
+    def read(self):
+        with self.file.open("rb") as f:
+            return f.read()
 
 
 class Attachment(models.Model):
     """
-    A simple model to track message attachments.
+    A file attached to a message, under the name it was uploaded with.
     """
 
     message = models.ForeignKey(Message, on_delete=models.CASCADE, related_name="attachments")
-    filename = models.FileField(_("file"), upload_to=get_upload_to, help_text=_("attachments should be under 5mb."))
+    blob = models.ForeignKey(AttachmentBlob, on_delete=models.PROTECT, related_name="attachments", editable=False)
+    name = models.CharField(_("name"), max_length=255, help_text=_("attachments should be under 5mb."))
+
+    objects = AttachmentManager()
 
     class Meta:
         verbose_name = _("Attachment")
         verbose_name_plural = _("Attachments")
 
     def __str__(self):
-        return Path(self.filename.name).name
+        return self.name
+
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if adding:
+                AttachmentBlob.objects.filter(pk=self.blob_id).update(references=F("references") + 1)
+
+    @property
+    def url(self):
+        return self.blob.file.url
+
+    def get_mime_attachment(self, content=None):
+        return create_mime_attachment(
+            self.name, self.blob.read() if content is None else content, self.blob.content_type
+        )
 
 
 class MessageRecipient(models.Model):
@@ -336,6 +682,15 @@ class MessageRecipient(models.Model):
     An intermediate through model to track an individual member's copy of a message.
     """
 
+    class Status(models.TextChoices):
+        PENDING = "PENDING", _("Pending")
+        DIGEST = "DIGEST", _("Awaiting digest")
+        DIGESTING = "DIGESTING", _("Sending digest")
+        SUPPRESSED = "SUPPRESSED", _("Suppressed")
+        SENT = "SENT", _("Sent")
+        DEFERRED = "DEFERRED", _("Deferred")
+        FAILED = "FAILED", _("Failed")
+
     delivery = models.CharField("", max_length=3, choices=Message.Delivery.choices, default=Message.Delivery.TO)
     message = models.ForeignKey(
         Message, on_delete=models.CASCADE, related_name="message_recipients", related_query_name="message_recipient"
@@ -357,11 +712,37 @@ class MessageRecipient(models.Model):
     date_read = models.DateTimeField(_("read"), blank=True, null=True)
     date_archived = models.DateTimeField(_("archived"), blank=True, null=True)
     date_deleted = models.DateTimeField(_("deleted"), blank=True, null=True)
+    status = models.CharField(
+        _("delivery status"), max_length=10, choices=Status.choices, default=Status.PENDING, editable=False
+    )
+    date_delivered = models.DateTimeField(_("delivered"), blank=True, null=True, editable=False)
+    attempts = models.PositiveSmallIntegerField(_("delivery attempts"), default=0, editable=False)
+    last_error = models.TextField(_("last delivery error"), blank=True, editable=False)
+    date_claimed = models.DateTimeField(_("claimed for digest"), blank=True, null=True, editable=False)
 
     objects = MessageRecipientQuerySet.as_manager()
 
     class Meta:
         constraints = [models.UniqueConstraint(fields=("message", "recipient"), name="unique_message_per_recipient")]
+        indexes = [
+            # one partial index per received folder, matching MessageQuerySet's filters
+            models.Index(
+                fields=["recipient", "message"],
+                condition=Q(date_archived__isnull=True, date_deleted__isnull=True),
+                name="mail_inbox_idx",
+            ),
+            models.Index(
+                fields=["recipient", "message"],
+                condition=Q(date_read__isnull=True, date_archived__isnull=True, date_deleted__isnull=True),
+                name="mail_inbox_unread_idx",
+            ),
+            models.Index(
+                fields=["recipient", "message"], condition=Q(date_archived__isnull=False), name="mail_archives_idx"
+            ),
+            models.Index(
+                fields=["recipient", "message"], condition=Q(date_deleted__isnull=False), name="mail_trash_idx"
+            ),
+        ]
         verbose_name = _("Message Recipient")
         verbose_name_plural = _("Message Recipients")
 
@@ -396,11 +777,13 @@ class MessageRecipient(models.Model):
     def mark_read(self):
         if not self.date_read:
             self.date_read = timezone.now()
-            self.save()
+            if MessageRecipient.objects.filter(pk=self.pk, date_read__isnull=True).update(date_read=self.date_read):
+                MessageRecipient.objects.filter(pk=self.pk).refresh_unread_counts()
 
     def mark_unread(self):
         self.date_read = None
         self.save()
+        MessageRecipient.objects.filter(pk=self.pk).refresh_unread_counts()
 
     def mark_archived(self):
         if not self.date_archived:
@@ -449,6 +832,37 @@ class MessageDistribution(models.Model):
         return self.distribution_list.__str__()
 
 
+class SuppressedAddress(TimeStampedModel):
+    """
+    An email address that no mail is sent to, because it bounced permanently
+    or was added by hand.
+    """
+
+    class Reason(models.TextChoices):
+        BOUNCE = "BOUNCE", _("Bounced")
+        MANUAL = "MANUAL", _("Added by hand")
+
+    address = models.EmailField(_("email address"), unique=True)
+    reason = models.CharField(_("reason"), max_length=6, choices=Reason.choices, default=Reason.MANUAL)
+    bounces = models.PositiveIntegerField(_("bounces"), default=0, editable=False)
+    diagnostic = models.TextField(_("diagnostic"), blank=True, help_text=_("The last bounce's explanation."))
+
+    objects = SuppressedAddressManager()
+
+    class Meta:
+        ordering = ["address"]
+        verbose_name = _("Suppressed Address")
+        verbose_name_plural = _("Suppressed Addresses")
+
+    def __str__(self):
+        return self.address
+
+    def save(self, **kwargs):
+        # Addresses are compared case-insensitively.
+        self.address = self.address.lower()
+        super().save(**kwargs)
+
+
 class ListSettings(TimeStampedModel):
     """
     A simple model to track settings for email lists
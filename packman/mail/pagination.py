@@ -0,0 +1,68 @@
+import base64
+import uuid
+from datetime import datetime
+
+from django.db.models import Q
+from django.http import Http404
+from django.utils.translation import gettext as _
+
+
+def encode_cursor(message):
+    """Encode a message's position in a mailbox as an opaque, URL-safe cursor."""
+    position = f"{message.last_updated.isoformat()}|{message.pk.hex}"
+    return base64.urlsafe_b64encode(position.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    """Return the (last_updated, uuid) position encoded in `cursor`."""
+    try:
+        position = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        last_updated, pk = position.split("|")
+        return datetime.fromisoformat(last_updated), uuid.UUID(pk)
+    except ValueError:
+        # binascii.Error and UnicodeDecodeError are both ValueErrors
+        raise Http404(_("Invalid cursor"))
+
+
+class KeysetPage:
+    def __init__(self, object_list, next_cursor, paginator):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.paginator = paginator
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+
+class KeysetPaginator:
+    """
+    Page through messages newest first, seeking past the (last_updated, uuid)
+    of the last message on the previous page instead of counting an OFFSET.
+    Each page costs the same however far back in a mailbox it is.
+
+    Accepts the same arguments as Django's Paginator so it can stand in as a
+    ListView's paginator_class, though orphans are not supported.
+    """
+
+    ordering = ("-last_updated", "-uuid")
+
+    def __init__(self, object_list, per_page, orphans=0, allow_empty_first_page=True):
+        self.object_list = object_list.order_by(*self.ordering)
+        self.per_page = int(per_page)
+
+    def page(self, cursor=None):
+        messages = self.object_list
+        if cursor:
+            last_updated, pk = decode_cursor(cursor)
+            messages = messages.filter(Q(last_updated__lt=last_updated) | Q(last_updated=last_updated, uuid__lt=pk))
+
+        # Fetch one extra row to find out whether there is a further page.
+        object_list = list(messages[: self.per_page + 1])
+        next_cursor = encode_cursor(object_list[self.per_page - 1]) if len(object_list) > self.per_page else None
+        return KeysetPage(object_list[: self.per_page], next_cursor, self)
@@ -0,0 +1,79 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from packman.committees.models import CommitteeMember
+from packman.dens.models import Membership
+from packman.membership.models import Adult, Scout
+from packman.membership.signals import members_changed
+
+from .managers import invalidate_distribution_list_members
+from .models import Attachment, AttachmentBlob, DistributionList, Message, Thread
+
+
+def changes_any(update_fields, fields):
+    """Whether a save touching `update_fields` (None meaning all) could change any of `fields`."""
+    return update_fields is None or not update_fields.isdisjoint(fields)
+
+
+@receiver(post_save, sender=Membership)
+@receiver(post_delete, sender=Membership)
+@receiver(post_save, sender=CommitteeMember)
+@receiver(post_delete, sender=CommitteeMember)
+@receiver(post_save, sender=DistributionList)
+@receiver(post_delete, sender=DistributionList)
+@receiver(post_delete, sender=Adult)
+@receiver(post_delete, sender=Scout)
+@receiver(members_changed)
+def membership_changed(sender, **kwargs):
+    invalidate_distribution_list_members()
+
+
+@receiver(m2m_changed, sender=DistributionList.dens.through)
+@receiver(m2m_changed, sender=DistributionList.committees.through)
+def selections_changed(sender, action, **kwargs):
+    if action.startswith("post_"):
+        invalidate_distribution_list_members()
+
+
+@receiver(post_save, sender=Adult)
+def adult_saved(sender, raw=False, update_fields=None, **kwargs):
+    # Skip the raw saves of loading fixtures, as the membership receivers do.
+    if raw:
+        return
+    # Logging in saves last_login alone, which has no bearing on any list.
+    if changes_any(update_fields, {"is_active", "family", "family_id"}):
+        invalidate_distribution_list_members()
+
+
+@receiver(post_save, sender=Scout)
+def scout_saved(sender, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+    if changes_any(update_fields, {"status", "family", "family_id"}):
+        invalidate_distribution_list_members()
+
+
+@receiver(post_delete, sender=Attachment)
+def attachment_deleted(sender, instance, **kwargs):
+    AttachmentBlob.objects.release(instance.blob_id)
+
+
+@receiver(post_delete, sender=AttachmentBlob)
+def blob_deleted(sender, instance, **kwargs):
+    # Only remove the file once the deletion is sure to stick, and only if the
+    # same contents haven't been stored again since, reusing the same file.
+    sha256 = instance.pk
+
+    def delete_file():
+        if not AttachmentBlob.objects.filter(pk=sha256).exists():
+            instance.file.delete(save=False)
+
+    transaction.on_commit(delete_file)
+
+
+@receiver(post_delete, sender=Message)
+def message_deleted(sender, instance, **kwargs):
+    instance.delete_search_index()
+    # Wait for any cascade to finish, which may take the thread or its participants with it.
+    transaction.on_commit(lambda: Thread.objects.filter(pk=instance.thread_id).refresh_summaries())
@@ -7,10 +7,14 @@ from .views import (
     MessageDetailView,
     MessageDraftsView,
     MessageInboxView,
+    MessageSearchView,
     MessageSendingView,
     MessageSentView,
     MessageTrashView,
     MessageUpdateView,
+    ThreadDetailView,
+    ThreadListView,
+    bulk_update,
 )
 
 app_name = "mail"
@@ -22,6 +26,10 @@ urlpatterns = [
     path("trash/", MessageTrashView.as_view(), name="trash"),
     path("drafts/", MessageDraftsView.as_view(), name="drafts"),
     path("outbox/", MessageSendingView.as_view(), name="outbox"),
+    path("bulk/", bulk_update, name="bulk-update"),
+    path("search/", MessageSearchView.as_view(), name="search"),
+    path("conversations/", ThreadListView.as_view(), name="threads"),
+    path("conversations/<uuid:pk>/", ThreadDetailView.as_view(), name="thread"),
     path("<uuid:pk>/", MessageDetailView.as_view(), name="detail"),
     path("<uuid:pk>/edit/", MessageUpdateView.as_view(), name="update"),
     path("<uuid:pk>/delete/", MessageDeleteView.as_view(), name="delete"),
@@ -1,12 +1,115 @@
 import logging
+import mimetypes
+import re
+import secrets
+import uuid
+from email import encoders
+from email.mime.base import MIMEBase
 
+from django.conf import settings
 from django.contrib.sites.models import Site
 from django.core.mail import EmailMultiAlternatives
+from django.template.loader import render_to_string
 from django.urls import reverse
+from django.utils.html import escape
 
 logger = logging.getLogger(__name__)
 
 
+def create_mime_attachment(filename, content, mimetype=None):
+    """
+    Build a base64 encoded MIME attachment. The part can be shared between any
+    number of outgoing emails, so the content only has to be encoded once.
+    """
+    mimetype = mimetype or mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    attachment = MIMEBase(*mimetype.split("/", 1))
+    attachment.set_payload(content)
+    encoders.encode_base64(attachment)
+    attachment.add_header("Content-Disposition", "attachment", filename=filename)
+    return attachment
+
+
+def make_message_id(pk, domain):
+    """The Message-ID given to every copy of a message, so replies can be traced back to it."""
+    return f"<{pk}@{domain}>"
+
+
+def parse_message_id(value, domain):
+    """Return the message pk from a Message-ID made by make_message_id(), or None for any other."""
+    match = re.fullmatch(r"\s*<([0-9a-fA-F-]{32,36})@([^>]+)>\s*", value or "")
+    if not match or match[2].lower() != domain.lower():
+        return None
+    try:
+        return uuid.UUID(match[1])
+    except ValueError:
+        return None
+
+
+def make_return_path(recipient):
+    """
+    The envelope sender for mail to `recipient`: the bounce address with the
+    recipient's pk added, so a bounce shows whose address failed (VERP).
+    Returns None when no bounce address is configured.
+    """
+    if not settings.MAIL_BOUNCE_ADDRESS:
+        return None
+    local, domain = settings.MAIL_BOUNCE_ADDRESS.rsplit("@", 1)
+    return f"{local}+{recipient.pk.hex}@{domain}"
+
+
+def parse_return_path(address):
+    """Return the recipient pk from an address made by make_return_path(), or None for any other."""
+    if not settings.MAIL_BOUNCE_ADDRESS or not address:
+        return None
+    local, domain = settings.MAIL_BOUNCE_ADDRESS.rsplit("@", 1)
+    match = re.fullmatch(rf"{re.escape(local)}\+([0-9a-f]{{32}})@{re.escape(domain)}", address, re.IGNORECASE)
+    return uuid.UUID(match[1]) if match else None
+
+
+class RecipientPlaceholder:
+    """
+    Stands in for the recipient when rendering a template shared by every copy
+    of a message. Its fields render as markers carrying `token`, which no
+    message an author writes can be expected to contain.
+    """
+
+    def __init__(self, token):
+        self.token = token
+        self.short_name = self.marker("short_name")
+        self.email = self.marker("email")
+
+    def __str__(self):
+        return self.marker("name")
+
+    def marker(self, field):
+        return f"%%{self.token}.{field}%%"
+
+
+class PersonalizedTemplate:
+    """
+    A template rendered once on behalf of many recipients.
+
+    Rendering happens up front with a RecipientPlaceholder in the context,
+    leaving only a string substitution to personalize each copy. Markers are
+    made with a random token for each template, so text in the message that
+    happens to look like one is left as it is.
+    """
+
+    def __init__(self, template_name, context, autoescape=False):
+        placeholder = RecipientPlaceholder(secrets.token_hex(16))
+        rendered = render_to_string(template_name, {**context, "recipient": placeholder})
+        # Alternating literal text and recipient field names
+        self.parts = re.split(rf"%%{placeholder.token}\.(\w+)%%", rendered)
+        self.autoescape = autoescape
+
+    def render(self, recipient):
+        fields = {"name": str(recipient), "short_name": recipient.short_name, "email": recipient.email}
+        parts = self.parts.copy()
+        for i in range(1, len(parts), 2):
+            parts[i] = escape(fields[parts[i]]) if self.autoescape else fields[parts[i]]
+        return "".join(parts)
+
+
 class ListEmailMessage(EmailMultiAlternatives):
     """
     A version of EmailMultiAlternatives customized for sending messages to
@@ -27,10 +130,12 @@ class ListEmailMessage(EmailMultiAlternatives):
         cc=None,
         reply_to=None,
         settings=None,
+        site=None,
+        return_path=None,
     ):
         self.settings = settings
         if settings:
-            site = Site.objects.get_current()
+            site = site or Site.objects.get_current()
             from_email = from_email or self.settings.from_email
             subject = f"{self.settings.subject_prefix} {subject}".strip()
             headers = headers or {}
@@ -50,3 +155,7 @@ class ListEmailMessage(EmailMultiAlternatives):
             cc,
             reply_to,
         )
+        if return_path:
+            # Bounces go to the envelope sender, while the From header stays the same.
+            self.extra_headers.setdefault("From", self.from_email)
+            self.from_email = return_path
@@ -1,14 +1,22 @@
+import json
+
 from django.contrib import messages
+from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib.messages.views import SuccessMessageMixin
-from django.http import Http404, HttpResponseRedirect
+from django.core.exceptions import ValidationError
+from django.db.models import Prefetch, Q
+from django.http import Http404, HttpResponseRedirect, JsonResponse
+from django.template.loader import render_to_string
 from django.urls import reverse, reverse_lazy
 from django.utils import timezone
 from django.utils.translation import gettext as _
+from django.views.decorators.http import require_POST
 from django.views.generic import CreateView, DeleteView, DetailView, ListView, UpdateView
 
 from .forms import AttachmentForm, MessageDistributionFormSet, MessageForm
-from .models import Attachment, Mailbox, Message
+from .models import Attachment, Mailbox, Message, MessageRecipient, Thread
+from .pagination import KeysetPaginator
 
 
 class MessageCreateView(LoginRequiredMixin, SuccessMessageMixin, CreateView):
@@ -42,7 +50,7 @@ class MessageCreateView(LoginRequiredMixin, SuccessMessageMixin, CreateView):
 
             # Save the files
             for file in files:
-                Attachment.objects.create(message=obj, filename=file)
+                Attachment.objects.attach(obj, file)
 
             # Save the distribution lists
             dl_formset.instance = obj
@@ -99,7 +107,7 @@ class MessageUpdateView(LoginRequiredMixin, SuccessMessageMixin, UpdateView):
 
             # Save the new files
             for file in files:
-                Attachment.objects.create(message=obj, filename=file)
+                Attachment.objects.attach(obj, file)
 
             # Save the distribution lists
             dl_formset.instance = obj
@@ -129,27 +137,43 @@ class MessageDetailView(LoginRequiredMixin, DetailView):
     template_name = "mail/message_detail.html"
 
     def get_queryset(self):
-        return super().get_queryset().with_receipts(self.request.user)
+        return (
+            super()
+            .get_queryset()
+            .with_receipts(self.request.user)
+            .select_related("author", "thread")
+            .prefetch_related(Prefetch("attachments", queryset=Attachment.objects.select_related("blob")))
+        )
 
     def get_object(self, queryset=None):
         obj = super().get_object(queryset)
-        if self.request.user in obj.recipients.all():
-            obj.mark_read(recipient=self.request.user)
+        # The user's own receipt is prefetched, so there's no need to load every recipient to authorize them.
+        if obj.receipt:
+            obj.receipt[0].mark_read()
             return obj
         elif obj.author == self.request.user:
             return obj
         else:
             raise Http404(
-                _("No %(verbose_name)s found matching the query") % {"verbose_name": queryset.model._meta.verbose_name}
+                _("No %(verbose_name)s found matching the query") % {"verbose_name": self.model._meta.verbose_name}
             )
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        if self.object.author == self.request.user:
-            context["mailbox"] = self.object.get_mailbox()
+        if self.object.receipt:
+            context["mailbox"] = self.object.receipt[0].get_mailbox()
         else:
-            context["mailbox"] = self.object.message_recipients.get(recipient=self.request.user).get_mailbox()
-        context["message_list"] = Message.objects.in_mailbox(self.request.user, context["mailbox"])
+            context["mailbox"] = self.object.get_mailbox()
+
+        if context["mailbox"]:
+            message_list = Message.objects.in_mailbox(self.request.user, context["mailbox"])
+            if context["mailbox"] in Mailbox.outbound():
+                message_list = message_list.prefetch_related("distribution_lists")
+            else:
+                message_list = message_list.select_related("author")
+            # Only the newest page of the mailbox is listed alongside the message.
+            context["page_obj"] = KeysetPaginator(message_list, MessageListView.paginate_by).page()
+            context["message_list"] = context["page_obj"].object_list
         context["mail_count"] = get_mailbox_counts(self.request.user, context["mailbox"])
         return context
 
@@ -170,6 +194,62 @@ class MessageDetailView(LoginRequiredMixin, DetailView):
         return HttpResponseRedirect(self.object.get_absolute_url())
 
 
+class ThreadDetailView(LoginRequiredMixin, DetailView):
+    """
+    A whole conversation on one page. The thread's messages are loaded with
+    everything they display in a fixed number of queries, however long the
+    conversation.
+    """
+
+    model = Thread
+    template_name = "mail/thread_detail.html"
+
+    def get_object(self, queryset=None):
+        thread = super().get_object(queryset)
+        user = self.request.user
+        received = MessageRecipient.objects.filter(recipient=user).values("message")
+        self.messages = list(
+            Message.objects.filter(Q(author=user) | Q(pk__in=received), thread=thread)
+            .exclude(status=Message.Status.DRAFT)
+            .with_receipts(user)
+            .select_related("author")
+            .prefetch_related(
+                Prefetch("attachments", queryset=Attachment.objects.select_related("blob")), "distribution_lists"
+            )
+            .order_by("date_sent", "date_added")
+        )
+        if not self.messages:
+            raise Http404(
+                _("No %(verbose_name)s found matching the query") % {"verbose_name": self.model._meta.verbose_name}
+            )
+        MessageRecipient.objects.filter(recipient=user, message__thread=thread).mark_read()
+        return thread
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["mailbox"] = ""
+        context["message_list"] = self.messages
+        context["mail_count"] = get_mailbox_counts(self.request.user)
+        return context
+
+
+class ThreadListView(LoginRequiredMixin, ListView):
+    """The user's conversations, listed from each thread's summary."""
+
+    model = Thread
+    template_name = "mail/thread_list.html"
+    paginate_by = 50
+
+    def get_queryset(self):
+        return Thread.objects.for_user(self.request.user)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["mailbox"] = ""
+        context["mail_count"] = get_mailbox_counts(self.request.user)
+        return context
+
+
 class MessageDeleteView(LoginRequiredMixin, DeleteView):
     model = Message
     success_url = reverse_lazy("mail:drafts")
@@ -187,6 +267,66 @@ class MessageDeleteView(LoginRequiredMixin, DeleteView):
 class MessageListView(LoginRequiredMixin, ListView):
     model = Message
     template_name = "mail/message_list.html"
+    paginate_by = 50
+    paginator_class = KeysetPaginator
+
+    def paginate_queryset(self, queryset, page_size):
+        paginator = self.get_paginator(queryset, page_size)
+        page = paginator.page(self.request.GET.get("after"))
+        return paginator, page, page.object_list, page.has_next()
+
+    def render_to_response(self, context, **response_kwargs):
+        if self.request.GET.get("format") != "json":
+            return super().render_to_response(context, **response_kwargs)
+
+        # The next page of the listing for infinite scrolling, with each message pre-rendered
+        page = context["page_obj"]
+        mailbox = context["mailbox"]
+        template_name = (
+            "mail/snippets/outbound_message.html"
+            if mailbox in Mailbox.outbound()
+            else "mail/snippets/inbound_message.html"
+        )
+        response = {
+            "mailbox": mailbox,
+            "next": page.next_cursor,
+            "messages": [
+                {
+                    "uuid": message.pk,
+                    "subject": message.subject,
+                    "last_updated": message.last_updated,
+                    "html": render_to_string(
+                        template_name, {"message": message, "mailbox": mailbox}, request=self.request
+                    ),
+                }
+                for message in page
+            ],
+        }
+        return JsonResponse(response)
+
+
+class MessageSearchView(LoginRequiredMixin, ListView):
+    model = Message
+    template_name = "mail/message_search.html"
+    paginate_by = 25
+
+    def get_queryset(self):
+        self.query = self.request.GET.get("q", "").strip()
+        if not self.query:
+            return Message.objects.none()
+        return (
+            Message.objects.filter(message_recipient__recipient=self.request.user)
+            .with_receipts(self.request.user)
+            .select_related("author")
+            .search(self.query)
+        )
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["mailbox"] = ""
+        context["query"] = self.query
+        context["mail_count"] = get_mailbox_counts(self.request.user)
+        return context
 
 
 class MessageInboxView(MessageListView):
@@ -194,7 +334,7 @@ class MessageInboxView(MessageListView):
     template_name = "mail/message_list.html"
 
     def get_queryset(self):
-        return super().get_queryset().in_inbox(recipient=self.request.user)
+        return super().get_queryset().in_inbox(recipient=self.request.user).select_related("author")
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -208,7 +348,7 @@ class MessageDraftsView(MessageListView):
     template_name = "mail/message_list.html"
 
     def get_queryset(self):
-        return super().get_queryset().drafts(author=self.request.user)
+        return super().get_queryset().drafts(author=self.request.user).prefetch_related("distribution_lists")
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -222,7 +362,7 @@ class MessageSendingView(MessageListView):
     template_name = "mail/message_list.html"
 
     def get_queryset(self):
-        return super().get_queryset().sending(author=self.request.user)
+        return super().get_queryset().sending(author=self.request.user).prefetch_related("distribution_lists")
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -236,7 +376,7 @@ class MessageSentView(MessageListView):
     template_name = "mail/message_list.html"
 
     def get_queryset(self):
-        return super().get_queryset().sent(author=self.request.user)
+        return super().get_queryset().sent(author=self.request.user).prefetch_related("distribution_lists")
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -250,7 +390,7 @@ class MessageArchiveView(MessageListView):
     template_name = "mail/message_list.html"
 
     def get_queryset(self):
-        return super().get_queryset().archived(recipient=self.request.user)
+        return super().get_queryset().archived(recipient=self.request.user).select_related("author")
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -264,7 +404,7 @@ class MessageTrashView(MessageListView):
     template_name = "mail/message_list.html"
 
     def get_queryset(self):
-        return super().get_queryset().deleted(recipient=self.request.user)
+        return super().get_queryset().deleted(recipient=self.request.user).select_related("author")
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -273,37 +413,90 @@ class MessageTrashView(MessageListView):
         return context
 
 
+BULK_ACTIONS = {
+    "read": "mark_read",
+    "unread": "mark_unread",
+    "archive": "mark_archived",
+    "unarchive": "mark_unarchived",
+    "delete": "mark_deleted",
+    "undelete": "mark_undeleted",
+}
+
+
+@login_required
+@require_POST
+def bulk_update(request):
+    """
+    Apply an action to many of the user's messages at once, either a list of
+    `messages` or every message in a received `mailbox`. Responds with the
+    number of messages changed and the user's refreshed mailbox counts.
+    """
+    try:
+        data = json.loads(request.body)
+    except ValueError:
+        return JsonResponse({"error": _("The request body must be JSON")}, status=400)
+    if not isinstance(data, dict):
+        return JsonResponse({"error": _("The request body must be a JSON object")}, status=400)
+    action = data.get("action")
+    receipts = MessageRecipient.objects.filter(recipient=request.user)
+
+    if not isinstance(action, str) or action not in BULK_ACTIONS:
+        return JsonResponse({"error": _("Unknown action: %s") % action}, status=400)
+
+    if "messages" in data:
+        pks = data["messages"]
+        if not isinstance(pks, list) or not all(isinstance(pk, str) for pk in pks):
+            return JsonResponse({"error": _("Messages must be a list of message IDs")}, status=400)
+        try:
+            receipts = receipts.filter(message__in=pks)
+        except ValidationError as e:
+            return JsonResponse({"error": e.messages}, status=400)
+    elif data.get("mailbox") == Mailbox.INBOX:
+        receipts = receipts.in_inbox()
+    elif data.get("mailbox") == Mailbox.ARCHIVES:
+        receipts = receipts.archived()
+    elif data.get("mailbox") == Mailbox.TRASH:
+        receipts = receipts.deleted()
+    else:
+        return JsonResponse({"error": _("Choose some messages or a mailbox")}, status=400)
+
+    updated = getattr(receipts, BULK_ACTIONS[action])()
+    response = {"action": action, "updated": updated, "mail_count": Message.objects.mailbox_counts(request.user)}
+    return JsonResponse(response)
+
+
 def get_mailbox_counts(user, viewing_mailbox=None):
     """
     Given a user, return the message counts for all standard folders
     """
+    totals = Message.objects.mailbox_counts(user)
     counts = {
         "inbox": {
             "label": Mailbox.INBOX.label,
-            "total": Message.objects.in_inbox(recipient=user).count(),
-            "unread": Message.objects.in_inbox(recipient=user).unread(user).count(),
+            "total": totals["inbox"],
+            "unread": totals["inbox_unread"],
         },
         "drafts": {
             "label": Mailbox.DRAFTS.label,
-            "total": Message.objects.drafts(author=user).count(),
+            "total": totals["drafts"],
         },
         "sent": {
             "label": Mailbox.SENT.label,
-            "total": Message.objects.sent(author=user).count(),
+            "total": totals["sent"],
         },
         "outbox": {
             "label": Mailbox.OUTBOX.label,
-            "total": Message.objects.sending(author=user).count(),
+            "total": totals["outbox"],
         },
         "archives": {
             "label": Mailbox.ARCHIVES.label,
-            "total": Message.objects.archived(recipient=user).count(),
-            "unread": Message.objects.archived(recipient=user).unread(user).count(),
+            "total": totals["archives"],
+            "unread": totals["archives_unread"],
         },
         "trash": {
             "label": Mailbox.TRASH.label,
-            "total": Message.objects.deleted(recipient=user).count(),
-            "unread": Message.objects.deleted(recipient=user).unread(user).count(),
+            "total": totals["trash"],
+            "unread": totals["trash_unread"],
         },
         "outbound": Mailbox.outbound(),
     }
@@ -5,10 +5,12 @@ from zipfile import ZipFile
 
 from django.contrib import admin, messages
 from django.contrib.auth.admin import UserAdmin
+from django.core.exceptions import PermissionDenied
 from django.db.models import Case, CharField, Count, When
 from django.db.models.functions import Coalesce
-from django.http import HttpResponse
-from django.urls import reverse
+from django.http import HttpResponse, HttpResponseRedirect
+from django.template.response import TemplateResponse
+from django.urls import path, reverse
 from django.utils.html import format_html, format_html_join
 from django.utils.translation import gettext_lazy as _
 from django.utils.translation import ngettext
@@ -25,6 +27,8 @@ from packman.dens.models import Membership as DenMembership
 from packman.dens.models import Rank
 
 from . import forms, models
+from .roster import RosterImport
+from .signals import members_changed
 
 logger = logging.getLogger(__name__)
 
@@ -286,9 +290,15 @@ class ScoutAdmin(admin.ModelAdmin):
         )
         return format_html("<ul>{}</ul>", adult_links) if adult_links else "-"
 
+    def refresh_enrollments(self, queryset):
+        # bulk updates skip the signals that keep enrollments, statuses and lists current
+        models.Enrollment.objects.rebuild_for(scouts=queryset.values_list("pk", flat=True))
+        members_changed.send(sender=models.Scout)
+
     @admin.action(description=_("Mark selected Cubs as active"))
     def make_active(self, request, queryset):
         updated = queryset.order_by().update(status=models.Scout.ACTIVE)
+        self.refresh_enrollments(queryset)
         self.message_user(
             request,
             ngettext(
@@ -303,6 +313,7 @@ class ScoutAdmin(admin.ModelAdmin):
     @admin.action(description=_("Approve selected Cubs for membership"))
     def make_approved(self, request, queryset):
         updated = queryset.order_by().update(status=models.Scout.APPROVED)
+        self.refresh_enrollments(queryset)
         self.message_user(
             request,
             ngettext(
@@ -317,6 +328,7 @@ class ScoutAdmin(admin.ModelAdmin):
     @admin.action(description=_("Mark selected Cubs as inactive"))
     def make_inactive(self, request, queryset):
         updated = queryset.order_by().update(status=models.Scout.INACTIVE)
+        self.refresh_enrollments(queryset)
         self.message_user(
             request,
             ngettext(
@@ -331,6 +343,7 @@ class ScoutAdmin(admin.ModelAdmin):
     @admin.action(description=_("Graduate selected Cubs"))
     def make_graduated(self, request, queryset):
         updated = queryset.order_by().update(status=models.Scout.GRADUATED)
+        self.refresh_enrollments(queryset)
         self.message_user(
             request,
             ngettext(
@@ -533,7 +546,7 @@ class AdultAdmin(UserAdmin):
             },
         ),
         (_("Family"), {"fields": ("family", "get_children")}),
-        (_("Account Details"), {"fields": (("email", "is_published"), "password")}),
+        (_("Account Details"), {"fields": (("email", "is_published"), "mail_digest", "password")}),
         (
             _("Permissions"),
             {
@@ -653,6 +666,7 @@ class AdultAdmin(UserAdmin):
 
 @admin.register(models.Family)
 class FamilyAdmin(admin.ModelAdmin):
+    change_list_template = "admin/membership/family/change_list.html"
     form = forms.FamilyForm
     list_display = (
         "name",
@@ -691,3 +705,46 @@ class FamilyAdmin(admin.ModelAdmin):
     )
     def children_count(self, obj):
         return obj._children_count
+
+    def get_urls(self):
+        opts = self.opts
+        urls = [
+            path(
+                "import/",
+                self.admin_site.admin_view(self.import_view),
+                name=f"{opts.app_label}_{opts.model_name}_import",
+            ),
+        ]
+        return urls + super().get_urls()
+
+    def import_view(self, request):
+        if not self.has_add_permission(request):
+            raise PermissionDenied
+        opts = self.opts
+        form = forms.RosterImportForm(request.POST or None, request.FILES or None)
+        roster = None
+        if form.is_valid():
+            roster = RosterImport(form.rows).run(dry_run=form.cleaned_data["dry_run"])
+            if roster and not form.cleaned_data["dry_run"]:
+                self.message_user(
+                    request,
+                    ngettext(
+                        "%(families)d family was successfully imported.",
+                        "%(families)d families were successfully imported.",
+                        roster.counts["families"],
+                    )
+                    % roster.counts,
+                    messages.SUCCESS,
+                )
+                return HttpResponseRedirect(
+                    reverse(f"admin:{opts.app_label}_{opts.model_name}_changelist", current_app=self.admin_site.name)
+                )
+
+        context = {
+            **self.admin_site.each_context(request),
+            "title": _("Import roster"),
+            "opts": opts,
+            "form": form,
+            "roster": roster,
+        }
+        return TemplateResponse(request, "admin/membership/family/import.html", context)
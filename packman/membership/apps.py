@@ -5,3 +5,6 @@ from django.utils.translation import gettext_lazy as _
 class MembershipConfig(AppConfig):
     name = "packman.membership"
     verbose_name = _("Membership")
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -14,7 +14,9 @@ from crispy_forms.layout import Column, Field, Fieldset, Layout, Row, Submit
 from packman.address_book.forms import AddressForm, PhoneNumberForm
 from packman.address_book.models import Address, PhoneNumber
 
-from .models import Adult, Family, Scout
+from .models import Adult, Enrollment, Family, Scout
+from .roster import read_roster
+from .signals import members_changed
 
 AddressFormSet = inlineformset_factory(
     Adult,
@@ -72,13 +74,38 @@ class FamilyForm(forms.ModelForm):
         # TODO: Wrap reassignments into transaction
         # NOTE: Previously assigned Foos are silently reset
         instance = super().save(commit=False)
+        adults = {*self.fields["adults"].initial.values_list("pk", flat=True), *self.cleaned_data["adults"]}
+        children = {*self.fields["children"].initial.values_list("pk", flat=True), *self.cleaned_data["children"]}
         self.fields["adults"].initial.update(family=None)
         self.fields["children"].initial.update(family=None)
         self.cleaned_data["adults"].update(family=instance)
         self.cleaned_data["children"].update(family=instance)
+        # the bulk updates above skip the signals that keep enrollments and lists current
+        Enrollment.objects.rebuild_for(adults=adults, scouts=children)
+        members_changed.send(sender=Family)
         return instance
 
 
+class RosterImportForm(forms.Form):
+    roster = forms.FileField(
+        label=_("Roster"),
+        help_text=_("A CSV file with a header row and one row per adult or cub."),
+    )
+    dry_run = forms.BooleanField(
+        label=_("Dry run"),
+        required=False,
+        initial=True,
+        help_text=_("Check the roster and report what it would add, without adding anything."),
+    )
+
+    def clean_roster(self):
+        roster = self.cleaned_data["roster"]
+        self.rows = list(read_roster(roster))
+        if not self.rows:
+            raise forms.ValidationError(_("The roster is empty."))
+        return roster
+
+
 class AdultCreation(UserCreationForm):
     class Meta:
         model = Adult
@@ -152,6 +179,7 @@ class AdultForm(forms.ModelForm):
             "nickname",
             "email",
             "is_published",
+            "mail_digest",
             "gender",
             "role",
             "photo",
@@ -190,6 +218,7 @@ class AdultForm(forms.ModelForm):
                 Column("email"),
                 Column("is_published"),
             ),
+            "mail_digest",
             Row(
                 Column("gender"),
                 Column("role"),
@@ -0,0 +1,41 @@
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.translation import gettext as _
+
+from packman.membership.roster import RosterImport, read_roster
+
+
+class Command(BaseCommand):
+    help = _("Adds the families on a roster, a CSV file with one row per adult or cub, in a single transaction")
+
+    def add_arguments(self, parser):
+        parser.add_argument("roster", help=_("The CSV file to import"))
+        parser.add_argument(
+            "--dry-run", action="store_true", help=_("Validate the roster and report what would be added.")
+        )
+
+    def handle(self, *args, **options):
+        try:
+            with open(options["roster"], "rb") as file:
+                roster = RosterImport(read_roster(file)).run(dry_run=options["dry_run"])
+        except OSError as e:
+            raise CommandError(e)
+        except ValidationError as e:
+            raise CommandError(" ".join(e.messages))
+
+        for line, error in roster.errors:
+            self.stderr.write(_("Line %(line)d: %(error)s") % {"line": line, "error": error})
+        if not roster:
+            raise CommandError(_("The roster has errors, nothing was imported"))
+
+        if options["dry_run"]:
+            message = _(
+                "Would add %(families)d families, %(adults)d adults, %(scouts)d cubs, "
+                "%(addresses)d addresses and %(phone_numbers)d phone numbers"
+            )
+        else:
+            message = _(
+                "Added %(families)d families, %(adults)d adults, %(scouts)d cubs, "
+                "%(addresses)d addresses and %(phone_numbers)d phone numbers"
+            )
+        self.stdout.write(self.style.SUCCESS(message % roster.counts))
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from django.utils.translation import gettext as _
+
+from packman.membership.models import Enrollment
+
+
+class Command(BaseCommand):
+    help = _("Rebuilds every pack year's enrollments from the cubs, their den assignments and their families")
+
+    def handle(self, *args, **options):
+        count = Enrollment.objects.rebuild()
+        self.stdout.write(self.style.SUCCESS(_("Rebuilt %(count)d enrollments") % {"count": count}))
@@ -1,24 +1,33 @@
+import re
+import unicodedata
+
 from django.contrib.auth.models import UserManager
-from django.db import models
-from django.db.models import Case, Count, Q, Value, When
+from django.db import connections, models, transaction
+from django.db.models import Case, Count, Exists, F, Q, Value, When
 from django.db.models.functions import Coalesce, Concat
 
 from packman.calendars.models import PackYear
 from packman.dens.models import Rank
 
 
+def normalize_name(value):
+    """
+    Reduce `value` to the lowercase, accent-folded words the member search
+    index holds, e.g. "Zoë O'Brien-Smith" becomes "zoe obrien smith".
+    """
+    value = unicodedata.normalize("NFKD", value.casefold())
+    value = "".join(char for char in value if not unicodedata.combining(char))
+    return " ".join(re.findall(r"\w+", re.sub(r"['\u2019]", "", value)))
+
+
 class FamilyQuerySet(models.QuerySet):
     def active(self):
-        return self.filter(
-            children__den_memberships__year_assigned=PackYear.objects.current(),
-            children__status=self.model.children.rel.related_model.ACTIVE,
-        )
+        Enrollment = self.model.enrollments.rel.related_model
+        return self.filter(pk__in=Enrollment.objects.current().active().values("family"))
 
     def in_den(self, den_list):
-        return self.active().filter(
-            children__den_memberships__year_assigned=PackYear.objects.current(),
-            children__den_memberships__den__number__in=den_list,
-        )
+        Enrollment = self.model.enrollments.rel.related_model
+        return self.filter(pk__in=Enrollment.objects.current().active().scouts().in_den(den_list).values("family"))
 
     def count_active_scouts(self):
         return self.annotate(
@@ -43,15 +52,124 @@ class FamilyManager(models.Manager):
 
 class MemberQuerySet(models.QuerySet):
     def active(self):
-        return self.filter(family__in=self.model.family.field.related_model.objects.active())
+        Enrollment = self.model.enrollments.rel.related_model
+        return self.filter(pk__in=Enrollment.objects.current().active().adults().values("adult"))
 
     def in_den(self, den_list):
-        return self.active().filter(family__in=self.model.family.field.related_model.objects.in_den(den_list))
+        return self.filter(family__in=self.model.family.field.related_model.objects.in_den(den_list))
 
     def in_committee(self, committee_list):
         return self.active().filter(committees__in=committee_list, committees__year=PackYear.objects.current())
 
 
+class DirectoryQuerySet(models.QuerySet):
+    def listed(self, include_alumni=False):
+        """
+        Members who appear in the pack directory: active cubs, their parents
+        and friends of the pack, or with `include_alumni`, every cub who was
+        ever active and their parents.
+        """
+        Adult = self.model._meta.get_field("adult").related_model
+        Scout = self.model._meta.get_field("scout").related_model
+        if include_alumni:
+            families = Scout.objects.filter(status__gte=Scout.ACTIVE).values("family")
+            return self.filter(Q(adult__family__in=families) | Q(scout__status__gte=Scout.ACTIVE))
+        families = Scout.objects.filter(status=Scout.ACTIVE).values("family")
+        return self.filter(
+            Q(adult__family__in=families) | Q(adult__role=Adult.CONTRIBUTOR) | Q(scout__status=Scout.ACTIVE)
+        )
+
+    def visible_to(self, user, include_alumni=False):
+        """
+        The listed members `user` may look up. Families with active cubs and
+        friends of the pack see everyone, other families only themselves.
+        Whether the user's family is active is decided in the same query.
+        """
+        Scout = self.model._meta.get_field("scout").related_model
+        members = self.listed(include_alumni)
+        if user.role == user.CONTRIBUTOR:
+            return members
+        elif not user.family_id:
+            return self.filter(pk=user.pk)
+        return members.filter(
+            Exists(Scout.objects.filter(family=user.family_id, status=Scout.ACTIVE))
+            | Q(adult__family=user.family_id)
+            | Q(scout__family=user.family_id)
+        )
+
+    def search(self, query):
+        """
+        Filter to members with a name starting with each word in `query`,
+        best matches first, so a partial name finds as it is typed. Uses the
+        name index on Postgres (trigram) or SQLite (FTS5 prefix), and falls
+        back to a substring match elsewhere.
+        """
+        terms = normalize_name(query).split()
+        if not terms:
+            return self.none()
+
+        vendor = connections[self.db].vendor
+        if vendor == "postgresql":
+            from django.contrib.postgres.search import TrigramSimilarity
+
+            # Both patterns are answered from the trigram index.
+            matches = Q()
+            for term in terms:
+                matches &= Q(search_name__startswith=term) | Q(search_name__contains=f" {term}")
+            return (
+                self.filter(matches)
+                .annotate(rank=TrigramSimilarity("search_name", " ".join(terms)))
+                .order_by("-rank", "last_name", "first_name")
+            )
+        elif vendor == "sqlite":
+            terms = " ".join(f'"{term}"*' for term in terms)
+            return (
+                self.filter(search_index__name__match=terms)
+                # FTS5 ranks better matches with more negative scores
+                .annotate(rank=-F("search_index__rank")).order_by("-rank", "last_name", "first_name")
+            )
+        matches = Q()
+        for term in terms:
+            matches &= Q(search_name__contains=term)
+        return self.filter(matches).annotate(rank=Value(0.0)).order_by("last_name", "first_name")
+
+
+class DirectoryManager(models.Manager):
+    def get_queryset(self):
+        return DirectoryQuerySet(self.model, using=self._db)
+
+    def listed(self, include_alumni=False):
+        return self.get_queryset().listed(include_alumni)
+
+    def visible_to(self, user, include_alumni=False):
+        return self.get_queryset().visible_to(user, include_alumni)
+
+    def search(self, query):
+        return self.get_queryset().search(query)
+
+    def update_search_index(self, members):
+        """
+        Copy the search names of `members` into the SQLite full-text index.
+        Postgres indexes the search_name column itself, so needs nothing more.
+        """
+        connection = connections[self.db]
+        if connection.vendor == "sqlite":
+            pk = self.model._meta.pk
+            rows = [(pk.get_db_prep_value(member.pk, connection), member.search_name) for member in members]
+            with connection.cursor() as cursor:
+                cursor.executemany("DELETE FROM membership_member_fts WHERE member_id = %s", [row[:1] for row in rows])
+                cursor.executemany("INSERT INTO membership_member_fts (member_id, name) VALUES (%s, %s)", rows)
+
+    def delete_search_index(self, members):
+        """Remove `members` from the SQLite full-text index once they are deleted."""
+        connection = connections[self.db]
+        if connection.vendor == "sqlite":
+            pk = self.model._meta.pk
+            rows = [(pk.get_db_prep_value(member.pk, connection),) for member in members]
+            with connection.cursor() as cursor:
+                cursor.executemany("DELETE FROM membership_member_fts WHERE member_id = %s", rows)
+
+
 class MemberManager(UserManager):
     def get_queryset(self):
         return MemberQuerySet(model=self.model, using=self._db).annotate(
@@ -113,38 +231,40 @@ class MemberManager(UserManager):
 
 
 class ScoutQuerySet(models.QuerySet):
+    def enrolled(self, **filters):
+        """Cubs active this year whose enrollment also matches `filters`, e.g. rank__lte=..."""
+        Enrollment = self.model.enrollments.rel.related_model
+        return self.filter(pk__in=Enrollment.objects.current().active().scouts().filter(**filters).values("scout"))
+
     def active(self):
-        return self.filter(
-            den_memberships__year_assigned=PackYear.objects.current(),
-            status=self.model.ACTIVE,
-        )
+        return self.enrolled()
 
     def lions(self):
-        return self.active().filter(den_memberships__den__rank__rank=Rank.RankChoices.LION)
+        return self.enrolled(rank=Rank.RankChoices.LION)
 
     def tigers(self):
-        return self.active().filter(den_memberships__den__rank__rank=Rank.RankChoices.TIGER)
+        return self.enrolled(rank=Rank.RankChoices.TIGER)
 
     def wolves(self):
-        return self.active().filter(den_memberships__den__rank__rank=Rank.RankChoices.WOLF)
+        return self.enrolled(rank=Rank.RankChoices.WOLF)
 
     def bears(self):
-        return self.active().filter(den_memberships__den__rank__rank=Rank.RankChoices.BEAR)
+        return self.enrolled(rank=Rank.RankChoices.BEAR)
 
     def jr_webes(self):
-        return self.active().filter(den_memberships__den__rank__rank=Rank.RankChoices.JR_WEBE)
+        return self.enrolled(rank=Rank.RankChoices.JR_WEBE)
 
     def sr_webes(self):
-        return self.active().filter(den_memberships__den__rank__rank=Rank.RankChoices.SR_WEBE)
+        return self.enrolled(rank=Rank.RankChoices.SR_WEBE)
 
     def arrows_of_light(self):
-        return self.active().filter(den_memberships__den__rank__rank=Rank.RankChoices.ARROW)
+        return self.enrolled(rank=Rank.RankChoices.ARROW)
 
     def animal_ranks(self):
-        return self.active().filter(den_memberships__den__rank__rank__lte=Rank.RankChoices.BEAR)
+        return self.enrolled(rank__lte=Rank.RankChoices.BEAR)
 
     def webelo_ranks(self):
-        return self.active().filter(den_memberships__den__rank__rank__gte=Rank.RankChoices.JR_WEBE)
+        return self.enrolled(rank__gte=Rank.RankChoices.JR_WEBE)
 
 
 class ScoutManager(models.Manager):
@@ -180,3 +300,93 @@ class ScoutManager(models.Manager):
 
     def webelo_ranks(self):
         return self.get_queryset().webelo_ranks()
+
+
+class EnrollmentQuerySet(models.QuerySet):
+    def current(self):
+        return self.filter(year=PackYear.objects.current())
+
+    def active(self):
+        return self.filter(active=True)
+
+    def adults(self):
+        return self.filter(adult__isnull=False)
+
+    def scouts(self):
+        return self.filter(scout__isnull=False)
+
+    def in_den(self, den_list):
+        return self.filter(den__in=den_list)
+
+
+class EnrollmentManager(models.Manager):
+    def get_queryset(self):
+        return EnrollmentQuerySet(self.model, using=self._db)
+
+    def current(self):
+        return self.get_queryset().current()
+
+    @transaction.atomic
+    def rebuild(self, families=None, adults=None, scouts=None):
+        """
+        Recompute the enrollments of every cub and adult in `families`, and
+        of `adults` and `scouts` themselves, or of everyone when none are
+        given. Returns the number of enrollments written.
+
+        An adult's enrollment depends on all of their family's cubs, so
+        rebuilding a cub or adult should also rebuild the families they are
+        leaving and joining.
+        """
+        Adult = self.model._meta.get_field("adult").related_model
+        Scout = self.model._meta.get_field("scout").related_model
+        Membership = Scout.den_memberships.rel.related_model
+
+        enrollments = self.all()
+        memberships = Membership.objects.all()
+        family_adults = Adult.objects.exclude(family=None)
+        if families is not None or adults is not None or scouts is not None:
+            families = {getattr(family, "pk", family) for family in families or ()} - {None}
+            adults = {getattr(adult, "pk", adult) for adult in adults or ()}
+            scouts = {getattr(scout, "pk", scout) for scout in scouts or ()}
+            enrollments = self.filter(Q(family__in=families) | Q(adult__in=adults) | Q(scout__in=scouts))
+            memberships = memberships.filter(Q(scout__family__in=families) | Q(scout__in=scouts))
+            family_adults = family_adults.filter(family__in=families)
+        enrollments.delete()
+
+        rows = []
+        # whether each family has an active cub, by family and year
+        family_years = {}
+        for scout_pk, family_pk, status, year_pk, den_pk, rank in memberships.values_list(
+            "scout", "scout__family", "scout__status", "year_assigned", "den", "den__rank__rank"
+        ).iterator(chunk_size=500):
+            active = status == Scout.ACTIVE
+            rows.append(
+                self.model(
+                    year_id=year_pk, family_id=family_pk, scout_id=scout_pk, den_id=den_pk, rank=rank, active=active
+                )
+            )
+            if family_pk:
+                family_years.setdefault(family_pk, {})
+                family_years[family_pk][year_pk] = family_years[family_pk].get(year_pk, False) or active
+
+        for adult_pk, family_pk in family_adults.values_list("pk", "family").iterator(chunk_size=500):
+            for year_pk, active in family_years.get(family_pk, {}).items():
+                rows.append(self.model(year_id=year_pk, family_id=family_pk, adult_id=adult_pk, active=active))
+
+        return len(self.bulk_create(rows, batch_size=500))
+
+    def rebuild_for(self, adults=(), scouts=()):
+        """
+        Recompute the enrollments of `adults` and `scouts` after they have
+        changed, along with the families they left and joined.
+        """
+        Adult = self.model._meta.get_field("adult").related_model
+        Scout = self.model._meta.get_field("scout").related_model
+        adults = {getattr(adult, "pk", adult) for adult in adults}
+        scouts = {getattr(scout, "pk", scout) for scout in scouts}
+        families = {
+            *self.filter(Q(adult__in=adults) | Q(scout__in=scouts)).values_list("family", flat=True),
+            *Adult.objects.filter(pk__in=adults).values_list("family", flat=True),
+            *Scout.objects.filter(pk__in=scouts).values_list("family", flat=True),
+        }
+        return self.rebuild(families=families, adults=adults, scouts=scouts)
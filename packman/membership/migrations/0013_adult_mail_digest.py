@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("membership", "0012_alter_scout_options"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="adult",
+            name="mail_digest",
+            field=models.BooleanField(
+                default=False,
+                help_text="Receive distribution list messages collected into a single email once a day.",
+                verbose_name="Daily digest",
+            ),
+        ),
+    ]
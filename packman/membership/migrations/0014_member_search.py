@@ -0,0 +1,88 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:51
+
+import re
+import unicodedata
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+NAME_FIELDS = ("first_name", "nickname", "middle_name", "last_name", "suffix")
+
+
+def normalize_name(value):
+    value = unicodedata.normalize("NFKD", value.casefold())
+    value = "".join(char for char in value if not unicodedata.combining(char))
+    return " ".join(re.findall(r"\w+", re.sub(r"['\u2019]", "", value)))
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        schema_editor.execute(
+            "CREATE INDEX membership_member_search_idx ON membership_member USING gin (search_name gin_trgm_ops)"
+        )
+    elif schema_editor.connection.vendor == "sqlite":
+        schema_editor.execute(
+            "CREATE VIRTUAL TABLE membership_member_fts USING fts5("
+            "member_id UNINDEXED, name, tokenize='unicode61 remove_diacritics 2', prefix='1 2 3')"
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == "postgresql":
+        schema_editor.execute("DROP INDEX IF EXISTS membership_member_search_idx")
+    elif schema_editor.connection.vendor == "sqlite":
+        schema_editor.execute("DROP TABLE IF EXISTS membership_member_fts")
+
+
+def populate_search_names(apps, schema_editor):
+    Member = apps.get_model("membership", "Member")
+    members = []
+    for member in Member.objects.only(*NAME_FIELDS).iterator(chunk_size=500):
+        member.search_name = normalize_name(" ".join(getattr(member, field) for field in NAME_FIELDS))
+        members.append(member)
+    Member.objects.bulk_update(members, ["search_name"], batch_size=500)
+
+    if schema_editor.connection.vendor == "sqlite":
+        schema_editor.execute(
+            "INSERT INTO membership_member_fts (member_id, name) SELECT uuid, search_name FROM membership_member"
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("membership", "0013_adult_mail_digest"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="MemberSearchIndex",
+            fields=[
+                (
+                    "member",
+                    models.OneToOneField(
+                        db_constraint=False,
+                        on_delete=django.db.models.deletion.DO_NOTHING,
+                        primary_key=True,
+                        related_name="search_index",
+                        serialize=False,
+                        to="membership.member",
+                    ),
+                ),
+                ("name", models.TextField()),
+                ("rank", models.FloatField()),
+            ],
+            options={
+                "db_table": "membership_member_fts",
+                "managed": False,
+            },
+        ),
+        migrations.AddField(
+            model_name="member",
+            name="search_name",
+            field=models.CharField(blank=True, editable=False, max_length=300, verbose_name="search name"),
+        ),
+        migrations.RunPython(create_search_index, reverse_code=drop_search_index),
+        migrations.RunPython(populate_search_names, reverse_code=migrations.RunPython.noop),
+    ]
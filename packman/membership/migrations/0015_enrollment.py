@@ -0,0 +1,134 @@
+# Generated by Django 5.2.18 on 2026-10-18 19:04
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+ACTIVE = 4
+
+
+def populate_enrollments(apps, schema_editor):
+    Adult = apps.get_model("membership", "Adult")
+    Enrollment = apps.get_model("membership", "Enrollment")
+    Membership = apps.get_model("dens", "Membership")
+
+    rows = []
+    family_years = {}
+    for scout_pk, family_pk, status, year_pk, den_pk, rank in Membership.objects.values_list(
+        "scout", "scout__family", "scout__status", "year_assigned", "den", "den__rank__rank"
+    ).iterator(chunk_size=500):
+        active = status == ACTIVE
+        rows.append(
+            Enrollment(year_id=year_pk, family_id=family_pk, scout_id=scout_pk, den_id=den_pk, rank=rank, active=active)
+        )
+        if family_pk:
+            family_years.setdefault(family_pk, {})
+            family_years[family_pk][year_pk] = family_years[family_pk].get(year_pk, False) or active
+
+    for adult_pk, family_pk in Adult.objects.exclude(family=None).values_list("pk", "family").iterator(chunk_size=500):
+        for year_pk, active in family_years.get(family_pk, {}).items():
+            rows.append(Enrollment(year_id=year_pk, family_id=family_pk, adult_id=adult_pk, active=active))
+
+    Enrollment.objects.bulk_create(rows, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("calendars", "0006_alter_category_color_alter_category_description_and_more"),
+        ("dens", "0013_alter_membership_year_assigned"),
+        ("membership", "0014_member_search"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Enrollment",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                (
+                    "rank",
+                    models.IntegerField(
+                        blank=True,
+                        choices=[
+                            (1, "Lion"),
+                            (2, "Tiger"),
+                            (3, "Wolf"),
+                            (4, "Bear"),
+                            (5, "Jr. Webelos"),
+                            (6, "Sr. Webelos"),
+                            (7, "Webelos"),
+                            (8, "Arrow of Light"),
+                        ],
+                        null=True,
+                    ),
+                ),
+                ("active", models.BooleanField(default=False)),
+                (
+                    "adult",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="enrollments",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                (
+                    "den",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="enrollments",
+                        to="dens.den",
+                    ),
+                ),
+                (
+                    "family",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="enrollments",
+                        to="membership.family",
+                    ),
+                ),
+                (
+                    "scout",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="enrollments",
+                        to="membership.scout",
+                    ),
+                ),
+                (
+                    "year",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="enrollments",
+                        to="calendars.packyear",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Enrollment",
+                "verbose_name_plural": "Enrollments",
+                "indexes": [
+                    models.Index(fields=["year", "active", "family"], name="membership__year_id_0ee064_idx"),
+                    models.Index(fields=["year", "active", "den"], name="membership__year_id_bb6c97_idx"),
+                    models.Index(fields=["year", "active", "rank"], name="membership__year_id_5e6a8a_idx"),
+                ],
+                "constraints": [
+                    models.CheckConstraint(
+                        condition=models.Q(("adult__isnull", True), ("scout__isnull", True), _connector="XOR"),
+                        name="enrollment_adult_or_scout",
+                    ),
+                    models.UniqueConstraint(fields=("year", "adult"), name="unique_adult_enrollment"),
+                    models.UniqueConstraint(fields=("year", "scout"), name="unique_scout_enrollment"),
+                ],
+            },
+        ),
+        migrations.RunPython(populate_enrollments, reverse_code=migrations.RunPython.noop),
+    ]
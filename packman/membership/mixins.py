@@ -23,7 +23,5 @@ class ActiveMemberOrContributorTest(UserPassesTestMixin):
     """Parents with active cubs should be allowed to view this page"""
 
     def test_func(self):
-        if self.request.user.is_authenticated and (
-            self.request.user.active() or self.request.user.role == Adult.CONTRIBUTOR
-        ):
-            return True
+        if self.request.user.is_authenticated:
+            return self.request.user.active() or self.request.user.role == Adult.CONTRIBUTOR
@@ -4,7 +4,6 @@ from django.db import models
 from django.urls import reverse
 from django.utils import timezone
 from django.utils.functional import cached_property
-from django.utils.text import slugify
 from django.utils.translation import gettext_lazy as _
 
 from easy_thumbnails.fields import ThumbnailerImageField
@@ -12,10 +11,20 @@ from easy_thumbnails.signal_handlers import generate_aliases
 from easy_thumbnails.signals import saved_file
 
 from packman.calendars.models import PackYear
+from packman.core.lookups import Match
 from packman.core.models import TimeStampedUUIDModel
-from packman.dens.models import Den
+from packman.dens.models import Den, Rank
 
-from .managers import FamilyManager, MemberManager, ScoutManager
+from .managers import (
+    DirectoryManager,
+    EnrollmentManager,
+    FamilyManager,
+    MemberManager,
+    ScoutManager,
+    normalize_name,
+)
+from .slugs import SlugAllocator, get_slug_candidates, save_with_slug
+from .status import get_membership_status
 
 
 def get_photo_path(instance, filename):
@@ -90,42 +99,46 @@ class Member(TimeStampedUUIDModel):
             "they are granted access to Membership."
         ),
     )
+    search_name = models.CharField(_("search name"), max_length=300, blank=True, editable=False)
+
+    objects = DirectoryManager()
 
     class Meta:
         indexes = [models.Index(fields=["first_name", "middle_name", "nickname", "last_name", "gender"])]
         ordering = ["last_name", "nickname", "first_name"]
 
+    # The fields search_name is built from
+    NAME_FIELDS = {"first_name", "nickname", "middle_name", "last_name", "suffix"}
+
     def __str__(self):
         return self.get_full_name()
 
-    def save(self, *args, **kwargs):  # sourcery skip: hoist-if-from-if
-        if not self.slug:
-            candidates = [self.get_full_name()]
-            if self.middle_name and self.suffix:
-                candidates.extend(
-                    (
-                        f"{self.first_name} {self.middle_name[0]} {self.last_name} {self.suffix}",
-                        f"{self.first_name} {self.middle_name} {self.last_name} {self.suffix}",
-                    )
-                )
+    def save(self, *args, **kwargs):
+        self.search_name = self.get_search_name()
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and self.NAME_FIELDS & set(update_fields):
+            kwargs["update_fields"] = {*update_fields, "search_name"}
+        if self.slug:
+            super().save(*args, **kwargs)
+        else:
+            save_with_slug(self, lambda: super(Member, self).save(*args, **kwargs), using=kwargs.get("using"))
+        if update_fields is None or "search_name" in kwargs["update_fields"]:
+            self.update_search_index()
 
-            elif self.suffix:
-                candidates.append(f"{self.first_name} " f"{self.last_name} " f"{self.suffix}")
-            elif self.middle_name:
-                candidates.extend(
-                    (
-                        f"{self.first_name} {self.middle_name[0]} {self.last_name}",
-                        f"{self.first_name} {self.middle_name} {self.last_name}",
-                    )
-                )
+    def update_search_index(self):
+        """
+        Copy the search name into the SQLite full-text index. Postgres
+        indexes the search_name column itself, so needs nothing more.
+        """
+        Member.objects.db_manager(self._state.db).update_search_index([self])
 
-            self.choose_slug(candidates=candidates)
-            if not self.slug:
-                # None of the normal candidates seem to have worked or we would
-                # have a slug now. Start adding digits to the end of their name
-                candidates = [f"{self.get_full_name()} {i}" for i in range(1, 100)]
-                self.choose_slug(candidates=candidates)
-        return super().save(*args, **kwargs)
+    def get_slug_candidates(self):
+        return get_slug_candidates(self)
+
+    def get_search_name(self):
+        return normalize_name(
+            " ".join((self.first_name, self.nickname, self.middle_name, self.last_name, self.suffix))
+        )
 
     def get_absolute_url(self):
         if hasattr(self, "adult"):
@@ -150,10 +163,7 @@ class Member(TimeStampedUUIDModel):
         return self.nickname or self.first_name
 
     def choose_slug(self, candidates):
-        for candidate in candidates:
-            if not Member.objects.filter(slug=slugify(candidate)):
-                self.slug = slugify(candidate)
-                break
+        self.slug = SlugAllocator(Member._base_manager.all()).allocate(candidates) or self.slug
         return self.slug
 
     # TODO: breakout function and property
@@ -178,6 +188,32 @@ class Member(TimeStampedUUIDModel):
         return self.get_short_name()
 
 
+class MemberSearchIndex(models.Model):
+    """
+    The FTS5 virtual table indexing each member's search name when running on
+    SQLite. It is created by migration and written to only by the directory
+    manager's update_search_index() and delete_search_index(), but can be
+    joined to for searching.
+    """
+
+    member = models.OneToOneField(
+        Member,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        primary_key=True,
+        related_name="search_index",
+    )
+    name = models.TextField()
+    rank = models.FloatField()
+
+    class Meta:
+        managed = False
+        db_table = "membership_member_fts"
+
+
+MemberSearchIndex._meta.get_field("name").register_lookup(Match)
+
+
 class Family(TimeStampedUUIDModel):
     """Track the relationship between members"""
 
@@ -220,12 +256,17 @@ class Family(TimeStampedUUIDModel):
             return self.name
 
     def save(self, *args, **kwargs):
+        self.name = self.get_name(self.adults.all())
+        return super().save(*args, **kwargs)
+
+    @staticmethod
+    def get_name(adults):
+        """Name a family after its adults' last names, e.g. "Smith-Jones Family"."""
         last_names = []
-        for parent in self.adults.all():
+        for parent in adults:
             if parent.last_name not in last_names:
                 last_names.append(parent.last_name)
-        self.name = "-".join(last_names) + " Family"
-        return super().save(*args, **kwargs)
+        return "-".join(last_names) + " Family"
 
     def years_active(self):
         """
@@ -258,6 +299,11 @@ class Adult(AbstractBaseUser, PermissionsMixin, Member):
         default=True,
         help_text=_("Display this address to other members of the pack."),
     )
+    mail_digest = models.BooleanField(
+        _("Daily digest"),
+        default=False,
+        help_text=_("Receive distribution list messages collected into a single email once a day."),
+    )
 
     role = models.CharField(
         _("Role"),
@@ -325,8 +371,16 @@ class Adult(AbstractBaseUser, PermissionsMixin, Member):
         if self.family and not self.family.is_seperated:
             return self.family.adults.exclude(uuid=self.uuid)
 
+    @cached_property
+    def membership_status(self):
+        """
+        The adult's MembershipStatus, read from the cache at most once for
+        the life of this instance, such as request.user for one request.
+        """
+        return get_membership_status(self)
+
     def is_staff(self):
-        return bool(self._is_staff or self.committee_set.recent().filter(are_staff=True))
+        return self.membership_status.staff
 
     is_staff.boolean = True
     is_staff.short_description = _("Staff")
@@ -336,7 +390,7 @@ class Adult(AbstractBaseUser, PermissionsMixin, Member):
         If member has scouts who are currently active, then they should also be
         considered to be active in the Pack.
         """
-        return bool(self.get_active_scouts())
+        return self.membership_status.active
 
     active.boolean = True
     active.short_description = _("Active")
@@ -507,4 +561,46 @@ class Scout(Member):
         return self.get_grade()
 
 
+class Enrollment(models.Model):
+    """
+    Who is enrolled in the pack each year, kept so that "active" is a lookup
+    on one indexed table rather than a join through families, cubs and their
+    den assignments.
+
+    Each cub assigned to a den has a row for that year, active while the cub
+    is. Each adult in such a family has a row for the year too, active while
+    any of the family's cubs is. Rows are rebuilt a family at a time as cubs,
+    den assignments and adults change; see EnrollmentManager.rebuild().
+    """
+
+    year = models.ForeignKey(PackYear, on_delete=models.CASCADE, related_name="enrollments")
+    family = models.ForeignKey(Family, on_delete=models.CASCADE, blank=True, null=True, related_name="enrollments")
+    adult = models.ForeignKey(Adult, on_delete=models.CASCADE, blank=True, null=True, related_name="enrollments")
+    scout = models.ForeignKey(Scout, on_delete=models.CASCADE, blank=True, null=True, related_name="enrollments")
+    den = models.ForeignKey(Den, on_delete=models.CASCADE, blank=True, null=True, related_name="enrollments")
+    rank = models.IntegerField(choices=Rank.RankChoices.choices, blank=True, null=True)
+    active = models.BooleanField(default=False)
+
+    objects = EnrollmentManager()
+
+    class Meta:
+        constraints = [
+            models.CheckConstraint(
+                condition=models.Q(adult__isnull=True) ^ models.Q(scout__isnull=True), name="enrollment_adult_or_scout"
+            ),
+            models.UniqueConstraint(fields=["year", "adult"], name="unique_adult_enrollment"),
+            models.UniqueConstraint(fields=["year", "scout"], name="unique_scout_enrollment"),
+        ]
+        indexes = [
+            models.Index(fields=["year", "active", "family"]),
+            models.Index(fields=["year", "active", "den"]),
+            models.Index(fields=["year", "active", "rank"]),
+        ]
+        verbose_name = _("Enrollment")
+        verbose_name_plural = _("Enrollments")
+
+    def __str__(self):
+        return f"{self.year}: {self.adult or self.scout}"
+
+
 saved_file.connect(generate_aliases)
@@ -0,0 +1,217 @@
+import csv
+import io
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models.functions import Lower
+from django.utils.text import slugify
+from django.utils.translation import gettext as _
+
+from packman.address_book.models import Address, PhoneNumber
+
+from .models import Adult, Family, Member, Scout
+from .signals import members_changed
+from .slugs import SlugAllocator
+
+# The columns a roster may have, named as in the header row. Columns can come
+# in any order and those a roster doesn't use can be left out.
+MEMBER_COLUMNS = ("first_name", "middle_name", "last_name", "suffix", "nickname", "gender", "date_of_birth")
+ADULT_COLUMNS = (*MEMBER_COLUMNS, "email", "role")
+SCOUT_COLUMNS = (*MEMBER_COLUMNS, "status", "started_school")
+ADDRESS_COLUMNS = {
+    "street": "street",
+    "street2": "street2",
+    "city": "city",
+    "state": "state",
+    "zip_code": "zip_code",
+    "address_type": "type",
+}
+PHONE_NUMBER_COLUMNS = {"phone": "number", "phone_type": "type"}
+
+ADULT_TYPES = ("adult", "parent", "guardian")
+SCOUT_TYPES = ("cub", "scout")
+
+
+def read_roster(file):
+    """
+    Return (line number, row) for each row of the CSV roster in `file`, an
+    open binary file or upload, with each row a dictionary keyed by column name.
+    """
+    try:
+        rows = csv.reader(io.StringIO(file.read().decode("utf-8-sig")))
+    except UnicodeDecodeError:
+        raise ValidationError(_("The roster must be a CSV file saved as UTF-8."))
+
+    header = [slugify(column).replace("-", "_") for column in next(rows, ())]
+    for line, values in enumerate(rows, start=2):
+        row = {column: value.strip() for column, value in zip(header, values)}
+        if any(row.values()):
+            yield line, row
+
+
+def get_choice(field, value):
+    """Accept a choice's label as well as its value, e.g. "Male" for "M"."""
+    for choice, label in field.flatchoices:
+        if value.lower() in (str(choice).lower(), str(label).lower()):
+            return choice
+    return value
+
+
+def build(model, row, columns):
+    """An unsaved `model` with `columns` taken from `row`, the blank ones left at their defaults."""
+    values = {}
+    for column, name in columns.items():
+        field = model._meta.get_field(name)
+        value = row.get(column, "")
+        if not value:
+            values[name] = field.get_default()
+        elif field.choices:
+            values[name] = get_choice(field, value)
+        else:
+            values[name] = value
+    return model(**values)
+
+
+def bulk_create_members(members, batch_size=500):
+    """
+    Insert `members`, Adults and Scouts. bulk_create() refuses models with a
+    concrete parent, so their Member rows are bulk created first, then the
+    rows of each model's own table are inserted in batches the same way.
+    Neither sends any signals.
+    """
+    for member in members:
+        # link each member to its Member row, as saving its parents would
+        member.pk = member.uuid
+    Member.objects.bulk_create(members, batch_size=batch_size)
+
+    by_model = {}
+    for member in members:
+        by_model.setdefault(type(member), []).append(member)
+    for model, objs in by_model.items():
+        model._base_manager.all()._batched_insert(objs, model._meta.local_concrete_fields, batch_size)
+
+
+class RosterImport:
+    """
+    Add the families on a roster to the pack in bulk, one row per adult or
+    cub, as when registering new families each year.
+
+    The member column says whether a row is an adult or a cub, and rows
+    sharing a family column belong to the same new family. Adults may also
+    have an address and a phone number.
+
+    Every row is validated before anything is written, against the emails
+    and slugs already taken as loaded in one query each. Slugs and family
+    names are worked out in memory, and everything is then written in bulk
+    in a single transaction.
+    """
+
+    def __init__(self, rows):
+        self.rows = list(rows)
+        self.errors = []
+        self.families = {}
+        self.family_adults = {}
+        self.adults = []
+        self.scouts = []
+        self.addresses = []
+        self.phone_numbers = []
+
+    def __bool__(self):
+        return not self.errors
+
+    @property
+    def counts(self):
+        return {
+            "families": len(self.families),
+            "adults": len(self.adults),
+            "scouts": len(self.scouts),
+            "addresses": len(self.addresses),
+            "phone_numbers": len(self.phone_numbers),
+        }
+
+    def run(self, dry_run=False):
+        self.validate()
+        if self and not dry_run:
+            self.save()
+        return self
+
+    def validate(self):
+        emails = {row.get("email", "").lower() for line, row in self.rows} - {""}
+        self.taken_emails = set(
+            Adult._base_manager.annotate(lower_email=Lower("email"))
+            .filter(lower_email__in=emails)
+            .order_by()
+            .values_list("lower_email", flat=True)
+        )
+        self.slugs = SlugAllocator(Member._base_manager.all(), preload=True)
+
+        for line, row in self.rows:
+            try:
+                self.validate_row(row)
+            except ValidationError as e:
+                for field, messages in getattr(e, "message_dict", {None: e.messages}).items():
+                    for message in messages:
+                        self.errors.append((line, f"{field}: {message}" if field else message))
+
+        for key, family in self.families.items():
+            adults = sorted(self.family_adults.get(key, ()), key=lambda a: (a.last_name, a.nickname, a.first_name))
+            family.name = Family.get_name(adults)
+        return not self.errors
+
+    def validate_row(self, row):
+        member_type = row.get("member", "").lower()
+        if member_type in ADULT_TYPES:
+            member = build(Adult, row, {column: column for column in ADULT_COLUMNS})
+            member.set_unusable_password()
+            exclude = ["password", "family", "slug"]
+        elif member_type in SCOUT_TYPES:
+            member = build(Scout, row, {column: column for column in SCOUT_COLUMNS})
+            exclude = ["family", "school", "slug"]
+        else:
+            raise ValidationError(_("Say whether the member is an adult or a cub."))
+        member.full_clean(exclude=exclude, validate_unique=False, validate_constraints=False)
+
+        contacts = []
+        if any(row.get(column) for column in ADDRESS_COLUMNS):
+            contacts.append(build(Address, row, ADDRESS_COLUMNS))
+        if any(row.get(column) for column in PHONE_NUMBER_COLUMNS):
+            contacts.append(build(PhoneNumber, row, PHONE_NUMBER_COLUMNS))
+        if contacts and isinstance(member, Scout):
+            raise ValidationError(_("Only adults can have an address or phone number."))
+        for contact in contacts:
+            contact.full_clean(exclude=["member", "venue"], validate_unique=False, validate_constraints=False)
+
+        if isinstance(member, Adult):
+            email = member.email.lower()
+            if email in self.taken_emails:
+                raise ValidationError({"email": _("An adult with this email address already exists.")})
+            self.taken_emails.add(email)
+
+        member.slug = self.allocate_slug(member)
+        member.search_name = member.get_search_name()
+        if family_key := row.get("family"):
+            member.family = self.families.setdefault(family_key, Family())
+        if isinstance(member, Adult):
+            self.adults.append(member)
+            self.family_adults.setdefault(family_key, []).append(member)
+        else:
+            self.scouts.append(member)
+        for contact in contacts:
+            contact.member = member
+            (self.addresses if isinstance(contact, Address) else self.phone_numbers).append(contact)
+
+    def allocate_slug(self, member):
+        if slug := self.slugs.allocate(member.get_slug_candidates()):
+            return slug
+        raise ValidationError(_("There are too many members named %(name)s.") % {"name": member.get_full_name()})
+
+    @transaction.atomic
+    def save(self):
+        Family.objects.bulk_create(self.families.values())
+        bulk_create_members([*self.adults, *self.scouts])
+        Address.objects.bulk_create(self.addresses)
+        PhoneNumber.objects.bulk_create(self.phone_numbers)
+        Member.objects.update_search_index([*self.adults, *self.scouts])
+        # Bulk inserts skip the signals that keep statuses and lists current. New
+        # cubs have yet to be assigned a den, so there are no enrollments to build.
+        members_changed.send(sender=Family)
@@ -0,0 +1,81 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import Signal, receiver
+
+from packman.committees.models import Committee, CommitteeMember
+from packman.dens.models import Den, Membership
+
+from .models import Adult, Enrollment, Member, Scout
+from .status import invalidate_membership_status
+
+# Sent after families, adults or cubs are changed in bulk, in ways that skip
+# their own save signals, for whatever depends on them to catch up.
+members_changed = Signal()
+
+
+def changes_any(update_fields, fields):
+    """Whether a save touching `update_fields` (None meaning all) could change any of `fields`."""
+    return update_fields is None or not update_fields.isdisjoint(fields)
+
+
+@receiver(post_save, sender=Membership)
+@receiver(post_delete, sender=Membership)
+@receiver(post_save, sender=CommitteeMember)
+@receiver(post_delete, sender=CommitteeMember)
+@receiver(post_delete, sender=Committee)
+@receiver(post_delete, sender=Adult)
+@receiver(post_delete, sender=Scout)
+@receiver(members_changed)
+def membership_changed(sender, **kwargs):
+    invalidate_membership_status()
+
+
+@receiver(post_save, sender=Committee)
+def committee_saved(sender, update_fields=None, **kwargs):
+    if changes_any(update_fields, {"are_staff", "are_superusers"}):
+        invalidate_membership_status()
+
+
+@receiver(post_save, sender=Adult)
+def adult_saved(sender, instance, raw=False, update_fields=None, **kwargs):
+    # Fixtures are saved raw, while the rows they refer to may be yet to load.
+    if raw:
+        return
+    # Logging in saves last_login alone, which has no bearing on status.
+    if changes_any(update_fields, {"family", "family_id", "role", "_is_staff"}):
+        invalidate_membership_status()
+    if changes_any(update_fields, {"family", "family_id"}):
+        Enrollment.objects.rebuild_for(adults=[instance.pk])
+
+
+@receiver(post_save, sender=Scout)
+def scout_saved(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+    if changes_any(update_fields, {"status", "family", "family_id"}):
+        invalidate_membership_status()
+        Enrollment.objects.rebuild_for(scouts=[instance.pk])
+
+
+@receiver(post_delete, sender=Scout)
+def scout_deleted(sender, instance, **kwargs):
+    # The cub's own enrollments go with them, but their family's may change.
+    if instance.family_id:
+        Enrollment.objects.rebuild(families=[instance.family_id])
+
+
+@receiver(post_save, sender=Membership)
+@receiver(post_delete, sender=Membership)
+def den_assignment_changed(sender, instance, **kwargs):
+    Enrollment.objects.rebuild_for(scouts=[instance.scout_id])
+
+
+@receiver(post_save, sender=Den)
+def den_saved(sender, instance, update_fields=None, **kwargs):
+    if changes_any(update_fields, {"rank", "rank_id"}):
+        Enrollment.objects.filter(den=instance).update(rank=instance.rank.rank if instance.rank else None)
+
+
+@receiver(post_delete, sender=Member)
+def member_deleted(sender, instance, using, **kwargs):
+    # Deleting an adult or cub deletes their Member row too, sending this as well.
+    Member.objects.db_manager(using).delete_search_index([instance])
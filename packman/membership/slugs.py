@@ -0,0 +1,100 @@
+from django.db import IntegrityError, router, transaction
+from django.db.models import Q
+from django.utils.text import slugify
+
+# How many times to choose a fresh slug when another member claims the one
+# chosen between looking it up and saving
+SLUG_ATTEMPTS = 3
+
+
+def get_slug_candidates(member):
+    """
+    The names to try, in order, when choosing a slug for `member`: their
+    full name, then with their middle initial or name, then their full name
+    followed by a number. Reads only fields, so historical models in data
+    migrations can use it too.
+    """
+    full_name = f"{member.nickname or member.first_name} {member.last_name}"
+    if member.suffix:
+        full_name = f"{full_name} {member.suffix}"
+
+    candidates = [full_name]
+    if member.middle_name and member.suffix:
+        candidates.extend(
+            (
+                f"{member.first_name} {member.middle_name[0]} {member.last_name} {member.suffix}",
+                f"{member.first_name} {member.middle_name} {member.last_name} {member.suffix}",
+            )
+        )
+    elif member.suffix:
+        candidates.append(f"{member.first_name} {member.last_name} {member.suffix}")
+    elif member.middle_name:
+        candidates.extend(
+            (
+                f"{member.first_name} {member.middle_name[0]} {member.last_name}",
+                f"{member.first_name} {member.middle_name} {member.last_name}",
+            )
+        )
+    # None of the normal candidates may be free. Start adding digits to the
+    # end of their name
+    candidates.extend(f"{full_name} {i}" for i in range(1, 100))
+    return candidates
+
+
+class SlugAllocator:
+    """
+    Choose the first free slug from a member's candidate names.
+
+    By default each allocation looks up the taken slugs among its candidates
+    with one query: those starting with the first candidate, which covers
+    the numbered ones, and any others by name. Preloaded, every slug in
+    `queryset` is looked up once instead, for allocating slugs in bulk as
+    imports and data migrations do. Either way, slugs the allocator has
+    handed out are never handed out again.
+    """
+
+    def __init__(self, queryset, preload=False):
+        self.queryset = queryset.order_by()
+        self.allocated = set(self.queryset.values_list("slug", flat=True)) if preload else set()
+        self.preloaded = preload
+
+    def get_taken(self, slugs):
+        if self.preloaded:
+            return self.allocated
+        base, *others = slugs
+        taken = self.queryset.filter(
+            Q(slug__startswith=base) | Q(slug__in=[s for s in others if not s.startswith(base)])
+        )
+        return self.allocated | set(taken.values_list("slug", flat=True))
+
+    def allocate(self, candidates):
+        """Return the first of `candidates`, slugified, not already taken, or None if they all are."""
+        slugs = list(dict.fromkeys(slug for slug in map(slugify, candidates) if slug))
+        if not slugs:
+            return None
+        taken = self.get_taken(slugs)
+        for slug in slugs:
+            if slug not in taken:
+                self.allocated.add(slug)
+                return slug
+        return None
+
+
+def save_with_slug(instance, save, using=None):
+    """
+    Allocate `instance` a slug and `save()` it, choosing again should a
+    concurrent save claim the slug first and trip its unique constraint.
+    """
+    model = instance._meta.get_field("slug").model
+    using = using or router.db_for_write(type(instance), instance=instance)
+    allocator = SlugAllocator(model._base_manager.using(using))
+    for attempt in range(SLUG_ATTEMPTS):
+        instance.slug = allocator.allocate(get_slug_candidates(instance)) or ""
+        try:
+            with transaction.atomic(using=using):
+                return save()
+        except IntegrityError:
+            lost = instance.slug and model._base_manager.using(using).filter(slug=instance.slug).exists()
+            if not lost or attempt == SLUG_ATTEMPTS - 1:
+                raise
+            # the allocator won't offer the lost slug again
@@ -0,0 +1,122 @@
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Case, CharField, Value, When
+from django.db.models.functions import Cast
+
+from packman.calendars.models import PackYear
+from packman.core.cache import cache_is_shared
+
+# Membership status is cached per member and pack year under a shared version
+# number, bumped whenever anything it is built from changes so that every
+# cached status goes stale at once.
+STATUS_CACHE_VERSION_KEY = "membership:status_version"
+
+
+def get_status_cache_key(member_pk, year):
+    return f"membership:status:{member_pk}:{year.pk if year else None}"
+
+
+def invalidate_membership_status():
+    try:
+        cache.incr(STATUS_CACHE_VERSION_KEY)
+    except ValueError:
+        cache.set(STATUS_CACHE_VERSION_KEY, 1, timeout=None)
+
+
+class MembershipStatus:
+    """
+    What an adult's place in the pack allows them to see, as of the current
+    pack year: whether their family is active, whether they are a friend of
+    the pack or staff, whether a committee of theirs makes them superusers,
+    and the dens and committees they belong to.
+    """
+
+    def __init__(self, active=False, contributor=False, staff=False, dens=(), committees=(), superuser=False):
+        self.active = active
+        self.contributor = contributor
+        self.staff = staff
+        self.dens = frozenset(dens)
+        self.committees = frozenset(committees)
+        self.superuser = superuser
+
+    def __repr__(self):
+        return (
+            f"<MembershipStatus active={self.active} contributor={self.contributor} staff={self.staff} "
+            f"superuser={self.superuser} dens={sorted(self.dens)} committees={len(self.committees)}>"
+        )
+
+
+def resolve_membership_status(adult):
+    """
+    Build `adult`'s MembershipStatus with a single UNION query over their
+    family's active cubs, those cubs' dens this year and the committees the
+    adult served on in recent years.
+    """
+    from packman.committees.models import CommitteeMember
+    from packman.dens.models import Membership
+
+    from .models import Scout
+
+    year = PackYear.objects.current()
+    facts = [
+        CommitteeMember.objects.filter(member=adult, year__in=PackYear.objects.recent())
+        .order_by()
+        .values_list(
+            Case(
+                When(committee__are_staff=True, committee__are_superusers=True, then=Value("staff superuser")),
+                When(committee__are_staff=True, then=Value("staff")),
+                When(committee__are_superusers=True, then=Value("superuser")),
+                default=Value("committee"),
+            ),
+            Cast("committee", CharField()),
+        )
+    ]
+    if adult.family_id:
+        facts += [
+            Scout.objects.filter(family=adult.family_id, status=Scout.ACTIVE)
+            .order_by()
+            .values_list(Value("active"), Value("")),
+            Membership.objects.filter(scout__family=adult.family_id, scout__status=Scout.ACTIVE, year_assigned=year)
+            .order_by()
+            .values_list(Value("den"), Cast("den", CharField())),
+        ]
+
+    first, *others = facts
+    active = False
+    staff = adult._is_staff
+    superuser = False
+    dens = set()
+    committees = set()
+    for kind, pk in first.union(*others, all=True):
+        if kind == "active":
+            active = True
+        elif kind == "den":
+            dens.add(int(pk))
+        else:
+            staff = staff or "staff" in kind.split()
+            superuser = superuser or "superuser" in kind.split()
+            committees.add(uuid.UUID(pk))
+    return MembershipStatus(active, adult.role == adult.CONTRIBUTOR, staff, dens, committees, superuser)
+
+
+def get_membership_status(adult):
+    """
+    Return `adult`'s MembershipStatus from the cache, resolving and caching it
+    when it is missing or has gone stale. A cache local to each process can't
+    be invalidated by changes made in the others, so without a shared cache
+    the status is resolved every time, to be remembered only by the instance
+    asking, such as request.user for one request.
+    """
+    if not cache_is_shared():
+        return resolve_membership_status(adult)
+
+    year = PackYear.objects.current()
+    version = cache.get_or_set(STATUS_CACHE_VERSION_KEY, 1, timeout=None)
+    key = get_status_cache_key(adult.pk, year)
+    status = cache.get(key, version=version)
+    if status is None:
+        status = resolve_membership_status(adult)
+        cache.set(key, status, timeout=settings.MEMBERSHIP_STATUS_CACHE_TIMEOUT, version=version)
+    return status
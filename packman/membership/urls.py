@@ -14,5 +14,6 @@ urlpatterns = [
     path("cubs/<slug:slug>/", views.ScoutDetail.as_view(), name="scout_detail"),
     path("cub/<uuid:pk>/update/", views.ScoutUpdate.as_view(), name="scout_update"),
     path("search/", views.MemberSearchResultsList.as_view(), name="search_results"),
+    path("search/typeahead/", views.MemberTypeahead.as_view(), name="typeahead"),
     path("my-family/", views.MyFamilyDetail.as_view(), name="my-family"),
 ]
@@ -1,5 +1,7 @@
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.db.models import Q
+from django.http import JsonResponse
+from django.views import View
 from django.views.generic import CreateView, DetailView, ListView, UpdateView
 
 from .forms import AddressFormSet, AdultCreation, AdultForm, PhoneNumberFormSet, ScoutForm
@@ -38,49 +40,28 @@ class MemberSearchResultsList(LoginRequiredMixin, ListView):
     template_name = "membership/member_search_results.html"
 
     def get_queryset(self):
-        query = self.request.GET.get("q")
-        if self.request.GET.get("alum") == "included":
-            results = (
-                Member.objects.filter(
-                    Q(adult__family__children__status__gte=Scout.ACTIVE) | Q(scout__status__gte=Scout.ACTIVE)
-                )
-                .filter(
-                    Q(first_name__icontains=query)
-                    | Q(last_name__icontains=query)
-                    | Q(middle_name__icontains=query)
-                    | Q(nickname__icontains=query)
-                )
-                .distinct()
-            )
-        else:
-            results = (
-                Member.objects.filter(
-                    Q(adult__family__children__status__exact=Scout.ACTIVE)
-                    | Q(adult__role__exact=Adult.CONTRIBUTOR)
-                    | Q(scout__status__exact=Scout.ACTIVE)
-                )
-                .filter(
-                    Q(first_name__icontains=query)
-                    | Q(last_name__icontains=query)
-                    | Q(middle_name__icontains=query)
-                    | Q(nickname__icontains=query)
-                )
-                .distinct()
-            )
+        return Member.objects.visible_to(
+            self.request.user, include_alumni=self.request.GET.get("alum") == "included"
+        ).search(self.request.GET.get("q", ""))
 
-        if self.request.user.active() or self.request.user.role == Adult.CONTRIBUTOR:
-            # If you have active cubs or are a contributor, you can get all of
-            # the search results
-            return results
-        elif not self.request.user.family:
-            # The user doesn't belong to a family, so we'll just show them
-            # their own information
-            return Member.objects.filter(adult__uuid__exact=self.request.user.uuid)
-        else:
-            # If you are not active, you only get members of your own family
-            return results.filter(
-                Q(adult__family__exact=self.request.user.family) | Q(scout__family__exact=self.request.user.family)
-            )
+
+class MemberTypeahead(LoginRequiredMixin, View):
+    """
+    Suggest members whose names start with what has been typed so far, best
+    matches first, in a single query against the name index.
+    """
+
+    limit = 10
+
+    def get(self, request, *args, **kwargs):
+        members = (
+            Member.objects.visible_to(request.user, include_alumni=request.GET.get("alum") == "included")
+            .search(request.GET.get("q", ""))
+            .select_related("adult", "scout")[: self.limit]
+        )
+        return JsonResponse(
+            {"results": [{"name": str(member), "url": member.get_absolute_url()} for member in members]}
+        )
 
 
 class AdultList(LoginRequiredMixin, ListView):
@@ -120,6 +120,13 @@ CACHES = {
     "default": env.cache("CACHE_URL", default="locmemcache://"),
 }
 
+# Each adult's membership status (active family, staff, dens and committees) is
+# cached for MEMBERSHIP_STATUS_CACHE_TIMEOUT seconds, or until a change to their
+# family, cubs, dens or committees invalidates it. Like distribution list
+# members, it is only cached when CACHE_URL names a cache shared between
+# processes, and otherwise resolved once per request.
+MEMBERSHIP_STATUS_CACHE_TIMEOUT = env.int("MEMBERSHIP_STATUS_CACHE_TIMEOUT", default=60 * 60)
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
@@ -350,6 +357,72 @@ EMAIL_SUBJECT_PREFIX = env("DJANGO_EMAIL_SUBJECT_PREFIX", default=f"[{PACK_SHORT
 ADMINS = getaddresses([env("DJANGO_ADMINS", default="[]")])
 MANAGERS = ADMINS
 
+
+# MAIL DELIVERY
+# Distribution list messages are delivered in chunks of MAIL_DELIVERY_CHUNK_SIZE
+# emails per SMTP connection, with up to MAIL_DELIVERY_CONCURRENCY connections
+# open at once. Temporary failures are retried up to MAIL_DELIVERY_MAX_ATTEMPTS
+# times, waiting MAIL_DELIVERY_RETRY_DELAY seconds and doubling for each retry.
+# The worker's claim on the message is kept alive while it waits.
+# ------------------------------------------------------------------------------
+
+MAIL_DELIVERY_CHUNK_SIZE = env.int("MAIL_DELIVERY_CHUNK_SIZE", default=50)
+MAIL_DELIVERY_CONCURRENCY = env.int("MAIL_DELIVERY_CONCURRENCY", default=4)
+MAIL_DELIVERY_MAX_ATTEMPTS = env.int("MAIL_DELIVERY_MAX_ATTEMPTS", default=5)
+MAIL_DELIVERY_RETRY_DELAY = env.int("MAIL_DELIVERY_RETRY_DELAY", default=10)
+
+# Each send is paced to at most MAIL_DELIVERY_RATE emails per second overall, and
+# to the rate given in MAIL_DELIVERY_DOMAIN_RATES (e.g. "gmail.com=5;yahoo.com=2")
+# for those recipient domains, in bursts of up to MAIL_DELIVERY_BURST. A rate of
+# 0 is unlimited.
+MAIL_DELIVERY_RATE = env.float("MAIL_DELIVERY_RATE", default=0)
+MAIL_DELIVERY_BURST = env.int("MAIL_DELIVERY_BURST", default=10)
+MAIL_DELIVERY_DOMAIN_RATES = env.dict("MAIL_DELIVERY_DOMAIN_RATES", cast={"value": float}, default={})
+
+# The mailworker command polls for queued messages every MAIL_WORKER_POLL_INTERVAL
+# seconds, backing off to MAIL_WORKER_MAX_POLL_INTERVAL while the queue is idle.
+# A message claimed by a worker that has not reported progress for
+# MAIL_WORKER_CLAIM_TIMEOUT seconds is assumed abandoned and claimed again.
+MAIL_WORKER_POLL_INTERVAL = env.float("MAIL_WORKER_POLL_INTERVAL", default=1)
+MAIL_WORKER_MAX_POLL_INTERVAL = env.float("MAIL_WORKER_MAX_POLL_INTERVAL", default=30)
+MAIL_WORKER_CLAIM_TIMEOUT = env.int("MAIL_WORKER_CLAIM_TIMEOUT", default=300)
+
+# Members who prefer a daily digest get their distribution list messages in a
+# single email, sent at MAIL_DIGEST_HOUR (server time) by the senddigests command.
+# Messages claimed by a digest run that has not finished within
+# MAIL_DIGEST_CLAIM_TIMEOUT seconds are assumed abandoned and wait for the next.
+MAIL_DIGEST_HOUR = env.int("MAIL_DIGEST_HOUR", default=18)
+MAIL_DIGEST_CLAIM_TIMEOUT = env.int("MAIL_DIGEST_CLAIM_TIMEOUT", default=60 * 60)
+
+# Resolved distribution list members are cached for MAIL_MEMBERS_CACHE_TIMEOUT
+# seconds, or until a change to dens, committees or members invalidates them.
+# The mail worker runs in a process of its own, so they are only cached when
+# CACHE_URL names a shared cache such as Redis or Memcached; `check --deploy`
+# warns about a cache local to each process.
+MAIL_MEMBERS_CACHE_TIMEOUT = env.int("MAIL_MEMBERS_CACHE_TIMEOUT", default=60 * 60 * 24)
+
+# Mail to the distribution lists' addresses is received by the receivemail
+# command, either from the maildir at MAIL_INBOUND_MAILDIR or handed over by the
+# mail server through LMTP at MAIL_INBOUND_LMTP_ADDRESS (host:port). Messages
+# larger than MAIL_INBOUND_MAX_SIZE bytes are refused.
+#
+# Members post by the From: address of their mail, which is only accepted when
+# it is also the envelope sender. When the mail server checks DMARC and records
+# the result in an Authentication-Results header, set MAIL_INBOUND_AUTHSERV_ID
+# to the server's authserv-id to accept only mail that passed. The server must
+# then remove any Authentication-Results headers claiming that id it receives.
+MAIL_INBOUND_MAILDIR = env("MAIL_INBOUND_MAILDIR", default="")
+MAIL_INBOUND_LMTP_ADDRESS = env("MAIL_INBOUND_LMTP_ADDRESS", default="127.0.0.1:8024")
+MAIL_INBOUND_MAX_SIZE = env.int("MAIL_INBOUND_MAX_SIZE", default=25 * 1024 * 1024)
+MAIL_INBOUND_AUTHSERV_ID = env("MAIL_INBOUND_AUTHSERV_ID", default="")
+
+# When MAIL_BOUNCE_ADDRESS is set, each copy of a list message is sent with a
+# return path of its own (bounces+<recipient>@...) so bounces can be traced back
+# to the recipient. The processbounces command reads them from the maildir at
+# MAIL_BOUNCE_MAILDIR and stops mailing addresses that bounce permanently.
+MAIL_BOUNCE_ADDRESS = env("MAIL_BOUNCE_ADDRESS", default="")
+MAIL_BOUNCE_MAILDIR = env("MAIL_BOUNCE_MAILDIR", default="")
+
 # Temporary fix for ADMIN UI issue updating committees with too many historical entries
 # Seems to be around 125 for the default 1000 fields
 DATA_UPLOAD_MAX_NUMBER_FIELDS = 2000
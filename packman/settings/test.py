@@ -24,3 +24,6 @@ STORAGES = {
 
 # http://whitenoise.evans.io/en/stable/django.html#whitenoise-makes-my-tests-run-slow
 WHITENOISE_AUTOREFRESH = True
+
+# Retry deferred deliveries immediately rather than waiting between attempts
+MAIL_DELIVERY_RETRY_DELAY = 0
@@ -0,0 +1,37 @@
+/* Load older messages as the end of the message list scrolls into view */
+document.addEventListener('DOMContentLoaded', function () {
+    const loadNextPage = function (entries, observer) {
+        entries.forEach(function (entry) {
+            if (!entry.isIntersecting) {
+                return;
+            }
+            const link = entry.target;
+            observer.unobserve(link);
+
+            fetch(link.dataset.nextPage, {headers: {'Accept': 'application/json'}})
+                .then(function (response) {
+                    return response.json();
+                })
+                .then(function (page) {
+                    page.messages.forEach(function (message) {
+                        link.insertAdjacentHTML('beforebegin', message.html);
+                    });
+                    if (page.next) {
+                        const url = new URL(link.dataset.nextPage, window.location.href);
+                        url.searchParams.set('after', page.next);
+                        link.dataset.nextPage = url.pathname + url.search;
+                        url.searchParams.delete('format');
+                        link.href = url.pathname + url.search;
+                        observer.observe(link);
+                    } else {
+                        link.remove();
+                    }
+                });
+        });
+    };
+
+    const observer = new IntersectionObserver(loadNextPage);
+    document.querySelectorAll('[data-next-page]').forEach(function (link) {
+        observer.observe(link);
+    });
+});
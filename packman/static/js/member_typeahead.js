@@ -0,0 +1,53 @@
+/* Suggest matching members as a name is typed into the member search box */
+document.addEventListener('DOMContentLoaded', function () {
+    document.querySelectorAll('[data-typeahead]').forEach(function (input) {
+        const menu = document.getElementById(input.dataset.typeaheadMenu);
+        const alumni = input.form.querySelector('[name="alum"]');
+        let timer = null;
+        let controller = null;
+
+        const suggest = function () {
+            if (controller) {
+                controller.abort();
+            }
+            const query = input.value.trim();
+            if (!query) {
+                menu.classList.remove('show');
+                return;
+            }
+            const url = new URL(input.dataset.typeahead, window.location.href);
+            url.searchParams.set('q', query);
+            if (alumni && alumni.checked) {
+                url.searchParams.set('alum', alumni.value);
+            }
+            controller = new AbortController();
+            fetch(url, {headers: {'Accept': 'application/json'}, signal: controller.signal})
+                .then(function (response) {
+                    return response.json();
+                })
+                .then(function (data) {
+                    menu.replaceChildren();
+                    data.results.forEach(function (member) {
+                        const item = document.createElement('a');
+                        item.className = 'dropdown-item';
+                        item.href = member.url;
+                        item.textContent = member.name;
+                        menu.appendChild(item);
+                    });
+                    menu.classList.toggle('show', data.results.length > 0);
+                })
+                .catch(function () {});
+        };
+
+        input.addEventListener('input', function () {
+            clearTimeout(timer);
+            timer = setTimeout(suggest, 150);
+        });
+        input.addEventListener('blur', function () {
+            // leave time for a click on a suggestion to land
+            setTimeout(function () {
+                menu.classList.remove('show');
+            }, 200);
+        });
+    });
+});
@@ -19,6 +19,7 @@ application = get_wsgi_application()
 logger = logging.getLogger(__name__)
 
 try:
+    from django.conf import settings
     from django.core.management import call_command
 
     import uwsgidecorators
@@ -28,5 +29,24 @@ try:
         """Send queued emails every 10 seconds"""
         call_command("sendemails")
 
+    @uwsgidecorators.cron(0, settings.MAIL_DIGEST_HOUR, -1, -1, -1)
+    def send_digests(num):
+        """Send the daily digests once a day"""
+        call_command("senddigests")
+
+    if settings.MAIL_INBOUND_MAILDIR:
+
+        @uwsgidecorators.timer(10)
+        def receive_emails(num):
+            """Receive mail for the distribution lists every 10 seconds"""
+            call_command("receivemail")
+
+    if settings.MAIL_BOUNCE_MAILDIR:
+
+        @uwsgidecorators.timer(60)
+        def process_bounces(num):
+            """Process bounced mail every minute"""
+            call_command("processbounces")
+
 except ImportError:
     logger.info(_("Module uwsgidecorators not found. Timers are disabled."))
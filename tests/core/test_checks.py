@@ -0,0 +1,15 @@
+from django.test import SimpleTestCase, override_settings
+
+from packman.core.checks import check_cache_is_shared
+
+
+class CacheCheckTestCase(SimpleTestCase):
+    @override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+    def test_process_local_cache(self):
+        self.assertEqual([error.id for error in check_cache_is_shared(None)], ["core.W001"])
+
+    @override_settings(
+        CACHES={"default": {"BACKEND": "django.core.cache.backends.redis.RedisCache", "LOCATION": "redis://"}}
+    )
+    def test_shared_cache(self):
+        self.assertEqual(check_cache_is_shared(None), [])
@@ -0,0 +1,135 @@
+from django.contrib.admin.sites import site
+from django.contrib.auth import get_user_model
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.core import mail
+from django.test import RequestFactory, TestCase
+from django.urls import reverse
+
+from packman.mail.admin import MessageAdmin
+from packman.mail.models import DistributionList, Message, MessageRecipient, ThreadParticipant
+
+User = get_user_model()
+
+
+class MessageAdminSendTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_superuser(email="admin@example.com", password="test")  # nosec B106
+        cls.message = Message.objects.create(author=cls.author, subject="Pack meeting", body="<p>Test</p>")
+        for i in range(3):
+            recipient = User.objects.create_user(email=f"member{i}@example.com")
+            MessageRecipient.objects.create(message=cls.message, recipient=recipient)
+
+    def setUp(self):
+        self.client.force_login(self.author)
+
+    def test_send_queues_message_and_redirects_to_progress(self):
+        request = RequestFactory().post(reverse("admin:mail_message_change", args=(self.message.pk,)), {"_send": ""})
+        request.user = self.author
+        request._messages = CookieStorage(request)
+        response = MessageAdmin(Message, site).response_change(request, self.message)
+
+        self.assertRedirects(
+            response,
+            reverse("admin:mail_message_progress", args=(self.message.pk,)),
+            fetch_redirect_response=False,
+        )
+        self.message.refresh_from_db()
+        self.assertEqual(self.message.status, Message.Status.QUEUED)
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_progress_page(self):
+        self.message.queue()
+        response = self.client.get(reverse("admin:mail_message_progress", args=(self.message.pk,)))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "Queued")
+        self.assertEqual(
+            response.context["status_url"], reverse("admin:mail_message_progress_status", args=(self.message.pk,))
+        )
+
+    def test_progress_status(self):
+        self.message.queue()
+        url = reverse("admin:mail_message_progress_status", args=(self.message.pk,))
+        self.assertEqual(
+            self.client.get(url).json(),
+            {
+                "recipients": 3,
+                "delivered": 0,
+                "failed": 0,
+                "deferred": 0,
+                "digest": 0,
+                "suppressed": 0,
+                "queued": 3,
+                "rate": 0,
+                "status": "QUEUED",
+                "status_display": "Queued",
+                "done": False,
+            },
+        )
+
+        self.message.send()
+        progress = self.client.get(url).json()
+        self.assertEqual(progress["delivered"], 3)
+        self.assertEqual(progress["queued"], 0)
+        self.assertEqual(progress["rate"], 0.1)
+        self.assertTrue(progress["done"])
+
+    def test_change_page_shows_delivery_metrics(self):
+        self.message.send()
+        response = self.client.get(reverse("admin:mail_message_change", args=(self.message.pk,)))
+
+        self.assertContains(response, "Copies rendered")
+        self.assertContains(response, "<th>Sent</th><td>3</td>", html=True)
+
+    def test_progress_is_private_to_the_author(self):
+        other = User.objects.create_superuser(email="other@example.com", password="test")  # nosec B106
+        self.client.force_login(other)
+        response = self.client.get(reverse("admin:mail_message_progress_status", args=(self.message.pk,)))
+
+        self.assertEqual(response.status_code, 403)
+
+    def test_queued_message_cannot_be_changed(self):
+        self.message.queue()
+        request = RequestFactory().get("/")
+        request.user = self.author
+
+        self.assertFalse(MessageAdmin(Message, site).has_change_permission(request, self.message))
+
+    def test_refresh_thread_summaries(self):
+        self.message.send()
+        ThreadParticipant.objects.update(unread_count=5)
+
+        response = self.client.post(
+            reverse("admin:mail_message_changelist"),
+            {"action": "refresh_thread_summaries", "_selected_action": [self.message.pk]},
+            follow=True,
+        )
+
+        self.assertContains(response, "1 thread was successfully recounted.")
+        self.assertEqual(
+            dict(ThreadParticipant.objects.values_list("user__email", "unread_count")),
+            {"admin@example.com": 0, "member0@example.com": 1, "member1@example.com": 1, "member2@example.com": 1},
+        )
+
+
+class DistributionListAdminTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(email="admin@example.com", password="test")  # nosec B106
+        for i in range(3):
+            DistributionList.objects.create(name=f"List {i}", is_all=True)
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def test_changelist_query_count_does_not_grow_with_lists(self):
+        url = reverse("admin:mail_distributionlist_changelist")
+        self.client.get(url)
+        # session, user, list filters, counts, the lists with their prefetched addresses, dens and committees,
+        # every list's members together, the user's membership status, and the campaign and pages context processors
+        with self.assertNumQueries(14):
+            response = self.client.get(url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "field-get_member_count", count=3)
@@ -0,0 +1,132 @@
+import os
+import time
+from unittest import skipUnless
+
+from django.contrib.auth import get_user_model
+from django.db import IntegrityError, connection, transaction
+from django.test import TestCase
+
+import factory
+from unittest_parametrize import ParametrizedTestCase, parametrize
+
+from packman.calendars.models import PackYear
+from packman.dens.factories import DenFactory, MembershipFactory
+from packman.mail.benchmarks import Benchmark, SMTPSink, build_pack
+from packman.mail.models import DistributionList, Message, MessageDistribution, MessageRecipient
+from packman.membership.factories import AdultFactory, FamilyFactory, ScoutFactory
+
+User = get_user_model()
+
+# Benchmarks build large fixtures and are skipped unless explicitly requested,
+# e.g. `PACKMAN_BENCHMARKS=1 python manage.py test tests.mail.test_benchmarks`
+BENCHMARKS_ENABLED = bool(os.environ.get("PACKMAN_BENCHMARKS"))
+
+
+def expand_distribution_lists_one_by_one(message):
+    """
+    The original expansion routine, kept here as a baseline: one savepoint,
+    INSERT and possible SELECT + UPDATE for every member of every list.
+    """
+    for delivery, label in Message.Delivery.choices:
+        for distribution_list in message.distribution_lists.filter(message_distribution_list__delivery=delivery):
+            for member in distribution_list.get_members():
+                try:
+                    with transaction.atomic():
+                        MessageRecipient.objects.create(
+                            message=message, recipient=member, delivery=delivery, from_distro=True
+                        ).distros.add(distribution_list)
+                except IntegrityError:
+                    recipient = MessageRecipient.objects.get(message=message, recipient=member)
+                    recipient.distros.add(distribution_list)
+                    if recipient.delivery < delivery:
+                        recipient.delivery = delivery
+                        recipient.save()
+
+
+@skipUnless(BENCHMARKS_ENABLED, "set PACKMAN_BENCHMARKS to run benchmarks")
+class ExpansionBenchmark(TestCase):
+    member_count = 5000
+
+    @classmethod
+    def setUpTestData(cls):
+        current_year = PackYear.objects.current()
+        dens = [DenFactory(number=number) for number in range(1, 11)]
+        for i in range(cls.member_count // 2):
+            family = FamilyFactory()
+            MembershipFactory(scout=ScoutFactory(family=family), den=dens[i % len(dens)], year_assigned=current_year)
+            AdultFactory.create_batch(2, family=family, email=factory.Sequence(lambda n: f"member{n}@example.com"))
+
+        cls.author = User.objects.create_user(email="author@example.com", password="foo")  # nosec B106
+        cls.everyone = DistributionList.objects.create(name="Everyone", is_all=True)
+        cls.den_one = DistributionList.objects.create(name="Den 1")
+        cls.den_one.dens.add(dens[0])
+
+    def benchmark(self, expand):
+        message = Message.objects.create(author=self.author, subject="Benchmark", body="<p>Benchmark</p>")
+        MessageDistribution.objects.create(message=message, distribution_list=self.everyone, delivery="cc")
+        MessageDistribution.objects.create(message=message, distribution_list=self.den_one, delivery="to")
+
+        queries = []
+
+        def count_queries(execute, sql, params, many, context):
+            queries.append(sql)
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(count_queries):
+            start = time.perf_counter()
+            expand(message)
+            elapsed = time.perf_counter() - start
+
+        self.assertEqual(message.recipients.count(), self.member_count)
+        return elapsed, len(queries)
+
+    def test_expansion(self):
+        legacy_time, legacy_queries = self.benchmark(expand_distribution_lists_one_by_one)
+        bulk_time, bulk_queries = self.benchmark(lambda message: message.expand_distribution_lists())
+
+        print(
+            f"\nExpanding {self.member_count} members: "
+            f"one-by-one {legacy_time:.2f}s / {legacy_queries} queries, "
+            f"bulk {bulk_time:.2f}s / {bulk_queries} queries"
+        )
+        self.assertLess(bulk_queries, legacy_queries)
+        self.assertLess(bulk_time, legacy_time)
+
+
+class BenchmarkHarnessTestCase(TestCase):
+    """Keep the benchmark harness working without paying for the benchmarks."""
+
+    def test_delivers_to_the_sink(self):
+        author = User.objects.create_user(email="author@example.com")
+        with SMTPSink() as sink, self.settings(**sink.get_email_settings()):
+            results = Benchmark(build_pack(5), author, concurrency=2, chunk_size=2).run()
+
+        self.assertEqual([result.phase for result in results], list(Benchmark.phases))
+        for result in results:
+            self.assertEqual(result.messages, 5)
+            self.assertGreater(result.rate, 0)
+            self.assertGreater(result.peak_memory, 0)
+        # the delivery phase runs once timed and once traced
+        self.assertEqual(sink.messages, 10)
+        self.assertEqual(MessageRecipient.objects.filter(status=MessageRecipient.Status.SENT).count(), 5)
+
+
+@skipUnless(BENCHMARKS_ENABLED, "set PACKMAN_BENCHMARKS to run benchmarks")
+class DeliveryBenchmark(ParametrizedTestCase, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(email="author@example.com", password="foo")  # nosec B106
+
+    @parametrize("recipients", [(100,), (1000,), (10000,)])
+    def test_delivery(self, recipients):
+        with SMTPSink() as sink, self.settings(**sink.get_email_settings()):
+            results = Benchmark(build_pack(recipients), self.author).run()
+
+        print()
+        for result in results:
+            print(
+                f"{recipients} recipients, {result.phase}: {result.elapsed:.2f}s, "
+                f"{result.rate:.0f} messages/s, peak {result.peak_memory / 2**20:.1f}MB"
+            )
+            self.assertEqual(result.messages, recipients)
+        self.assertEqual(sink.messages, recipients * 2)
@@ -0,0 +1,129 @@
+from email.message import EmailMessage
+from io import BytesIO
+
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.test import TestCase, override_settings
+
+from packman.mail.bounces import parse_delivery_status, process_bounce
+from packman.mail.digests import DigestPipeline
+from packman.mail.inbound import RejectedMessage
+from packman.mail.models import DistributionList, Message, MessageDistribution, MessageRecipient, SuppressedAddress
+from packman.mail.utils import make_return_path, parse_return_path
+
+User = get_user_model()
+
+
+def compose_bounce(to, status="5.1.1", recipient="member@example.com"):
+    action = "failed" if status.startswith("5") else "delayed"
+    return BytesIO(f"""From: Mail Delivery System <MAILER-DAEMON@mx.example.org>
+To: {to}
+Subject: Undelivered Mail Returned to Sender
+MIME-Version: 1.0
+Content-Type: multipart/report; report-type=delivery-status; boundary="report"
+
+--report
+Content-Type: text/plain
+
+This is the mail system at host mx.example.org.
+
+--report
+Content-Type: message/delivery-status
+
+Reporting-MTA: dns; mx.example.org
+
+Final-Recipient: rfc822; {recipient}
+Action: {action}
+Status: {status}
+Diagnostic-Code: smtp; 550 5.1.1 <{recipient}>:
+    Recipient address rejected: User unknown
+
+--report
+Content-Type: text/rfc822-headers
+
+Subject: Pack meeting
+
+--report--
+""".encode())
+
+
+@override_settings(MAIL_BOUNCE_ADDRESS="bounces@lists.example.com")
+class BounceTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(email="author@example.com", password="foo")  # nosec B106
+        cls.member = User.objects.create_user(email="Member@example.com", mail_digest=True)
+        cls.other = User.objects.create_user(email="other@example.com")
+
+    def test_return_path(self):
+        return_path = make_return_path(self.member)
+
+        self.assertEqual(return_path, f"bounces+{self.member.pk.hex}@lists.example.com")
+        self.assertEqual(parse_return_path(return_path.upper()), self.member.pk)
+        self.assertIsNone(parse_return_path("bounces@lists.example.com"))
+        with self.settings(MAIL_BOUNCE_ADDRESS=""):
+            self.assertIsNone(make_return_path(self.member))
+
+    def test_each_copy_has_its_own_return_path(self):
+        message = Message.objects.create(author=self.author, subject="Test", body="<p>Test</p>")
+        MessageRecipient.objects.create(message=message, recipient=self.other)
+        message.send()
+
+        email = mail.outbox[0]
+        self.assertEqual(email.from_email, make_return_path(self.other))
+        self.assertNotIn("bounces", email.message()["From"])
+
+    def test_hard_bounce_suppresses_the_address(self):
+        for _ in range(2):
+            process_bounce(compose_bounce(make_return_path(self.member)))
+
+        suppressed = SuppressedAddress.objects.get()
+        self.assertEqual(suppressed.address, "member@example.com")
+        self.assertEqual(suppressed.reason, SuppressedAddress.Reason.BOUNCE)
+        self.assertEqual(suppressed.bounces, 2)
+        self.assertIn("User unknown", suppressed.diagnostic)
+
+    def test_temporary_failures_are_not_suppressed(self):
+        bounce = process_bounce(compose_bounce(make_return_path(self.member), status="4.2.2"))
+
+        self.assertFalse(bounce.is_permanent)
+        self.assertFalse(SuppressedAddress.objects.exists())
+
+    def test_report_without_verp(self):
+        process_bounce(compose_bounce("noreply@example.com", recipient="other@example.com"))
+
+        self.assertQuerySetEqual(SuppressedAddress.objects.values_list("address", flat=True), ["other@example.com"])
+
+    def test_rejects_other_mail(self):
+        email = EmailMessage()
+        email["To"] = make_return_path(self.member)
+        email.set_content("I'm out of the office until Monday.")
+        with self.assertRaises(RejectedMessage):
+            process_bounce(BytesIO(email.as_bytes()))
+        with self.assertRaises(RejectedMessage):
+            process_bounce(compose_bounce("noreply@example.com", recipient="stranger@example.org"))
+
+    def test_parse_delivery_status(self):
+        report = "Reporting-MTA: dns; mx\n\nFinal-Recipient: rfc822;a@example.com\nAction: failed\nStatus: 5.2.1\n"
+
+        self.assertEqual(list(parse_delivery_status(report)), [("a@example.com", "5.2.1", "")])
+
+    def test_suppressed_recipients_are_skipped(self):
+        SuppressedAddress.objects.create(address="OTHER@example.com")
+        distribution_list = DistributionList.objects.create(name="Pack")
+        message = Message.objects.create(author=self.author, subject="Test", body="<p>Test</p>")
+        MessageDistribution.objects.create(message=message, distribution_list=distribution_list)
+        for recipient in (self.member, self.other, self.author):
+            MessageRecipient.objects.create(message=message, recipient=recipient, from_distro=True)
+        message.send()
+
+        self.assertEqual([email.to for email in mail.outbox], [[f"{self.author} <{self.author.email}>"]])
+        statuses = dict(message.message_recipients.values_list("recipient__email", "status"))
+        self.assertEqual(statuses["other@example.com"], MessageRecipient.Status.SUPPRESSED)
+        self.assertEqual(statuses["Member@example.com"], MessageRecipient.Status.DIGEST)
+        self.assertEqual(message.get_delivery_progress()["suppressed"], 1)
+
+        # an address suppressed while waiting for the digest is skipped too
+        SuppressedAddress.objects.create(address="member@example.com")
+        self.assertEqual(DigestPipeline().run().sent, 0)
+        self.assertEqual(len(mail.outbox), 1)
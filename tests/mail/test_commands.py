@@ -0,0 +1,193 @@
+from datetime import timedelta
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.management import call_command
+from django.test import TestCase
+from django.utils import timezone
+
+from packman.mail.models import DistributionList, Message, MessageDistribution, MessageRecipient
+
+User = get_user_model()
+
+
+class ClaimTestCase(TestCase):
+    stale_after = timedelta(minutes=5)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(email="author@example.com", password="foo")  # nosec B106
+
+    def create_message(self, status=Message.Status.QUEUED, **kwargs):
+        return Message.objects.create(author=self.author, subject="Test", body="<p>Test</p>", status=status, **kwargs)
+
+    def test_claim_marks_message_sending(self):
+        message = self.create_message()
+        claimed = Message.objects.claim("worker-1", self.stale_after)
+
+        self.assertEqual(claimed, message)
+        self.assertEqual(claimed.status, Message.Status.SENDING)
+        self.assertEqual(claimed.claimed_by, "worker-1")
+        self.assertIsNotNone(claimed.date_claimed)
+
+    def test_each_message_is_claimed_once(self):
+        messages = [self.create_message() for _ in range(3)]
+        self.create_message(status=Message.Status.DRAFT)
+        claimed = [Message.objects.claim(f"worker-{i}", self.stale_after) for i in range(4)]
+
+        self.assertCountEqual(claimed[:3], messages)
+        self.assertIsNone(claimed[3])
+
+    def test_abandoned_claims_are_reclaimed(self):
+        live = self.create_message(status=Message.Status.SENDING, claimed_by="worker-1", date_claimed=timezone.now())
+        abandoned = self.create_message(
+            status=Message.Status.SENDING, claimed_by="worker-2", date_claimed=timezone.now() - timedelta(hours=1)
+        )
+
+        claimed = Message.objects.claim("worker-3", self.stale_after)
+        self.assertEqual(claimed, abandoned)
+        self.assertEqual(claimed.claimed_by, "worker-3")
+        self.assertIsNone(Message.objects.claim("worker-3", self.stale_after))
+        live.refresh_from_db()
+        self.assertEqual(live.claimed_by, "worker-1")
+
+
+class MailWorkerTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(email="author@example.com", password="foo")  # nosec B106
+        cls.recipients = [User.objects.create_user(email=f"member{i}@example.com") for i in range(3)]
+
+    def create_message(self, status=Message.Status.QUEUED):
+        message = Message.objects.create(author=self.author, subject="Test", body="<p>Test</p>", status=status)
+        for recipient in self.recipients:
+            MessageRecipient.objects.create(message=message, recipient=recipient)
+        return message
+
+    def test_burst_sends_queued_messages(self):
+        queued = [self.create_message() for _ in range(2)]
+        draft = self.create_message(status=Message.Status.DRAFT)
+        out = StringIO()
+        call_command("mailworker", "--burst", stdout=out)
+
+        for message in queued:
+            message.refresh_from_db()
+            self.assertEqual(message.status, Message.Status.SENT)
+        draft.refresh_from_db()
+        self.assertEqual(draft.status, Message.Status.DRAFT)
+        self.assertEqual(len(mail.outbox), 6)
+        self.assertIn("Processed 2 messages (0 failed), 6 emails", out.getvalue())
+
+    def test_unexpected_errors_do_not_block_the_queue(self):
+        broken = Message.objects.create(
+            author=self.author, subject="Empty", body="<p>Nobody</p>", status=Message.Status.QUEUED
+        )
+        message = self.create_message()
+        call_command("mailworker", "--burst", stdout=StringIO(), stderr=StringIO())
+
+        broken.refresh_from_db()
+        message.refresh_from_db()
+        self.assertEqual(broken.status, Message.Status.FAILED)
+        self.assertEqual(message.status, Message.Status.SENT)
+
+    def test_sendemails_marks_unsendable_messages_failed(self):
+        broken = Message.objects.create(
+            author=self.author, subject="Empty", body="<p>Nobody</p>", status=Message.Status.QUEUED
+        )
+        message = self.create_message()
+        call_command("sendemails", stdout=StringIO(), stderr=StringIO())
+
+        broken.refresh_from_db()
+        message.refresh_from_db()
+        self.assertEqual(broken.status, Message.Status.FAILED)
+        self.assertEqual(message.status, Message.Status.SENT)
+        self.assertIsNone(Message.objects.claim("worker-1", timedelta(0)))
+
+    def test_sendemails_skips_messages_claimed_elsewhere(self):
+        claimed = self.create_message()
+        Message.objects.claim("worker-1", timedelta(minutes=5))
+        queued = self.create_message()
+        call_command("sendemails", stdout=StringIO())
+
+        claimed.refresh_from_db()
+        queued.refresh_from_db()
+        self.assertEqual(claimed.status, Message.Status.SENDING)
+        self.assertEqual(queued.status, Message.Status.SENT)
+        self.assertEqual(len(mail.outbox), 3)
+
+
+class DigestTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(email="author@example.com", password="foo")  # nosec B106
+        cls.subscribers = [
+            User.objects.create_user(email=f"digest{i}@example.com", mail_digest=True) for i in range(2)
+        ]
+        cls.member = User.objects.create_user(email="member@example.com")
+        cls.distribution_list = DistributionList.objects.create(name="Pack")
+
+    def send(self, subject, recipients, from_distro=True):
+        message = Message.objects.create(author=self.author, subject=subject, body="<p>Test</p>")
+        MessageDistribution.objects.create(message=message, distribution_list=self.distribution_list)
+        for recipient in recipients:
+            MessageRecipient.objects.create(message=message, recipient=recipient, from_distro=from_distro)
+        message.send()
+        return message
+
+    def test_subscribers_wait_for_the_digest(self):
+        message = self.send("Pack meeting", self.subscribers + [self.member])
+
+        self.assertEqual(message.status, Message.Status.SENT)
+        self.assertEqual([email.to for email in mail.outbox], [[f"{self.member} <{self.member.email}>"]])
+        self.assertEqual(
+            MessageRecipient.objects.awaiting_digest().filter(message=message).count(), len(self.subscribers)
+        )
+
+    def test_direct_messages_are_not_held(self):
+        self.send("Just for you", self.subscribers[:1], from_distro=False)
+
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertFalse(MessageRecipient.objects.awaiting_digest().exists())
+
+    def test_one_digest_per_subscriber(self):
+        self.send("Pack meeting", self.subscribers + [self.member])
+        self.send("Popcorn sale", self.subscribers)
+        mail.outbox = []
+        out = StringIO()
+        call_command("senddigests", stdout=out)
+
+        self.assertEqual(len(mail.outbox), len(self.subscribers))
+        for email in mail.outbox:
+            self.assertIn("2 messages", email.subject)
+            self.assertIn("Pack meeting", email.body)
+            self.assertIn("Popcorn sale", email.body)
+        self.assertIn(self.subscribers[0].email, mail.outbox[0].body + mail.outbox[1].body)
+        self.assertFalse(MessageRecipient.objects.awaiting_digest().exists())
+        self.assertEqual(MessageRecipient.objects.filter(status=MessageRecipient.Status.SENT).count(), 5)
+        self.assertIn("Successfully sent 2 digests", out.getvalue())
+
+        # nothing left waiting
+        call_command("senddigests", stdout=StringIO())
+        self.assertEqual(len(mail.outbox), len(self.subscribers))
+
+    def test_messages_claimed_by_another_run_are_skipped(self):
+        self.send("Pack meeting", self.subscribers)
+        mail.outbox = []
+        claimed = MessageRecipient.objects.claim_for_digest(timedelta(hours=1))
+        call_command("senddigests", stdout=StringIO())
+
+        self.assertEqual(mail.outbox, [])
+        self.assertEqual(MessageRecipient.objects.claimed_for_digest(claimed).count(), len(self.subscribers))
+
+    def test_abandoned_claims_are_digested(self):
+        self.send("Pack meeting", self.subscribers)
+        mail.outbox = []
+        MessageRecipient.objects.claim_for_digest(timedelta(hours=1))
+        MessageRecipient.objects.filter(status=MessageRecipient.Status.DIGESTING).update(
+            date_claimed=timezone.now() - timedelta(days=1)
+        )
+        call_command("senddigests", stdout=StringIO())
+
+        self.assertEqual(len(mail.outbox), len(self.subscribers))
+        self.assertEqual(MessageRecipient.objects.filter(status=MessageRecipient.Status.SENT).count(), 2)
@@ -0,0 +1,335 @@
+import tempfile
+from collections import Counter
+from smtplib import SMTPRecipientsRefused, SMTPResponseException
+from unittest.mock import patch
+
+from django.contrib.auth import get_user_model
+from django.core import mail
+from django.core.files.base import ContentFile
+from django.core.mail.backends.locmem import EmailBackend
+from django.template.loader import render_to_string
+from django.test import TestCase, override_settings
+
+from packman.mail.delivery import (
+    DeliveryPipeline,
+    RateLimiter,
+    TokenBucket,
+    chunked,
+    is_transient,
+    message_delivered,
+)
+from packman.mail.models import Attachment, AttachmentBlob, Message, MessageRecipient
+
+User = get_user_model()
+
+
+class RefusingEmailBackend(EmailBackend):
+    """A locmem backend that refuses any address at refused.example.com."""
+
+    def send_messages(self, messages):
+        for message in messages:
+            if any(address.endswith("@refused.example.com>") for address in message.to):
+                raise SMTPRecipientsRefused({message.to[0]: (550, b"No such user")})
+        return super().send_messages(messages)
+
+
+class GreylistingEmailBackend(EmailBackend):
+    """A locmem backend that temporarily rejects the first two attempts for every address."""
+
+    attempts = Counter()
+
+    def send_messages(self, messages):
+        for message in messages:
+            self.attempts[message.to[0]] += 1
+            if self.attempts[message.to[0]] <= 2:
+                raise SMTPResponseException(451, b"Greylisted, try again later")
+        return super().send_messages(messages)
+
+
+class UnreachableEmailBackend(EmailBackend):
+    def open(self):
+        raise ConnectionRefusedError("Connection refused")
+
+
+class ChunkedTestCase(TestCase):
+    def test_chunked(self):
+        self.assertEqual(list(chunked(range(7), 3)), [[0, 1, 2], [3, 4, 5], [6]])
+        self.assertEqual(list(chunked([], 3)), [])
+
+
+class IsTransientTestCase(TestCase):
+    def test_is_transient(self):
+        self.assertTrue(is_transient(SMTPResponseException(451, b"Try again later")))
+        self.assertTrue(is_transient(SMTPRecipientsRefused({"a@example.com": (450, b"Mailbox busy")})))
+        self.assertTrue(is_transient(ConnectionRefusedError()))
+        self.assertFalse(is_transient(SMTPResponseException(550, b"No such user")))
+        self.assertFalse(is_transient(SMTPRecipientsRefused({"a@example.com": (550, b"No such user")})))
+        self.assertFalse(is_transient(ValueError()))
+
+
+class FakeClock:
+    """A clock that only moves when something sleeps."""
+
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class TokenBucketTestCase(TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+
+    def test_bursts_then_paces(self):
+        bucket = TokenBucket(2, capacity=3, clock=self.clock, sleep=self.clock.sleep)
+        waits = [bucket.acquire() for _ in range(5)]
+
+        self.assertEqual(waits, [0, 0, 0, 0.5, 0.5])
+        self.assertEqual(self.clock.now, 1)
+
+    def test_refills_while_idle(self):
+        bucket = TokenBucket(1, capacity=2, clock=self.clock, sleep=self.clock.sleep)
+        bucket.acquire()
+        bucket.acquire()
+        self.clock.now += 10
+
+        # never more than the capacity
+        self.assertEqual([bucket.acquire() for _ in range(3)], [0, 0, 1])
+
+    def test_waiting_callers_queue_up(self):
+        bucket = TokenBucket(1, clock=self.clock, sleep=self.clock.sleep)
+        bucket.reserve()
+
+        self.assertEqual([bucket.reserve() for _ in range(3)], [1, 2, 3])
+
+
+class RateLimiterTestCase(TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+
+    def test_domain_rates(self):
+        limiter = RateLimiter(
+            rate=0, burst=1, domain_rates={"Slow.example.com": 1}, clock=self.clock, sleep=self.clock.sleep
+        )
+        for _ in range(3):
+            limiter.wait("Member <member@slow.example.com>")
+            limiter.wait("member@fast.example.com")
+
+        self.assertEqual(self.clock.now, 2)
+        self.assertEqual(limiter.waited, 2)
+
+    def test_global_rate_applies_to_every_domain(self):
+        limiter = RateLimiter(rate=4, burst=1, domain_rates={}, clock=self.clock, sleep=self.clock.sleep)
+        for i in range(5):
+            limiter.wait(f"member@example{i}.com")
+
+        self.assertEqual(self.clock.now, 1)
+
+    def test_unlimited(self):
+        self.assertFalse(RateLimiter(rate=0, domain_rates={}))
+
+
+class DeliveryPipelineTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(email="author@example.com", password="foo")  # nosec B106
+        cls.recipients = [
+            User.objects.create_user(email=f"member{i}@example.com", first_name="Member", last_name=str(i))
+            for i in range(7)
+        ]
+
+    def setUp(self):
+        self.message = Message.objects.create(author=self.author, subject="Hello", body="<p>Hello Pack</p>")
+        for recipient in self.recipients:
+            MessageRecipient.objects.create(message=self.message, recipient=recipient)
+
+    def test_pipeline_delivers_one_copy_per_recipient(self):
+        delivery = DeliveryPipeline(self.message, chunk_size=2, concurrency=2).run()
+
+        self.assertEqual(delivery.sent, 7)
+        self.assertEqual(delivery.failed, 0)
+        self.assertEqual(len(mail.outbox), 7)
+        self.assertCountEqual(
+            [email.to[0] for email in mail.outbox], [f"Member {i} <member{i}@example.com>" for i in range(7)]
+        )
+        self.assertFalse(self.message.message_recipients.exclude(status=MessageRecipient.Status.SENT).exists())
+        self.assertFalse(self.message.message_recipients.filter(date_delivered__isnull=True).exists())
+
+    def test_pipeline_is_rate_limited(self):
+        limiter = RateLimiter(rate=200, burst=1, domain_rates={})
+        delivery = DeliveryPipeline(self.message, chunk_size=2, limiter=limiter).run()
+
+        self.assertEqual(delivery.sent, 7)
+        # the first email goes out right away, the other six wait their turn
+        self.assertGreaterEqual(delivery.elapsed, 6 / 200)
+        self.assertGreater(delivery.throttled, 0)
+
+    def test_pipeline_skips_recipients_already_delivered(self):
+        self.message.message_recipients.filter(recipient__in=self.recipients[:3]).update(
+            status=MessageRecipient.Status.SENT
+        )
+        delivery = DeliveryPipeline(self.message, chunk_size=2, concurrency=2).run()
+
+        self.assertEqual(delivery.sent, 4)
+        self.assertEqual(len(mail.outbox), 4)
+
+    @override_settings(EMAIL_BACKEND="tests.mail.test_delivery.RefusingEmailBackend")
+    def test_pipeline_records_refused_recipients(self):
+        refused = User.objects.create_user(email="nobody@refused.example.com", first_name="No", last_name="Body")
+        MessageRecipient.objects.create(message=self.message, recipient=refused)
+        delivery = DeliveryPipeline(self.message, chunk_size=3, concurrency=2).run()
+
+        self.assertEqual(delivery.sent, 7)
+        self.assertEqual(delivery.failed, 1)
+        self.assertEqual(self.message.message_recipients.get(recipient=refused).status, MessageRecipient.Status.FAILED)
+
+    @override_settings(EMAIL_BACKEND="tests.mail.test_delivery.UnreachableEmailBackend")
+    def test_pipeline_records_unreachable_server(self):
+        delivery = DeliveryPipeline(self.message, chunk_size=3, concurrency=2).run()
+
+        self.assertEqual(delivery.sent, 0)
+        self.assertEqual(delivery.failed, 7)
+
+    def test_send_marks_message_sent(self):
+        self.message.send()
+
+        self.assertEqual(self.message.status, Message.Status.SENT)
+        self.assertIsNotNone(self.message.date_sent)
+        self.assertEqual(len(mail.outbox), 7)
+
+    @override_settings(MAIL_DELIVERY_CHUNK_SIZE=3)
+    def test_send_records_delivery_metrics(self):
+        received = []
+
+        def receiver(sender, message, metrics, **kwargs):
+            received.append(metrics)
+
+        message_delivered.connect(receiver)
+        self.addCleanup(message_delivered.disconnect, receiver)
+        self.message.send()
+
+        self.message.refresh_from_db()
+        metrics = self.message.delivery_metrics
+        self.assertEqual(metrics["copies"], 7)
+        self.assertEqual(metrics["sent"], 7)
+        self.assertEqual(metrics["chunks"], 3)
+        self.assertEqual(metrics["connections"], 3)
+        self.assertEqual(metrics["chunk_failures"], 0)
+        self.assertGreater(metrics["bytes"], 7 * len("Hello Pack"))
+        self.assertLessEqual(metrics["chunk_time_mean"], metrics["chunk_time_max"])
+        self.assertEqual(received, [metrics])
+
+    @override_settings(EMAIL_BACKEND="tests.mail.test_delivery.UnreachableEmailBackend")
+    def test_metrics_record_connection_failures(self):
+        metrics = DeliveryPipeline(self.message, chunk_size=3, max_attempts=1).run().get_metrics()
+
+        self.assertEqual(metrics["connections"], 0)
+        self.assertEqual(metrics["connection_failures"], 3)
+        self.assertEqual(metrics["chunk_failures"], 7)
+        self.assertEqual(metrics["failed"], 7)
+
+    @override_settings(EMAIL_BACKEND="tests.mail.test_delivery.GreylistingEmailBackend")
+    def test_pipeline_retries_deferred_recipients(self):
+        GreylistingEmailBackend.attempts.clear()
+        delivery = DeliveryPipeline(self.message, chunk_size=3, concurrency=2, retry_delay=0).run()
+
+        self.assertEqual(delivery.sent, 7)
+        self.assertEqual(delivery.failed, 0)
+        self.assertEqual(len(mail.outbox), 7)
+        for recipient in self.message.message_recipients.all():
+            self.assertEqual(recipient.status, MessageRecipient.Status.SENT)
+            self.assertEqual(recipient.attempts, 3)
+            self.assertEqual(recipient.last_error, "")
+
+    @override_settings(EMAIL_BACKEND="tests.mail.test_delivery.GreylistingEmailBackend")
+    def test_pipeline_gives_up_after_max_attempts(self):
+        GreylistingEmailBackend.attempts.clear()
+        delivery = DeliveryPipeline(self.message, max_attempts=2, retry_delay=0).run()
+
+        self.assertEqual(delivery.sent, 0)
+        self.assertEqual(delivery.failed, 7)
+        self.assertEqual(delivery.deferred, 0)
+        self.assertEqual(delivery.get_metrics()["deferred"], 0)
+        self.assertEqual(len(mail.outbox), 0)
+        for recipient in self.message.message_recipients.all():
+            self.assertEqual(recipient.status, MessageRecipient.Status.FAILED)
+            self.assertEqual(recipient.attempts, 2)
+            self.assertIn("Greylisted", recipient.last_error)
+
+    @override_settings(EMAIL_BACKEND="tests.mail.test_delivery.GreylistingEmailBackend", MAIL_WORKER_CLAIM_TIMEOUT=30)
+    def test_pipeline_keeps_its_claim_while_waiting_to_retry(self):
+        GreylistingEmailBackend.attempts.clear()
+        self.message.claimed_by = "worker"
+        clock = FakeClock()
+        with (
+            patch("packman.mail.delivery.time.monotonic", side_effect=clock),
+            patch("packman.mail.delivery.time.sleep", side_effect=clock.sleep) as sleep,
+            patch.object(self.message, "heartbeat") as heartbeat,
+        ):
+            DeliveryPipeline(self.message, max_attempts=3, retry_delay=60).run()
+
+        # waits of 60s and 120s, with a heartbeat at least every 10s
+        self.assertEqual(sum(call.args[0] for call in sleep.call_args_list), 180)
+        self.assertTrue(all(call.args[0] <= 10 for call in sleep.call_args_list))
+        self.assertGreaterEqual(heartbeat.call_count, 18)
+
+    def test_send_resumes_without_duplicates(self):
+        # A previous run was interrupted after delivering to some of the recipients.
+        self.message.status = Message.Status.SENDING
+        self.message.save()
+        self.message.message_recipients.filter(recipient__in=self.recipients[:5]).update(
+            status=MessageRecipient.Status.SENT
+        )
+        self.message.send()
+
+        self.assertEqual(self.message.status, Message.Status.SENT)
+        self.assertCountEqual(
+            [email.to[0] for email in mail.outbox], [f"Member {i} <member{i}@example.com>" for i in (5, 6)]
+        )
+
+    @override_settings(EMAIL_BACKEND="tests.mail.test_delivery.UnreachableEmailBackend")
+    def test_send_marks_message_failed_when_nothing_delivered(self):
+        self.message.send()
+
+        self.assertEqual(self.message.status, Message.Status.FAILED)
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class PersonalizeMessagesTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(email="author@example.com", password="foo")  # nosec B106
+        cls.message = Message.objects.create(author=cls.author, subject="Hello", body="<p>Hello Pack</p>")
+        for i in range(3):
+            recipient = User.objects.create_user(email=f"member{i}@example.com", first_name="Member", last_name=str(i))
+            MessageRecipient.objects.create(message=cls.message, recipient=recipient)
+        Attachment.objects.attach(cls.message, ContentFile(b"%PDF-1.4", name="flyer.pdf"))
+        # the same file again, under another name
+        Attachment.objects.attach(cls.message, ContentFile(b"%PDF-1.4", name="copy.pdf"))
+
+    def test_copies_share_rendering_and_attachments(self):
+        with (
+            patch("packman.mail.utils.render_to_string", wraps=render_to_string) as render,
+            patch.object(AttachmentBlob, "read", autospec=True, side_effect=AttachmentBlob.read) as read,
+        ):
+            emails = [
+                email
+                for pk, email in self.message._personalize_messages(
+                    self.message.message_recipients.select_related("recipient")
+                )
+            ]
+
+        self.assertEqual(render.call_count, 2)
+        self.assertEqual(read.call_count, 1)
+        self.assertEqual(len(emails), 3)
+        for i, email in enumerate(emails):
+            self.assertIn(f"Member {i} <member{i}@example.com>", email.body)
+            self.assertIn(f"member{i}@example.com", email.alternatives[0][0])
+            self.assertIs(email.attachments[0], emails[0].attachments[0])
+        self.assertIn(b"%PDF-1.4", emails[0].attachments[0].get_payload(decode=True))
+        self.assertEqual(emails[0].attachments[0].get_content_type(), "application/pdf")
+        self.assertEqual(emails[0].attachments[1].get_filename(), "copy.pdf")
@@ -0,0 +1,205 @@
+import tempfile
+from email.message import EmailMessage
+from io import BytesIO
+from pathlib import Path
+
+from django.contrib.auth import get_user_model
+from django.contrib.sites.models import Site
+from django.core import mail
+from django.core.files.storage import default_storage
+from django.test import TestCase, override_settings
+
+from packman.mail.inbound import LMTPSession, RejectedMessage, receive_maildir, receive_message
+from packman.mail.models import DistributionList, EmailAddress, Message, MessageRecipient
+from packman.mail.utils import make_message_id, parse_message_id
+
+User = get_user_model()
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class InboundTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.domain = Site.objects.get_current().domain
+        cls.author = User.objects.create_user(email="author@example.com", first_name="Author", last_name="User")
+        cls.member = User.objects.create_user(email="member@example.com", first_name="Member", last_name="User")
+        cls.distribution_list = DistributionList.objects.create(name="Pack")
+        EmailAddress.objects.create(distribution_list=cls.distribution_list, address="pack@example.com")
+
+    def compose(self, sender="member@example.com", to="pack@example.com", **headers):
+        email = EmailMessage()
+        # as recorded by the mail server delivering to the maildir
+        email["Return-Path"] = headers.pop("return_path", f"<{sender}>")
+        email["From"] = f"Someone <{sender}>"
+        email["To"] = to
+        email["Subject"] = headers.pop("subject", "[Pack] Popcorn sale")
+        for name, value in headers.items():
+            email[name.replace("_", "-")] = value
+        email.set_content("Café at 7pm.\n\n<b>Bring a friend</b>\n", cte="quoted-printable")
+        email.add_alternative("<p>Café at 7pm.</p>", subtype="html")
+        email.add_attachment(b"\x89PNG" + bytes(range(256)) * 20, maintype="image", subtype="png", filename="map.png")
+        return email.as_bytes()
+
+    def receive(self, data, recipients=None):
+        return receive_message(BytesIO(data), recipients)
+
+    def test_reply_joins_the_thread(self):
+        parent = Message.objects.create(
+            author=self.author, subject="Popcorn sale", body="<p>Test</p>", status=Message.Status.SENT
+        )
+        MessageRecipient.objects.create(message=parent, recipient=self.member)
+        message = self.receive(
+            self.compose(subject="Re: [Pack] Popcorn sale", In_Reply_To=make_message_id(parent.pk, self.domain))
+        )
+
+        self.assertEqual(message.author, self.member)
+        self.assertEqual(message.parent, parent)
+        self.assertEqual(message.thread, parent.thread)
+        self.assertEqual(message.subject, "Re: Popcorn sale")
+        self.assertEqual(message.status, Message.Status.QUEUED)
+        self.assertQuerySetEqual(message.distribution_lists.all(), [self.distribution_list])
+        # the plain text part is used, escaped
+        self.assertEqual(message.body, "<p>Café at 7pm.</p>\n\n<p>&lt;b&gt;Bring a friend&lt;/b&gt;</p>")
+
+        attachment = message.attachments.get()
+        self.assertEqual(attachment.name, "map.png")
+        self.assertEqual(attachment.blob.content_type, "image/png")
+        with default_storage.open(attachment.blob.file.name) as file:
+            self.assertEqual(file.read(), b"\x89PNG" + bytes(range(256)) * 20)
+
+    def test_copies_can_be_replied_to(self):
+        message = self.receive(self.compose())
+        MessageRecipient.objects.create(message=message, recipient=self.author)
+        message.send()
+
+        email = mail.outbox[0].message()
+        self.assertEqual(parse_message_id(email["Message-ID"], self.domain), message.pk)
+        self.assertEqual(email["List-Post"], "<mailto:pack@example.com>")
+
+        reply = self.receive(self.compose(sender=self.author.email, In_Reply_To=email["Message-ID"]))
+        MessageRecipient.objects.create(message=reply, recipient=self.member)
+        reply.send()
+        self.assertEqual(reply.thread, message.thread)
+        self.assertEqual(mail.outbox[-1].message()["In-Reply-To"], email["Message-ID"])
+
+    def test_replies_to_messages_the_author_never_saw_start_a_new_thread(self):
+        private = Message.objects.create(author=self.author, subject="Private", body="<p>Test</p>")
+        message = self.receive(self.compose(In_Reply_To=make_message_id(private.pk, self.domain)))
+
+        self.assertIsNone(message.parent)
+        self.assertNotEqual(message.thread, private.thread)
+
+    def test_rejections(self):
+        tests = {
+            "unknown sender": self.compose(sender="stranger@example.org"),
+            "unknown list": self.compose(to="nobody@example.com"),
+            "mail loop": self.compose(Message_ID=make_message_id(self.author.pk, self.domain)),
+        }
+        for reason, data in tests.items():
+            with self.subTest(reason), self.assertRaises(RejectedMessage):
+                self.receive(data)
+        with self.settings(MAIL_INBOUND_MAX_SIZE=1024), self.assertRaises(RejectedMessage) as e:
+            self.receive(self.compose())
+        self.assertEqual(e.exception.code, 552)
+        self.assertFalse(Message.objects.exists())
+
+    def test_author_must_be_the_envelope_sender(self):
+        tests = {
+            "forged sender": self.compose(return_path="<stranger@example.org>"),
+            "no envelope sender": self.compose(return_path="<>"),
+        }
+        for reason, data in tests.items():
+            with self.subTest(reason), self.assertRaises(RejectedMessage):
+                self.receive(data)
+        with self.assertRaises(RejectedMessage):
+            receive_message(BytesIO(self.compose()), sender="stranger@example.org")
+
+        message = receive_message(BytesIO(self.compose(return_path="<>")), sender="MEMBER@example.com")
+        self.assertEqual(message.author, self.member)
+
+    @override_settings(MAIL_INBOUND_AUTHSERV_ID="mx.example.com")
+    def test_authentication_results(self):
+        tests = {
+            "not checked": self.compose(),
+            "failed": self.compose(Authentication_Results="mx.example.com; dmarc=fail header.from=example.com"),
+            "checked elsewhere": self.compose(Authentication_Results="mx.example.org; dmarc=pass"),
+        }
+        for reason, data in tests.items():
+            with self.subTest(reason), self.assertRaises(RejectedMessage):
+                self.receive(data)
+
+        message = self.receive(
+            self.compose(Authentication_Results="mx.example.com 1; spf=pass; dmarc=pass header.from=example.com")
+        )
+        self.assertEqual(message.author, self.member)
+
+    def test_envelope_recipients_take_precedence(self):
+        message = self.receive(self.compose(to="someone@example.org"), recipients=["PACK@example.com"])
+
+        self.assertQuerySetEqual(message.distribution_lists.all(), [self.distribution_list])
+
+    def test_maildir(self):
+        maildir = Path(tempfile.mkdtemp())
+        for folder in ("new", "cur", "tmp"):
+            (maildir / folder).mkdir()
+        (maildir / "new" / "1.accepted").write_bytes(self.compose())
+        (maildir / "new" / "2.rejected").write_bytes(self.compose(sender="stranger@example.org"))
+
+        self.assertEqual(receive_maildir(maildir), (1, 1))
+        self.assertEqual(
+            sorted(path.name for path in (maildir / "cur").iterdir()), ["1.accepted:2,S", "2.rejected:2,T"]
+        )
+        self.assertEqual(list((maildir / "new").iterdir()), [])
+
+    def test_lmtp_session(self):
+        data = self.compose().replace(b"\n", b"\r\n")
+        commands = (
+            b"LHLO mx.example.com\r\n"
+            b"MAIL FROM:<member@example.com>\r\n"
+            b"RCPT TO:<nobody@example.com>\r\n"
+            b"RCPT TO:<pack@example.com>\r\n"
+            b"DATA\r\n" + data.replace(b"\r\n.", b"\r\n..") + b".\r\n"
+            b"QUIT\r\n"
+        )
+        output = BytesIO()
+        LMTPSession(BytesIO(commands), output, hostname="lists.example.com").run()
+
+        codes = [line[:3] for line in output.getvalue().decode().splitlines()]
+        self.assertEqual(codes, ["220", "250", "250", "250", "250", "250", "550", "250", "354", "250", "221"])
+        self.assertEqual(Message.objects.get().subject, "Popcorn sale")
+
+    def test_lmtp_rejections(self):
+        def transaction(data):
+            return (
+                b"MAIL FROM:<member@example.com>\r\n"
+                b"RCPT TO:<pack@example.com>\r\n"
+                b"DATA\r\n" + data.replace(b"\n", b"\r\n").replace(b"\r\n.", b"\r\n..") + b".\r\n"
+            )
+
+        data = self.compose()
+        commands = (
+            b"LHLO mx.example.com\r\n"
+            + transaction(self.compose(Keywords=" ".join(["popcorn"] * 200)))
+            + transaction(self.compose(sender="stranger@example.org"))
+            + transaction(data)
+            + b"QUIT\r\n"
+        )
+        output = BytesIO()
+        with self.settings(MAIL_INBOUND_MAX_SIZE=len(data) + 500):
+            LMTPSession(BytesIO(commands), output, hostname="lists.example.com").run()
+
+        replies = [line for line in output.getvalue().decode().splitlines() if line.startswith("5")]
+        self.assertEqual([reply[:9] for reply in replies], ["552 5.3.4", "550 5.7.1"])
+        # the rest of the oversized message was read, so the conversation carried on
+        self.assertTrue(output.getvalue().decode().endswith("250 2.0.0 Ok\r\n221 2.0.0 Bye\r\n"))
+        self.assertEqual(Message.objects.get().subject, "Popcorn sale")
+
+
+class MessageIdTestCase(TestCase):
+    def test_round_trip(self):
+        message = Message(subject="Test")
+
+        self.assertEqual(parse_message_id(make_message_id(message.pk, "example.com"), "EXAMPLE.com"), message.pk)
+        self.assertIsNone(parse_message_id(make_message_id(message.pk, "example.com"), "example.org"))
+        self.assertIsNone(parse_message_id("<CAF=abc@mail.gmail.com>", "mail.gmail.com"))
+        self.assertIsNone(parse_message_id("", "example.com"))
@@ -0,0 +1,436 @@
+import tempfile
+
+from django.contrib.admin.helpers import ACTION_CHECKBOX_NAME
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from packman.calendars.models import PackYear
+from packman.committees.models import Committee, CommitteeMember
+from packman.dens.factories import DenFactory, MembershipFactory
+from packman.mail.models import (
+    Attachment,
+    AttachmentBlob,
+    DistributionList,
+    Message,
+    MessageDistribution,
+    MessageRecipient,
+    MessageSearchIndex,
+    Thread,
+    ThreadParticipant,
+)
+from packman.membership.factories import AdultFactory, FamilyFactory, ScoutFactory
+from packman.membership.forms import FamilyForm
+
+User = get_user_model()
+
+# A cache shared between processes, which distribution list members are only cached in
+SHARED_CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": tempfile.mkdtemp(),
+    }
+}
+
+
+def create_active_family(den, adults=2):
+    family = FamilyFactory()
+    MembershipFactory(scout=ScoutFactory(family=family), den=den, year_assigned=PackYear.objects.current())
+    return [AdultFactory(family=family) for _ in range(adults)]
+
+
+class ExpandDistributionListsTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.den1 = DenFactory(number=1)
+        cls.den2 = DenFactory(number=2)
+        cls.den1_adults = create_active_family(cls.den1) + create_active_family(cls.den1)
+        cls.den2_adults = create_active_family(cls.den2)
+        cls.author = User.objects.create_user(email="author@example.com", password="foo")  # nosec B106
+
+        cls.everyone = DistributionList.objects.create(name="Everyone", is_all=True)
+        cls.den1_list = DistributionList.objects.create(name="Den 1")
+        cls.den1_list.dens.add(cls.den1)
+        cls.den2_list = DistributionList.objects.create(name="Den 2")
+        cls.den2_list.dens.add(cls.den2)
+
+    def setUp(self):
+        cache.clear()
+        PackYear.objects.current()
+        self.message = Message.objects.create(author=self.author, subject="Test", body="<p>Test</p>")
+
+    def test_expansion_creates_one_recipient_per_member(self):
+        MessageDistribution.objects.create(message=self.message, distribution_list=self.den1_list)
+        MessageDistribution.objects.create(message=self.message, distribution_list=self.den2_list)
+        self.message.expand_distribution_lists()
+
+        self.assertQuerySetEqual(
+            self.message.recipients.order_by("pk"),
+            sorted(self.den1_adults + self.den2_adults, key=lambda a: a.pk),
+        )
+        self.assertFalse(MessageRecipient.objects.filter(message=self.message, from_distro=False).exists())
+
+    def test_expansion_upgrades_delivery_and_tracks_every_distro(self):
+        MessageDistribution.objects.create(
+            message=self.message, distribution_list=self.everyone, delivery=Message.Delivery.CC
+        )
+        MessageDistribution.objects.create(
+            message=self.message, distribution_list=self.den1_list, delivery=Message.Delivery.TO
+        )
+        self.message.expand_distribution_lists()
+
+        for adult in self.den1_adults:
+            recipient = MessageRecipient.objects.get(message=self.message, recipient=adult)
+            self.assertEqual(recipient.delivery, Message.Delivery.TO)
+            self.assertCountEqual(recipient.distros.all(), [self.everyone, self.den1_list])
+        for adult in self.den2_adults:
+            recipient = MessageRecipient.objects.get(message=self.message, recipient=adult)
+            self.assertEqual(recipient.delivery, Message.Delivery.CC)
+            self.assertCountEqual(recipient.distros.all(), [self.everyone])
+
+    def test_expansion_upgrades_existing_recipients(self):
+        adult = self.den1_adults[0]
+        MessageRecipient.objects.create(message=self.message, recipient=adult, delivery=Message.Delivery.CC)
+        MessageDistribution.objects.create(
+            message=self.message, distribution_list=self.den1_list, delivery=Message.Delivery.TO
+        )
+        self.message.expand_distribution_lists()
+
+        recipient = MessageRecipient.objects.get(message=self.message, recipient=adult)
+        self.assertEqual(recipient.delivery, Message.Delivery.TO)
+        self.assertFalse(recipient.from_distro)
+        self.assertCountEqual(recipient.distros.all(), [self.den1_list])
+
+    def test_expansion_is_idempotent(self):
+        MessageDistribution.objects.create(message=self.message, distribution_list=self.everyone)
+        self.message.expand_distribution_lists()
+        self.message.expand_distribution_lists()
+
+        self.assertEqual(self.message.recipients.count(), len(self.den1_adults + self.den2_adults))
+        self.assertEqual(
+            MessageRecipient.distros.through.objects.filter(messagerecipient__message=self.message).count(), 6
+        )
+
+    def test_expansion_query_count_does_not_grow_with_members(self):
+        MessageDistribution.objects.create(message=self.message, distribution_list=self.everyone)
+        MessageDistribution.objects.create(message=self.message, distribution_list=self.den1_list)
+        MessageDistribution.objects.create(message=self.message, distribution_list=self.den2_list)
+
+        # distribution lists, members, existing recipients, insert recipients,
+        # recipient keys, insert distros, plus the surrounding savepoint
+        with self.assertNumQueries(8):
+            self.message.expand_distribution_lists()
+
+    @override_settings(CACHES=SHARED_CACHES)
+    def test_expansion_reuses_cached_members(self):
+        MessageDistribution.objects.create(message=self.message, distribution_list=self.den1_list)
+        DistributionList.objects.filter(pk=self.den1_list.pk).resolve_members()
+
+        # the members query is answered from the cache
+        with self.assertNumQueries(7):
+            self.message.expand_distribution_lists()
+
+
+@override_settings(CACHES=SHARED_CACHES)
+class DistributionListMembersCacheTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.den = DenFactory(number=1)
+        cls.adults = create_active_family(cls.den)
+        cls.den_list = DistributionList.objects.create(name="Den 1")
+        cls.den_list.dens.add(cls.den)
+        cls.committee = Committee.objects.create(name="Activities")
+        cls.committee_list = DistributionList.objects.create(name="Activities")
+        cls.committee_list.committees.add(cls.committee)
+
+    def setUp(self):
+        cache.clear()
+        PackYear.objects.current()
+
+    def assertMembers(self, distribution_list, members):
+        self.assertEqual(distribution_list.get_member_ids(), {member.pk for member in members})
+
+    def test_resolved_members_are_cached(self):
+        self.assertMembers(self.den_list, self.adults)
+
+        with self.assertNumQueries(0):
+            self.assertMembers(self.den_list, self.adults)
+
+    @override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+    def test_not_cached_in_a_process_local_cache(self):
+        self.assertMembers(self.den_list, self.adults)
+
+        # resolved again, as another process couldn't invalidate them
+        with self.assertNumQueries(1):
+            self.assertMembers(self.den_list, self.adults)
+
+    def test_only_uncached_lists_are_resolved(self):
+        self.den_list.get_member_ids()
+
+        # the lists themselves, then the committee list's members
+        with self.assertNumQueries(2):
+            members = DistributionList.objects.resolve_members()
+        self.assertEqual(members, {self.den_list.pk: {a.pk for a in self.adults}, self.committee_list.pk: set()})
+
+    def test_den_membership_changes_invalidate(self):
+        self.assertMembers(self.den_list, self.adults)
+        adults = create_active_family(self.den)
+
+        self.assertMembers(self.den_list, self.adults + adults)
+
+    def test_committee_membership_changes_invalidate(self):
+        self.assertMembers(self.committee_list, [])
+        member = CommitteeMember.objects.create(
+            committee=self.committee, member=self.adults[0], year=PackYear.objects.current()
+        )
+        self.assertMembers(self.committee_list, [self.adults[0]])
+
+        member.delete()
+        self.assertMembers(self.committee_list, [])
+
+    def test_scout_status_changes_invalidate(self):
+        self.assertMembers(self.den_list, self.adults)
+        scout = self.adults[0].family.children.get()
+        scout.status = scout.INACTIVE
+        scout.save()
+
+        self.assertMembers(self.den_list, [])
+
+    def test_admin_status_actions_invalidate(self):
+        admin = User.objects.create_superuser(email="admin@example.com", password="foo")  # nosec B106
+        self.client.force_login(admin)
+        self.assertMembers(self.den_list, self.adults)
+        scout = self.adults[0].family.children.get()
+        self.client.post(
+            reverse("admin:membership_scout_changelist"),
+            {"action": "make_inactive", ACTION_CHECKBOX_NAME: [scout.pk]},
+        )
+
+        self.assertMembers(self.den_list, [])
+
+    def test_family_form_invalidates(self):
+        self.assertMembers(self.den_list, self.adults)
+        family = self.adults[0].family
+        data = {"name": family.name, "adults": [self.adults[0].pk], "children": [family.children.get().pk]}
+        form = FamilyForm(data, instance=family)
+        self.assertTrue(form.is_valid(), form.errors)
+        form.save()
+
+        self.assertMembers(self.den_list, [self.adults[0]])
+
+    def test_unrelated_saves_keep_the_cache(self):
+        self.den_list.get_member_ids()
+        self.adults[0].save(update_fields=["last_login"])
+
+        with self.assertNumQueries(0):
+            self.den_list.get_member_ids()
+
+    def test_selection_changes_invalidate(self):
+        self.assertMembers(self.committee_list, [])
+        self.committee_list.dens.add(self.den)
+
+        self.assertMembers(self.committee_list, self.adults)
+
+
+class MessageSearchTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(email="author@example.com", password="foo")  # nosec B106
+        cls.camping = Message.objects.create(
+            author=cls.author, subject="Camping trip", body="<p>Bring a tent &amp; sleeping bag.</p>"
+        )
+        cls.meeting = Message.objects.create(
+            author=cls.author, subject="Pack meeting", body="<p>Our next meeting is before the campout.</p>"
+        )
+        cls.popcorn = Message.objects.create(author=cls.author, subject="Popcorn sale", body="<p>Orders are due.</p>")
+
+    def test_search_document_is_plain_text(self):
+        self.assertEqual(self.camping.search_document, "Camping trip\nBring a tent & sleeping bag.")
+
+    def test_search_matches_subject_and_body(self):
+        self.assertQuerySetEqual(Message.objects.search("tent"), [self.camping])
+        self.assertQuerySetEqual(Message.objects.search("meeting"), [self.meeting])
+        self.assertQuerySetEqual(Message.objects.search("pack meeting"), [self.meeting])
+        self.assertQuerySetEqual(Message.objects.search("tent meeting"), [])
+
+    def test_search_stems_words(self):
+        self.assertQuerySetEqual(Message.objects.search("meetings"), [self.meeting])
+
+    def test_search_tolerates_punctuation(self):
+        self.assertQuerySetEqual(Message.objects.search('"tent" (sleeping*'), [self.camping])
+
+    def test_search_index_follows_edits(self):
+        self.popcorn.body = "<p>Deliveries start Saturday.</p>"
+        self.popcorn.save()
+
+        self.assertQuerySetEqual(Message.objects.search("orders"), [])
+        self.assertQuerySetEqual(Message.objects.search("deliveries"), [self.popcorn])
+
+    def test_search_index_follows_deletes(self):
+        pk = self.popcorn.pk
+        self.popcorn.delete()
+
+        self.assertFalse(MessageSearchIndex.objects.filter(message_id=pk).exists())
+        self.assertTrue(MessageSearchIndex.objects.filter(message=self.camping).exists())
+
+    def test_search_ranks_better_matches_first(self):
+        meetings = Message.objects.create(
+            author=self.author, subject="Meeting schedule", body="<p>Den meeting, pack meeting, committee meeting</p>"
+        )
+
+        self.assertQuerySetEqual(Message.objects.search("meeting"), [meetings, self.meeting])
+
+
+@override_settings(MEDIA_ROOT=tempfile.mkdtemp())
+class AttachmentBlobTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(email="author@example.com", password="foo")  # nosec B106
+
+    def create_message(self):
+        return Message.objects.create(author=self.author, subject="Flyer", body="<p>Test</p>")
+
+    def attach(self, message, content=b"%PDF-1.4 flyer", name="Flyer.PDF"):
+        return Attachment.objects.attach(message, ContentFile(content, name=name))
+
+    def test_identical_files_are_stored_once(self):
+        attachments = [self.attach(self.create_message(), name=f"flyer{i}.pdf") for i in range(5)]
+
+        blob = AttachmentBlob.objects.get()
+        self.assertEqual(blob.references, 5)
+        self.assertEqual(blob.size, len(b"%PDF-1.4 flyer"))
+        self.assertEqual(blob.content_type, "application/pdf")
+        self.assertTrue(blob.file.name.endswith(f"{blob.sha256}.pdf"))
+        self.assertEqual([attachment.name for attachment in attachments], [f"flyer{i}.pdf" for i in range(5)])
+        self.assertEqual(attachments[0].url, attachments[4].url)
+
+    def test_different_files_get_their_own_blobs(self):
+        message = self.create_message()
+        self.attach(message)
+        self.attach(message, b"Camping checklist", "checklist.txt")
+
+        self.assertEqual(AttachmentBlob.objects.count(), 2)
+
+    def test_blob_is_collected_with_its_last_reference(self):
+        first, second = self.create_message(), self.create_message()
+        attachment = self.attach(first)
+        self.attach(second)
+        blob = AttachmentBlob.objects.get()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            attachment.delete()
+        blob.refresh_from_db()
+        self.assertEqual(blob.references, 1)
+        self.assertTrue(default_storage.exists(blob.file.name))
+
+        # deleting the message takes its attachments, and so the blob, with it
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(AttachmentBlob.objects.exists())
+        self.assertFalse(default_storage.exists(blob.file.name))
+
+    def test_file_survives_being_stored_again_before_the_deletion_commits(self):
+        attachment = self.attach(self.create_message())
+        blob = AttachmentBlob.objects.get()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            attachment.delete()
+            # the same flyer comes in again before the file is cleaned up
+            self.attach(self.create_message())
+
+        self.assertEqual(AttachmentBlob.objects.get().file.name, blob.file.name)
+        self.assertTrue(default_storage.exists(blob.file.name))
+
+
+class ThreadSummaryTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(email="author@example.com", password="foo")  # nosec B106
+        cls.members = [User.objects.create_user(email=f"member{i}@example.com") for i in range(2)]
+
+    def send(self, subject, author, recipients, parent=None):
+        message = Message.objects.create(author=author, subject=subject, body="<p>Test</p>", parent=parent)
+        for recipient in recipients:
+            MessageRecipient.objects.create(message=message, recipient=recipient)
+        message.send()
+        return message
+
+    def unread_counts(self, thread):
+        return dict(ThreadParticipant.objects.filter(thread=thread).values_list("user__email", "unread_count"))
+
+    def test_summary_is_kept_up_to_date(self):
+        message = self.send("Pack meeting", self.author, self.members)
+        Message.objects.create(author=self.members[0], subject="Re: Pack meeting", body="<p>Draft</p>", parent=message)
+        thread = Thread.objects.get()
+
+        self.assertEqual(thread.last_message, message)
+        self.assertEqual(thread.message_count, 1)
+        self.assertEqual(thread.participant_count, 3)
+        self.assertEqual(
+            self.unread_counts(thread),
+            {"author@example.com": 0, "member0@example.com": 1, "member1@example.com": 1},
+        )
+
+        reply = self.send("Re: Pack meeting", self.members[0], [self.author], parent=message)
+        thread.refresh_from_db()
+
+        self.assertEqual(thread.last_message, reply)
+        self.assertEqual(thread.message_count, 2)
+        self.assertEqual(
+            self.unread_counts(thread),
+            {"author@example.com": 1, "member0@example.com": 1, "member1@example.com": 1},
+        )
+
+    def test_sending_touches_only_its_own_participants(self):
+        message = self.send("Pack meeting", self.author, self.members)
+        message.send()  # resuming a send counts nothing twice
+        ThreadParticipant.objects.filter(user=self.members[1]).update(unread_count=5)
+
+        self.send("Re: Pack meeting", self.members[0], [self.author], parent=message)
+        thread = Thread.objects.get()
+
+        self.assertEqual(thread.message_count, 2)
+        self.assertEqual(
+            self.unread_counts(thread),
+            {"author@example.com": 1, "member0@example.com": 1, "member1@example.com": 5},
+        )
+
+        Thread.objects.refresh_summaries()
+        self.assertEqual(self.unread_counts(thread)["member1@example.com"], 1)
+
+    def test_reading_updates_unread_counts(self):
+        message = self.send("Pack meeting", self.author, self.members)
+        receipts = MessageRecipient.objects.filter(message=message)
+
+        receipts.get(recipient=self.members[0]).mark_read()
+        self.assertEqual(self.unread_counts(message.thread)["member0@example.com"], 0)
+
+        receipts.mark_read()
+        self.assertEqual(self.unread_counts(message.thread)["member1@example.com"], 0)
+
+        receipts.get(recipient=self.members[0]).mark_unread()
+        self.assertEqual(self.unread_counts(message.thread)["member0@example.com"], 1)
+
+    def test_deleting_a_message_updates_the_summary(self):
+        message = self.send("Pack meeting", self.author, self.members)
+        reply = self.send("Re: Pack meeting", self.members[0], [self.author], parent=message)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            reply.delete()
+        thread = Thread.objects.get()
+
+        self.assertEqual(thread.last_message, message)
+        self.assertEqual(thread.message_count, 1)
+        self.assertEqual(self.unread_counts(thread)["author@example.com"], 0)
+
+    def test_for_user(self):
+        message = self.send("Pack meeting", self.author, self.members[:1])
+        self.send("Den meeting", self.author, self.members[1:])
+
+        threads = Thread.objects.for_user(self.members[0])
+        self.assertQuerySetEqual(threads, [message.thread])
+        self.assertEqual(threads[0].unread_count, 1)
+        self.assertEqual(Thread.objects.for_user(self.author).count(), 2)
@@ -0,0 +1,49 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+
+from packman.mail.models import Message
+from packman.mail.utils import PersonalizedTemplate, create_mime_attachment
+
+User = get_user_model()
+
+
+class PersonalizedTemplateTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.recipient = User.objects.create_user(
+            email="dan@example.com", first_name="Daniel", nickname="Dan", last_name="O'Brien"
+        )
+
+    def test_render_fills_in_recipient(self):
+        template = PersonalizedTemplate("mail/message_body.txt", {"message": None, "site": None})
+
+        self.assertIn("This email was sent to Dan O'Brien <dan@example.com>.", template.render(self.recipient))
+
+    def test_render_escapes_recipient_when_autoescaping(self):
+        template = PersonalizedTemplate("mail/message_body.html", {"message": None, "site": None}, autoescape=True)
+        rendered = template.render(self.recipient)
+
+        self.assertIn("Dan O&#x27;Brien &lt;<em>dan@example.com</em>&gt;", rendered)
+        self.assertNotIn("%%", rendered)
+
+    def test_render_leaves_markers_in_the_message_alone(self):
+        message = Message(subject="Mail merge", body="<p>Dear %%recipient.email%% and %%recipient.foo%%</p>")
+        template = PersonalizedTemplate("mail/message_body.txt", {"message": message, "site": None})
+        rendered = template.render(self.recipient)
+
+        self.assertIn("Dear %%recipient.email%% and %%recipient.foo%%", rendered)
+        self.assertIn("This email was sent to Dan O'Brien <dan@example.com>.", rendered)
+
+
+class CreateMIMEAttachmentTestCase(TestCase):
+    def test_create_mime_attachment(self):
+        attachment = create_mime_attachment("flyer.pdf", b"%PDF-1.4")
+
+        self.assertEqual(attachment.get_content_type(), "application/pdf")
+        self.assertEqual(attachment.get_filename(), "flyer.pdf")
+        self.assertEqual(attachment.get_payload(decode=True), b"%PDF-1.4")
+
+    def test_create_mime_attachment_with_unknown_type(self):
+        attachment = create_mime_attachment("notes", b"\x00\x01")
+
+        self.assertEqual(attachment.get_content_type(), "application/octet-stream")
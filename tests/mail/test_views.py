@@ -0,0 +1,390 @@
+import json
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.contrib.sites.models import Site
+from django.http import Http404
+from django.test import RequestFactory, TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from packman.mail.models import Mailbox, Message, MessageRecipient, Thread
+from packman.mail.views import (
+    MessageArchiveView,
+    MessageDetailView,
+    MessageDraftsView,
+    MessageInboxView,
+    MessageSearchView,
+    MessageSendingView,
+    MessageSentView,
+    MessageTrashView,
+    ThreadDetailView,
+    ThreadListView,
+    get_mailbox_counts,
+)
+
+User = get_user_model()
+
+
+class MailboxTestData:
+    @classmethod
+    def setUpTestData(cls):
+        now = timezone.now()
+        cls.user = User.objects.create_user(
+            email="test@example.com", first_name="Test", last_name="User", password="foo"  # nosec B106
+        )
+        cls.other = User.objects.create_user(email="other@example.com", first_name="Other", last_name="User")
+
+        def receive(subject, author=cls.other, **receipt):
+            message = Message.objects.create(
+                author=author, subject=subject, body="<p>Test</p>", status=Message.Status.SENT, date_sent=now
+            )
+            MessageRecipient.objects.create(message=message, recipient=cls.user, **receipt)
+            MessageRecipient.objects.create(message=message, recipient=cls.other, date_read=now)
+            return message
+
+        receive("Unread")
+        receive("Also unread")
+        receive("Read", date_read=now)
+        receive("To myself", author=cls.user, date_read=now)
+        receive("Archived", date_archived=now)
+        receive("Deleted", date_read=now, date_deleted=now)
+
+        Message.objects.create(author=cls.user, subject="Draft", body="<p>Test</p>")
+        Message.objects.create(
+            author=cls.user, subject="Queued", body="<p>Test</p>", status=Message.Status.QUEUED, date_sent=now
+        )
+        Message.objects.create(author=cls.other, subject="Not mine", body="<p>Test</p>")
+
+
+class MailboxCountsTestCase(MailboxTestData, TestCase):
+    def test_counts_match_folder_querysets(self):
+        counts = get_mailbox_counts(self.user, Mailbox.INBOX)
+        user = self.user
+
+        self.assertEqual(counts["inbox"]["total"], Message.objects.in_inbox(user).count())
+        self.assertEqual(counts["inbox"]["unread"], Message.objects.in_inbox(user).unread(user).count())
+        self.assertEqual(counts["drafts"]["total"], Message.objects.drafts(user).count())
+        self.assertEqual(counts["sent"]["total"], Message.objects.sent(user).count())
+        self.assertEqual(counts["outbox"]["total"], Message.objects.sending(user).count())
+        self.assertEqual(counts["archives"]["total"], Message.objects.archived(user).count())
+        self.assertEqual(counts["archives"]["unread"], Message.objects.archived(user).unread(user).count())
+        self.assertEqual(counts["trash"]["total"], Message.objects.deleted(user).count())
+        self.assertEqual(counts["trash"]["unread"], Message.objects.deleted(user).unread(user).count())
+        self.assertIs(counts["current"], counts["inbox"])
+
+    def test_counts(self):
+        counts = Message.objects.mailbox_counts(self.user)
+
+        self.assertEqual(
+            counts,
+            {
+                "inbox": 4,
+                "inbox_unread": 2,
+                "drafts": 1,
+                "sent": 2,
+                "outbox": 1,
+                "archives": 1,
+                "archives_unread": 1,
+                "trash": 1,
+                "trash_unread": 0,
+            },
+        )
+
+    def test_counts_use_a_single_query(self):
+        with self.assertNumQueries(1):
+            get_mailbox_counts(self.user)
+
+
+class MailboxViewQueryCountTestCase(MailboxTestData, TestCase):
+    # mailbox counts, message list and its receipts or distribution lists, the
+    # navbar's unread count, and the campaign and pages context processors
+    budget = 6
+    views = [
+        (MessageInboxView, "mail:inbox"),
+        (MessageArchiveView, "mail:archives"),
+        (MessageTrashView, "mail:trash"),
+        (MessageDraftsView, "mail:drafts"),
+        (MessageSendingView, "mail:outbox"),
+        (MessageSentView, "mail:sent"),
+    ]
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        # Warm the cache so the site lookup and the user's membership status
+        # don't count against the first view.
+        Site.objects.get_current()
+        self.user.membership_status
+
+    def test_views_stay_within_query_budget(self):
+        for view, url_name in self.views:
+            with self.subTest(view=view.__name__):
+                request = self.factory.get(reverse(url_name))
+                request.user = self.user
+                with self.assertNumQueries(self.budget):
+                    response = view.as_view()(request)
+                    response.render()
+                self.assertEqual(response.status_code, 200)
+
+
+class BulkUpdateTestCase(MailboxTestData, TestCase):
+    url = reverse("mail:bulk-update")
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def post(self, data):
+        return self.client.post(self.url, json.dumps(data), content_type="application/json")
+
+    def test_marks_selected_messages_in_one_update(self):
+        messages = list(Message.objects.in_inbox(self.user).unread(self.user).values_list("pk", flat=True))
+        # the receipts, then the unread counts of their threads
+        with self.assertNumQueries(3):
+            updated = MessageRecipient.objects.filter(recipient=self.user, message__in=messages).mark_read()
+            # already read, so nothing changes
+            self.assertEqual(MessageRecipient.objects.filter(recipient=self.user, message__in=messages).mark_read(), 0)
+        self.assertEqual(updated, 2)
+
+    def test_archive_selection(self):
+        messages = [str(pk) for pk in Message.objects.in_inbox(self.user).values_list("pk", flat=True)[:2]]
+        response = self.post({"action": "archive", "messages": messages})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["updated"], 2)
+        self.assertEqual(response.json()["mail_count"], Message.objects.mailbox_counts(self.user))
+        self.assertEqual(response.json()["mail_count"]["archives"], 3)
+        self.assertEqual(Message.objects.archived(self.user).filter(pk__in=messages).count(), 2)
+
+    def test_whole_mailbox(self):
+        response = self.post({"action": "delete", "mailbox": Mailbox.INBOX})
+
+        self.assertEqual(response.json()["updated"], 4)
+        self.assertEqual(response.json()["mail_count"]["inbox"], 0)
+        self.assertEqual(response.json()["mail_count"]["trash"], 5)
+
+        response = self.post({"action": "undelete", "mailbox": Mailbox.TRASH})
+        self.assertEqual(response.json()["updated"], 5)
+        self.assertEqual(response.json()["mail_count"]["inbox"], 5)
+
+    def test_only_changes_own_receipts(self):
+        message = Message.objects.get(subject="Unread")
+        self.post({"action": "delete", "messages": [str(message.pk)]})
+
+        self.assertIsNone(MessageRecipient.objects.get(message=message, recipient=self.other).date_deleted)
+
+    def test_rejects_invalid_requests(self):
+        self.assertEqual(self.post({"action": "explode", "mailbox": Mailbox.INBOX}).status_code, 400)
+        self.assertEqual(self.post({"action": "read"}).status_code, 400)
+        self.assertEqual(self.post({"action": "read", "messages": ["not-a-uuid"]}).status_code, 400)
+        self.assertEqual(self.client.get(self.url).status_code, 405)
+
+    def test_rejects_malformed_json(self):
+        response = self.client.post(self.url, "{not json", content_type="application/json")
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_rejects_json_that_is_not_an_object(self):
+        for data in ([], "x", 1, None):
+            with self.subTest(data=data):
+                self.assertEqual(self.post(data).status_code, 400)
+        self.assertEqual(self.post({"action": ["read"], "mailbox": Mailbox.INBOX}).status_code, 400)
+
+    def test_rejects_messages_that_are_not_a_list_of_ids(self):
+        for messages in (5, None, "abc", [5], [None]):
+            with self.subTest(messages=messages):
+                self.assertEqual(self.post({"action": "read", "messages": messages}).status_code, 400)
+
+
+class KeysetPaginationTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(email="test@example.com", password="foo")  # nosec B106
+        author = User.objects.create_user(email="author@example.com")
+        timestamp = timezone.now()
+        for i in range(7):
+            message = Message.objects.create(author=author, subject=f"Message {i}", body="<p>Test</p>")
+            MessageRecipient.objects.create(message=message, recipient=cls.user)
+            # pairs of messages share a timestamp, so ties must be broken by uuid
+            Message.objects.filter(pk=message.pk).update(last_updated=timestamp - timedelta(hours=i // 2))
+        cls.expected = list(Message.objects.in_inbox(cls.user).order_by("-last_updated", "-uuid"))
+
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    def get(self, **params):
+        request = self.factory.get(reverse("mail:inbox"), params)
+        request.user = self.user
+        return MessageInboxView.as_view(paginate_by=3)(request)
+
+    def test_pages_walk_the_whole_mailbox(self):
+        seen = []
+        response = self.get()
+        while True:
+            page = response.context_data["page_obj"]
+            seen.extend(page)
+            if not page.has_next():
+                break
+            response = self.get(after=page.next_cursor)
+
+        self.assertEqual(seen, self.expected)
+
+    def test_json_variant(self):
+        first = json.loads(self.get(format="json").content)
+        self.assertEqual([message["uuid"] for message in first["messages"]], [str(m.pk) for m in self.expected[:3]])
+        self.assertIn("Message", first["messages"][0]["html"])
+
+        second = json.loads(self.get(format="json", after=first["next"]).content)
+        self.assertEqual([message["uuid"] for message in second["messages"]], [str(m.pk) for m in self.expected[3:6]])
+
+        last = json.loads(self.get(format="json", after=second["next"]).content)
+        self.assertEqual(len(last["messages"]), 1)
+        self.assertIsNone(last["next"])
+
+    def test_invalid_cursor(self):
+        with self.assertRaises(Http404):
+            self.get(after="not a cursor")
+
+
+class MessageDetailViewTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(email="author@example.com", first_name="Author", last_name="User")
+        cls.user = User.objects.create_user(email="test@example.com", password="foo")  # nosec B106
+        cls.message = Message.objects.create(
+            author=cls.author, subject="Pack meeting", body="<p>Test</p>", status=Message.Status.SENT
+        )
+        MessageRecipient.objects.create(message=cls.message, recipient=cls.user)
+        for i in range(20):
+            recipient = User.objects.create_user(email=f"member{i}@example.com")
+            MessageRecipient.objects.create(message=cls.message, recipient=recipient)
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        Site.objects.get_current()
+
+    def get(self, user):
+        request = self.factory.get(self.message.get_absolute_url())
+        request.user = user
+        response = MessageDetailView.as_view()(request, pk=self.message.pk)
+        response.render()
+        return response
+
+    def test_marks_message_read(self):
+        self.get(self.user)
+
+        self.assertIsNotNone(MessageRecipient.objects.get(message=self.message, recipient=self.user).date_read)
+
+    def test_query_budget(self):
+        # message with author and thread, receipt and attachments, read marker and the thread's unread count,
+        # sidebar list with receipts, mailbox counts, recipient line, the author's profile link, navbar unread
+        # count, the campaign and pages context processors, and the user's membership status
+        with self.assertNumQueries(15):
+            self.get(self.user)
+        # already read, so there's nothing to update, and the membership status is cached
+        with self.assertNumQueries(12):
+            self.get(self.user)
+
+    def test_author_can_view(self):
+        self.assertEqual(self.get(self.author).status_code, 200)
+
+    def test_other_members_cannot_view(self):
+        outsider = User.objects.create_user(email="outsider@example.com")
+
+        with self.assertRaises(Http404):
+            self.get(outsider)
+
+
+class MessageSearchViewTestCase(MailboxTestData, TestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+
+    def search(self, query):
+        request = self.factory.get(reverse("mail:search"), {"q": query})
+        request.user = self.user
+        response = MessageSearchView.as_view()(request)
+        response.render()
+        return response
+
+    def test_results_are_scoped_to_own_receipts(self):
+        response = self.search("unread")
+
+        self.assertQuerySetEqual(
+            response.context_data["message_list"],
+            Message.objects.filter(subject__in=("Unread", "Also unread")),
+            ordered=False,
+        )
+        self.assertContains(response, "Results for")
+
+    def test_excludes_messages_not_received(self):
+        # the user's own draft and someone else's message both match, but neither was received
+        self.assertQuerySetEqual(self.search("draft").context_data["message_list"], [])
+        self.assertQuerySetEqual(self.search("mine").context_data["message_list"], [])
+
+    def test_empty_query(self):
+        response = self.search("")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertQuerySetEqual(response.context_data["message_list"], [])
+
+
+class ThreadViewTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(email="author@example.com", first_name="Author", last_name="User")
+        cls.user = User.objects.create_user(email="test@example.com", password="foo")  # nosec B106
+        cls.message = cls.reply(None)
+
+    @classmethod
+    def reply(cls, parent):
+        message = Message.objects.create(author=cls.author, subject="Pack meeting", body="<p>Test</p>", parent=parent)
+        MessageRecipient.objects.create(message=message, recipient=cls.user)
+        message.send()
+        return message
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        Site.objects.get_current()
+
+    def get(self, user, view=ThreadDetailView, **kwargs):
+        request = self.factory.get("/")
+        request.user = user
+        response = view.as_view()(request, **kwargs)
+        response.render()
+        return response
+
+    def get_thread(self, user):
+        return self.get(user, pk=self.message.thread_id)
+
+    def test_marks_the_whole_thread_read(self):
+        self.reply(self.message)
+        response = self.get_thread(self.user)
+
+        self.assertEqual(len(response.context_data["message_list"]), 2)
+        self.assertFalse(MessageRecipient.objects.filter(recipient=self.user, date_read__isnull=True).exists())
+        self.assertEqual(Thread.objects.for_user(self.user).get().unread_count, 0)
+
+    def test_query_count_does_not_grow_with_the_thread(self):
+        self.get_thread(self.user)
+        with self.assertNumQueries(10) as short:
+            self.get_thread(self.user)
+
+        parent = self.message
+        for _ in range(5):
+            parent = self.reply(parent)
+        self.get_thread(self.user)
+        with self.assertNumQueries(len(short)):
+            response = self.get_thread(self.user)
+        self.assertEqual(len(response.context_data["message_list"]), 6)
+
+    def test_other_members_cannot_view(self):
+        outsider = User.objects.create_user(email="outsider@example.com")
+
+        with self.assertRaises(Http404):
+            self.get_thread(outsider)
+
+    def test_thread_list(self):
+        self.reply(self.message)
+        response = self.get(self.user, view=ThreadListView)
+
+        self.assertQuerySetEqual(response.context_data["thread_list"], [self.message.thread])
+        self.assertContains(response, "2 messages")
@@ -1,7 +1,14 @@
+from io import StringIO
+
 from django.contrib.auth import get_user_model
+from django.core.management import call_command
 from django.test import TestCase
 
-from packman.membership.models import Adult
+from packman.calendars.models import PackYear
+from packman.dens.factories import DenFactory
+from packman.dens.models import Membership, Rank
+from packman.membership.managers import normalize_name
+from packman.membership.models import Adult, Enrollment, Family, Member, MemberSearchIndex, Scout
 
 User = get_user_model()
 
@@ -40,3 +47,135 @@ class AdultManagersTests(TestCase):
         self.assertEqual(Adult.objects.get_by_natural_key(username="member@EXAMPLE.COM"), member)
         self.assertEqual(Adult.objects.get_by_natural_key(username="MEMBER@EXAMPLE.COM"), member)
         self.assertEqual(Adult.objects.get_by_natural_key(username="Member@Example.com"), member)
+
+
+class DirectorySearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.family = Family.objects.create(name="Ramírez")
+        cls.scout = Scout.objects.create(
+            first_name="Zoë", last_name="Ramírez", nickname="Zo", family=cls.family, status=Scout.ACTIVE
+        )
+        cls.parent = Adult.objects.create_user(
+            email="ana@example.com", first_name="Ana", last_name="Ramírez", family=cls.family
+        )
+        cls.friend = Adult.objects.create_user(
+            email="obrien@example.com", first_name="Sean", last_name="O'Brien", role=Adult.CONTRIBUTOR
+        )
+        cls.alumni_family = Family.objects.create(name="Smith")
+        cls.alum = Scout.objects.create(
+            first_name="Sam", last_name="Smith", family=cls.alumni_family, status=Scout.GRADUATED
+        )
+        cls.alumni_parent = Adult.objects.create_user(
+            email="ramona@example.com", first_name="Ramona", last_name="Smith", family=cls.alumni_family
+        )
+
+    def test_normalize_name(self):
+        self.assertEqual(normalize_name("Zoë O'Brien-Smith"), "zoe obrien smith")
+        self.assertEqual(normalize_name("  ÉMILE   d’Arc "), "emile darc")
+
+    def test_search_matches_word_prefixes(self):
+        self.assertQuerySetEqual(Member.objects.search("zo"), [self.scout.member_ptr])
+        self.assertQuerySetEqual(Member.objects.search("ramirez zoe"), [self.scout.member_ptr])
+        self.assertQuerySetEqual(Member.objects.search("obri"), [self.friend.member_ptr])
+        self.assertQuerySetEqual(Member.objects.search("o'brien"), [self.friend.member_ptr])
+        self.assertQuerySetEqual(Member.objects.search("amirez"), [])
+        self.assertQuerySetEqual(Member.objects.search("' -"), [])
+
+    def test_search_index_follows_edits(self):
+        self.parent.nickname = "Annie"
+        self.parent.save()
+
+        self.assertQuerySetEqual(Member.objects.search("annie"), [self.parent.member_ptr])
+        self.parent.last_name = "Vega"
+        self.parent.save(update_fields=["last_name"])
+        self.assertQuerySetEqual(Member.objects.search("annie vega"), [self.parent.member_ptr])
+
+    def test_search_index_follows_deletes(self):
+        pks = [self.scout.pk, self.friend.pk]
+        self.scout.delete()
+        Adult.objects.filter(pk=self.friend.pk).delete()
+
+        self.assertFalse(MemberSearchIndex.objects.filter(member_id__in=pks).exists())
+        self.assertTrue(MemberSearchIndex.objects.filter(member_id=self.parent.pk).exists())
+
+    def test_listed(self):
+        self.assertCountEqual(
+            Member.objects.listed(), [self.scout.member_ptr, self.parent.member_ptr, self.friend.member_ptr]
+        )
+        self.assertCountEqual(
+            Member.objects.listed(include_alumni=True),
+            [self.scout.member_ptr, self.parent.member_ptr, self.alum.member_ptr, self.alumni_parent.member_ptr],
+        )
+
+    def test_visible_to(self):
+        loner = Adult.objects.create_user(email="loner@example.com", first_name="Ramsey", last_name="Lone")
+
+        self.assertCountEqual(
+            Member.objects.visible_to(self.parent).search("ram"), [self.scout.member_ptr, self.parent.member_ptr]
+        )
+        self.assertCountEqual(
+            Member.objects.visible_to(self.alumni_parent, include_alumni=True).search("ram"),
+            [self.alumni_parent.member_ptr],
+        )
+        self.assertCountEqual(Member.objects.visible_to(loner).search("ram"), [loner.member_ptr])
+        self.assertCountEqual(
+            Member.objects.visible_to(self.friend, include_alumni=True).search("ram"),
+            [self.scout.member_ptr, self.parent.member_ptr, self.alumni_parent.member_ptr],
+        )
+
+
+class EnrollmentTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.year = PackYear.objects.current()
+        cls.den = DenFactory(number=3, rank=Rank.objects.get_or_create(rank=Rank.RankChoices.WOLF)[0])
+        cls.family = Family.objects.create(name="Family")
+        cls.scout = Scout.objects.create(first_name="Cub", last_name="Scout", family=cls.family, status=Scout.ACTIVE)
+        cls.parent = User.objects.create_user(
+            email="parent@example.com", first_name="Parent", last_name="Scout", family=cls.family
+        )
+        Membership.objects.create(scout=cls.scout, den=cls.den, year_assigned=cls.year)
+
+    def test_maintained_on_save(self):
+        self.assertEqual(Enrollment.objects.current().active().count(), 2)
+        self.assertQuerySetEqual(Scout.objects.wolves(), [self.scout])
+        self.assertQuerySetEqual(Adult.objects.active(), [self.parent])
+        self.assertQuerySetEqual(Family.objects.in_den([self.den]), [self.family])
+
+        self.scout.status = Scout.INACTIVE
+        self.scout.save()
+        self.assertFalse(Enrollment.objects.current().active().exists())
+        self.assertFalse(Adult.objects.active().exists())
+        self.assertFalse(Family.objects.in_den([self.den]).exists())
+
+    def test_follows_family_changes(self):
+        family = Family.objects.create(name="Other")
+        self.parent.family = family
+        self.parent.save()
+        self.assertFalse(Adult.objects.active().exists())
+
+        self.scout.family = family
+        self.scout.save()
+        self.assertQuerySetEqual(Family.objects.active(), [family])
+        self.assertQuerySetEqual(Adult.objects.active(), [self.parent])
+
+    def test_follows_den_rank(self):
+        self.den.rank = Rank.objects.get_or_create(rank=Rank.RankChoices.BEAR)[0]
+        self.den.save()
+        self.assertFalse(Scout.objects.wolves().exists())
+        self.assertQuerySetEqual(Scout.objects.bears(), [self.scout])
+
+    def test_removed_with_den_assignment(self):
+        Membership.objects.filter(scout=self.scout).get().delete()
+        self.assertFalse(Enrollment.objects.exists())
+        self.assertFalse(Scout.objects.active().exists())
+
+    def test_rebuild(self):
+        Enrollment.objects.all().delete()
+        self.assertEqual(Enrollment.objects.rebuild(), 2)
+        self.assertQuerySetEqual(Adult.objects.active(), [self.parent])
+
+        out = StringIO()
+        call_command("rebuildenrollments", stdout=out)
+        self.assertIn("Rebuilt 2 enrollments", out.getvalue())
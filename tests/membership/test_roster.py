@@ -0,0 +1,142 @@
+import csv
+import io
+import tempfile
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.test import TestCase
+from django.urls import reverse
+
+from packman.address_book.models import PhoneNumber
+from packman.membership.models import Family, Member, Scout
+from packman.membership.roster import RosterImport, read_roster
+from packman.membership.signals import members_changed
+
+User = get_user_model()
+
+HEADER = ["Member", "Family", "First Name", "Last Name", "Gender", "Email", "Status", "Started School", "Street"]
+HEADER += ["City", "State", "ZIP Code", "Phone", "Phone Type"]
+ROWS = [
+    ["Adult", "1", "Sam", "Smith", "Male", "sam@example.com", "", "", "1 Main St", "Seattle", "WA", "98101"],
+    ["Adult", "1", "Alex", "Jones", "F", "alex@example.com", "", "", "", "", "", "", "206-555-0100", "Mobile"],
+    ["Cub", "1", "Sam", "Smith", "M", "", "Active", "2018"],
+    ["Adult", "2", "Pat", "Lee", "O", "pat@example.com"],
+]
+
+
+def make_roster(rows, name="roster.csv"):
+    output = io.StringIO()
+    csv.writer(output).writerows([HEADER, *rows])
+    return SimpleUploadedFile(name, output.getvalue().encode())
+
+
+class RosterImportTestCase(TestCase):
+    def test_import(self):
+        User.objects.create_user(email="sam.smith@example.com", first_name="Sam", last_name="Smith")
+        receiver = mock.Mock()
+        members_changed.connect(receiver)
+        self.addCleanup(members_changed.disconnect, receiver)
+
+        # every table is inserted in bulk, however many rows the roster has
+        with self.assertNumQueries(12):
+            roster = RosterImport(read_roster(make_roster(ROWS))).run()
+
+        self.assertEqual(roster.errors, [])
+        self.assertEqual(roster.counts, {"families": 2, "adults": 3, "scouts": 1, "addresses": 1, "phone_numbers": 1})
+        sam = User.objects.get(email="sam@example.com")
+        self.assertEqual(sam.slug, "sam-smith-1")
+        self.assertFalse(sam.has_usable_password())
+        self.assertEqual(sam.family.name, "Jones-Smith Family")
+        self.assertEqual(sam.addresses.get().city, "Seattle")
+        self.assertEqual(User.objects.get(email="alex@example.com").phone_numbers.get().type, PhoneNumber.MOBILE)
+
+        cub = Scout.objects.get(family=sam.family)
+        self.assertEqual((cub.slug, cub.status, cub.started_school), ("sam-smith-2", Scout.ACTIVE, 2018))
+        self.assertQuerySetEqual(Member.objects.search("pat"), [User.objects.get(email="pat@example.com").member_ptr])
+        # statuses and distribution lists are told to catch up with the new members
+        receiver.assert_called_once_with(signal=members_changed, sender=Family)
+
+    def test_dry_run(self):
+        roster = RosterImport(read_roster(make_roster(ROWS))).run(dry_run=True)
+
+        self.assertTrue(roster)
+        self.assertEqual(roster.counts["adults"], 3)
+        self.assertFalse(Family.objects.exists())
+        self.assertFalse(Member.objects.exists())
+
+    def test_errors(self):
+        User.objects.create_user(email="Pat@Example.com")
+        rows = [
+            *ROWS,
+            ["Cub", "1", "Max", "Smith", "Unknown", "", "", "2019"],
+            ["Cub", "1", "Kim", "Smith", "F", "", "", "2019", "1 Main St"],
+            ["Pet", "1", "Rex", "Smith"],
+            ["Adult", "3", "Sam", "Smith", "M", "sam@example.com"],
+        ]
+        roster = RosterImport(read_roster(make_roster(rows))).run()
+
+        self.assertFalse(roster)
+        self.assertEqual(
+            [line for line, error in roster.errors],
+            [5, 6, 7, 8, 9],
+        )
+        self.assertIn("email:", roster.errors[0][1])
+        self.assertIn("gender:", roster.errors[1][1])
+        self.assertFalse(User.objects.exclude(email__iexact="pat@example.com").exists())
+
+    def test_command(self):
+        with tempfile.NamedTemporaryFile(suffix=".csv") as file:
+            file.write(make_roster(ROWS).read())
+            file.flush()
+
+            out = io.StringIO()
+            call_command("importroster", file.name, "--dry-run", stdout=out)
+            self.assertIn("Would add 2 families, 3 adults, 1 cubs", out.getvalue())
+            self.assertFalse(Family.objects.exists())
+
+            call_command("importroster", file.name, stdout=out)
+            self.assertEqual(Family.objects.count(), 2)
+
+            # everyone on the roster is now already a member
+            with self.assertRaises(CommandError):
+                call_command("importroster", file.name, stdout=out, stderr=io.StringIO())
+
+
+class RosterImportAdminTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser(email="admin@example.com", password="test")  # nosec B106
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+        self.url = reverse("admin:membership_family_import")
+
+    def test_dry_run(self):
+        response = self.client.post(self.url, {"roster": make_roster(ROWS), "dry_run": "on"})
+
+        self.assertContains(response, "would add 2 families")
+        self.assertFalse(Family.objects.exists())
+
+    def test_import(self):
+        response = self.client.post(self.url, {"roster": make_roster(ROWS)})
+
+        self.assertRedirects(response, reverse("admin:membership_family_changelist"))
+        self.assertEqual(Family.objects.count(), 2)
+
+    def test_errors(self):
+        response = self.client.post(self.url, {"roster": make_roster([["Pet", "1", "Rex", "Smith"]])})
+
+        self.assertContains(response, "nothing was imported")
+        self.assertEqual(response.context["roster"].errors[0][0], 2)
+
+    def test_changelist_links_to_import(self):
+        response = self.client.get(reverse("admin:membership_family_changelist"))
+
+        self.assertContains(response, self.url)
+
+    def test_requires_add_permission(self):
+        self.client.force_login(User.objects.create_user(email="staff@example.com", _is_staff=True))
+
+        self.assertEqual(self.client.get(self.url).status_code, 403)
@@ -0,0 +1,64 @@
+from unittest import mock
+
+from django.db import IntegrityError
+from django.test import TestCase
+
+from packman.membership.models import Member
+from packman.membership.slugs import SlugAllocator, get_slug_candidates
+
+
+class SlugAllocatorTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        for _ in range(20):
+            Member.objects.create(first_name="Sam", last_name="Smith")
+
+    def test_allocate_in_one_query(self):
+        member = Member(first_name="Sam", middle_name="Jo", last_name="Smith")
+        allocator = SlugAllocator(Member.objects.all())
+
+        for slug in ("sam-j-smith", "sam-jo-smith", "sam-smith-20"):
+            with self.assertNumQueries(1):
+                self.assertEqual(allocator.allocate(get_slug_candidates(member)), slug)
+
+    def test_preloaded(self):
+        member = Member(first_name="Sam", last_name="Smith")
+        with self.assertNumQueries(1):
+            allocator = SlugAllocator(Member.objects.all(), preload=True)
+        with self.assertNumQueries(0):
+            slugs = [allocator.allocate(get_slug_candidates(member)) for _ in range(3)]
+
+        self.assertEqual(slugs, ["sam-smith-20", "sam-smith-21", "sam-smith-22"])
+
+    def test_all_taken(self):
+        allocator = SlugAllocator(Member.objects.all())
+
+        self.assertIsNone(allocator.allocate(["Sam Smith", "Sam Smith 1"]))
+        self.assertIsNone(allocator.allocate(["", "!"]))
+
+    def test_save(self):
+        # one query to choose the slug, then the insert in a savepoint and the search index
+        with self.assertNumQueries(6):
+            member = Member.objects.create(first_name="Sam", last_name="Smith")
+
+        self.assertEqual(member.slug, "sam-smith-20")
+
+    def test_save_retries_a_slug_taken_concurrently(self):
+        get_taken = SlugAllocator.get_taken
+        lookups = []
+
+        def get_taken_late(allocator, slugs):
+            # the first lookup misses the members saved since, as a concurrent signup's would
+            lookups.append(slugs)
+            return allocator.allocated if len(lookups) == 1 else get_taken(allocator, slugs)
+
+        with mock.patch.object(SlugAllocator, "get_taken", autospec=True, side_effect=get_taken_late):
+            member = Member.objects.create(first_name="Sam", last_name="Smith")
+
+        self.assertEqual(len(lookups), 2)
+        self.assertEqual(member.slug, "sam-smith-20")
+
+    def test_save_gives_up(self):
+        with mock.patch.object(SlugAllocator, "get_taken", return_value=set()):
+            with self.assertRaises(IntegrityError):
+                Member.objects.create(first_name="Sam", last_name="Smith")
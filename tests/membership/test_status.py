@@ -0,0 +1,126 @@
+import tempfile
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Permission
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from packman.calendars.models import PackYear
+from packman.committees.models import Committee, CommitteeMember
+from packman.dens.factories import DenFactory
+from packman.dens.models import Membership
+from packman.membership.models import Adult, Family, Scout
+
+User = get_user_model()
+
+# A cache shared between processes, which membership statuses are only cached in
+SHARED_CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": tempfile.mkdtemp(),
+    }
+}
+
+
+@override_settings(CACHES=SHARED_CACHES)
+class MembershipStatusTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.year = PackYear.objects.current()
+        cls.family = Family.objects.create(name="Family")
+        cls.scout = Scout.objects.create(first_name="Cub", last_name="Scout", family=cls.family, status=Scout.ACTIVE)
+        cls.den = DenFactory(number=3)
+        Membership.objects.create(scout=cls.scout, den=cls.den, year_assigned=cls.year)
+        cls.parent = User.objects.create_user(
+            email="parent@example.com", first_name="Parent", last_name="Scout", family=cls.family
+        )
+        cls.committee = Committee.objects.create(name="Committee", slug="committee", are_staff=True)
+
+    def setUp(self):
+        # cached statuses would otherwise outlive the test that created them
+        cache.clear()
+        PackYear.objects.current()
+
+    def get_parent(self):
+        return User.objects.get(pk=self.parent.pk)
+
+    def test_status(self):
+        CommitteeMember.objects.create(member=self.parent, committee=self.committee, year=self.year)
+        status = self.get_parent().membership_status
+
+        self.assertTrue(status.active)
+        self.assertFalse(status.contributor)
+        self.assertTrue(status.staff)
+        self.assertFalse(status.superuser)
+        self.assertEqual(status.dens, {self.den.pk})
+        self.assertEqual(status.committees, {self.committee.pk})
+
+    def test_status_without_a_family(self):
+        friend = User.objects.create_user(email="friend@example.com", role=Adult.CONTRIBUTOR)
+        status = friend.membership_status
+
+        self.assertFalse(status.active)
+        self.assertTrue(status.contributor)
+        self.assertFalse(status.staff)
+        self.assertEqual(status.dens, frozenset())
+
+    def test_committee_permissions(self):
+        self.committee.permissions.add(Permission.objects.get(codename="change_family"))
+        CommitteeMember.objects.create(member=self.parent, committee=self.committee, year=self.year)
+        parent = self.get_parent()
+
+        self.assertTrue(parent.has_perm("membership.change_family"))
+        self.assertFalse(parent.has_perm("membership.delete_family"))
+
+        self.committee.are_superusers = True
+        self.committee.save(update_fields=["are_superusers"])
+        self.assertTrue(self.get_parent().has_perm("membership.delete_family"))
+
+    def test_resolved_in_one_query_then_cached(self):
+        parent = self.get_parent()
+        with self.assertNumQueries(1):
+            self.assertTrue(parent.active())
+            self.assertFalse(parent.is_staff())
+
+        # a fresh instance, as for the next request, reads the cache
+        parent = self.get_parent()
+        with self.assertNumQueries(0):
+            self.assertTrue(parent.active())
+            self.assertFalse(parent.is_staff())
+
+    def test_changes_invalidate_the_cache(self):
+        self.get_parent().membership_status
+
+        self.scout.status = Scout.INACTIVE
+        self.scout.save()
+        self.assertFalse(self.get_parent().active())
+
+        self.scout.status = Scout.ACTIVE
+        self.scout.save()
+        CommitteeMember.objects.create(member=self.parent, committee=self.committee, year=self.year)
+        self.assertTrue(self.get_parent().is_staff())
+
+        self.committee.are_staff = False
+        self.committee.save()
+        self.assertFalse(self.get_parent().is_staff())
+
+    def test_logging_in_keeps_the_cache(self):
+        parent = self.get_parent()
+        parent.membership_status
+        parent.save(update_fields=["last_login"])
+
+        parent = self.get_parent()
+        with self.assertNumQueries(0):
+            parent.active()
+
+    @override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+    def test_resolved_once_per_instance_in_a_process_local_cache(self):
+        parent = self.get_parent()
+        with self.assertNumQueries(1):
+            self.assertTrue(parent.active())
+            self.assertFalse(parent.is_staff())
+
+        # the next request resolves it again, as another process couldn't invalidate it
+        parent = self.get_parent()
+        with self.assertNumQueries(1):
+            self.assertTrue(parent.active())
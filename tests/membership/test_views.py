@@ -1,5 +1,8 @@
 from django.contrib.auth import get_user_model
 from django.test import TestCase
+from django.urls import reverse
+
+from packman.membership.models import Adult, Family, Scout
 
 User = get_user_model()
 
@@ -9,7 +12,53 @@ class MemberListTestCase(TestCase):
 
 
 class MemberSearchResultsTestCase(TestCase):
-    pass
+    @classmethod
+    def setUpTestData(cls):
+        family = Family.objects.create(name="Ramírez")
+        cls.scout = Scout.objects.create(first_name="Zoë", last_name="Ramírez", family=family, status=Scout.ACTIVE)
+        cls.parent = Adult.objects.create_user(
+            email="ana@example.com", first_name="Ana", last_name="Ramírez", family=family
+        )
+        cls.other = Scout.objects.create(
+            first_name="Ramon", last_name="Vega", family=Family.objects.create(name="Vega"), status=Scout.ACTIVE
+        )
+
+    def setUp(self):
+        self.client.force_login(self.parent)
+
+    def test_search_results(self):
+        response = self.client.get(reverse("membership:search_results"), {"q": "rami"})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertQuerySetEqual(
+            response.context["members"], [self.scout.member_ptr, self.parent.member_ptr], ordered=False
+        )
+
+    def test_typeahead(self):
+        response = self.client.get(reverse("membership:typeahead"), {"q": "ram"})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertCountEqual(
+            response.json()["results"],
+            [
+                {"name": "Zoë Ramírez", "url": self.scout.get_absolute_url()},
+                {"name": "Ana Ramírez", "url": self.parent.get_absolute_url()},
+                {"name": "Ramon Vega", "url": self.other.get_absolute_url()},
+            ],
+        )
+
+    def test_typeahead_is_a_single_query(self):
+        url = reverse("membership:typeahead")
+        self.client.get(url, {"q": "ram"})
+
+        # the session and user, then the suggestions
+        with self.assertNumQueries(3):
+            self.client.get(url, {"q": "ram vega"})
+
+    def test_typeahead_without_a_query(self):
+        response = self.client.get(reverse("membership:typeahead"), {"q": " "})
+
+        self.assertEqual(response.json(), {"results": []})
 
 
 class AdultListTestCase(TestCase):